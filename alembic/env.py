@@ -0,0 +1,56 @@
+"""
+Ambiente do Alembic: usa o mesmo DATABASE_URL e os mesmos modelos de main.py.
+Com vários hospitais, manage.py informa o banco em ``config.attributes["tenant"]``.
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+
+from main import Base, DATABASE_URL, engine
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+tenant = config.attributes.get("tenant")
+database_url = tenant.database_url if tenant is not None else DATABASE_URL
+
+# SQLite não suporta ALTER TABLE completo; o modo batch recria a tabela quando necessário
+render_as_batch = database_url.startswith("sqlite")
+
+
+def run_migrations_offline():
+    """Gera o SQL das migrações sem conectar ao banco"""
+    context.configure(
+        url=database_url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=render_as_batch,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """Aplica as migrações usando o engine da aplicação (ou o do hospital informado)"""
+    with (tenant.engine if tenant is not None else engine).connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=render_as_batch,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,103 @@
+"""Esquema inicial (equivalente ao antigo create_all + colunas city/ward)
+
+Bancos criados pelas versões anteriores (create_all no startup ou
+database_setup.sql) já possuem as tabelas: a revisão só cria o que falta.
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2025-10-01
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_initial_schema"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing_tables = set(inspector.get_table_names())
+
+    if "surveys" not in existing_tables:
+        op.create_table(
+            "surveys",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("patient_name", sa.String(255), nullable=True),
+            sa.Column("is_anonymous", sa.Boolean),
+            sa.Column("admission_date", sa.String(50)),
+            sa.Column("discharge_date", sa.String(50)),
+            sa.Column("observations", sa.Text, nullable=True),
+            sa.Column("created_at", sa.DateTime),
+            sa.Column("completed", sa.Boolean),
+            sa.Column("satisfaction_score", sa.Float, nullable=True),
+            sa.Column("city", sa.String(255), nullable=True),
+            sa.Column("ward", sa.String(100), nullable=True),
+        )
+        op.create_index("ix_surveys_id", "surveys", ["id"])
+    else:
+        # Migração leve que antes rodava no startup de cada worker
+        columns = {col["name"] for col in inspector.get_columns("surveys")}
+        if "city" not in columns:
+            op.add_column("surveys", sa.Column("city", sa.String(255), nullable=True))
+        if "ward" not in columns:
+            op.add_column("surveys", sa.Column("ward", sa.String(100), nullable=True))
+
+    if "questions" not in existing_tables:
+        op.create_table(
+            "questions",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("question_id", sa.String(10)),
+            sa.Column("section_title", sa.String(255)),
+            sa.Column("question_text", sa.Text),
+            sa.Column("question_type", sa.String(50)),
+            sa.Column("section_order", sa.Integer),
+            sa.Column("question_order", sa.Integer),
+        )
+        op.create_index("ix_questions_id", "questions", ["id"])
+        op.create_index("ix_questions_question_id", "questions", ["question_id"], unique=True)
+
+    if "question_options" not in existing_tables:
+        op.create_table(
+            "question_options",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("question_id", sa.Integer, sa.ForeignKey("questions.id")),
+            sa.Column("option_text", sa.String(255)),
+            sa.Column("option_value", sa.Integer),
+            sa.Column("option_order", sa.Integer),
+        )
+        op.create_index("ix_question_options_id", "question_options", ["id"])
+
+    if "survey_responses" not in existing_tables:
+        op.create_table(
+            "survey_responses",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("survey_id", sa.Integer, sa.ForeignKey("surveys.id")),
+            sa.Column("question_id", sa.Integer, sa.ForeignKey("questions.id")),
+            sa.Column("response_value", sa.String(255)),
+            sa.Column("response_score", sa.Integer, nullable=True),
+        )
+        op.create_index("ix_survey_responses_id", "survey_responses", ["id"])
+
+    if "users" not in existing_tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("username", sa.String(50), nullable=False),
+            sa.Column("password_hash", sa.String(255), nullable=False),
+            sa.Column("is_active", sa.Boolean),
+            sa.Column("created_at", sa.DateTime),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+
+def downgrade():
+    op.drop_table("users")
+    op.drop_table("survey_responses")
+    op.drop_table("question_options")
+    op.drop_table("questions")
+    op.drop_table("surveys")
@@ -0,0 +1,70 @@
+"""Índices para os caminhos analíticos (dashboard, exportações, detalhes)
+
+Cria os índices que o database_setup.sql define apenas para MySQL, mais
+índices de cobertura para as consultas do dashboard e das exportações, e a
+restrição única (survey_id, question_id). Índices equivalentes já existentes
+(mesmas colunas, na mesma ordem) são reaproveitados.
+
+Revision ID: 0002_analytic_indexes
+Revises: 0001_initial_schema
+Create Date: 2025-10-02
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_analytic_indexes"
+down_revision = "0001_initial_schema"
+branch_labels = None
+depends_on = None
+
+
+# (tabela, nome, colunas, único)
+INDEXES = [
+    # Filtros por período; cobre também agrupamentos por ala com média de score
+    ("surveys", "ix_surveys_created_ward_score", ["created_at", "ward", "satisfaction_score"], False),
+    # Dashboard: contagem de concluídas e listagem das recentes
+    ("surveys", "ix_surveys_completed_created_at", ["completed", "created_at"], False),
+    # Dashboard: média de satisfação sem acessar a tabela
+    ("surveys", "ix_surveys_satisfaction_score", ["satisfaction_score"], False),
+    ("surveys", "ix_surveys_ward", ["ward"], False),
+    ("surveys", "ix_surveys_city", ["city"], False),
+    ("survey_responses", "ix_survey_responses_survey_id", ["survey_id"], False),
+    # Média por seção: filtra por pergunta e lê apenas o score
+    ("survey_responses", "ix_survey_responses_question_score", ["question_id", "response_score"], False),
+    ("survey_responses", "uq_survey_responses_survey_question", ["survey_id", "question_id"], True),
+    # Cálculo do score na submissão: (pergunta, texto da opção)
+    ("question_options", "ix_question_options_question_text", ["question_id", "option_text"], False),
+    ("questions", "ix_questions_section_order", ["section_order", "question_order"], False),
+]
+
+
+def _existing_index_columns(inspector, table):
+    found = {tuple(ix["column_names"]) for ix in inspector.get_indexes(table)}
+    found |= {tuple(uq["column_names"]) for uq in inspector.get_unique_constraints(table)}
+    return found
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # Remove respostas duplicadas antes da restrição única (mantém a primeira)
+    bind.execute(sa.text(
+        "DELETE FROM survey_responses WHERE id NOT IN ("
+        " SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM survey_responses"
+        " GROUP BY survey_id, question_id) AS keepers)"
+    ))
+
+    inspector = sa.inspect(bind)
+    for table, name, columns, unique in INDEXES:
+        if tuple(columns) in _existing_index_columns(inspector, table):
+            continue
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table, name, _columns, _unique in reversed(INDEXES):
+        if name in {ix["name"] for ix in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,26 @@
+"""Chave de idempotência gerada pelo tablet (client_key) em surveys
+
+Revision ID: 0003_survey_client_key
+Revises: 0002_analytic_indexes
+Create Date: 2025-10-06
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_survey_client_key"
+down_revision = "0002_analytic_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("surveys", sa.Column("client_key", sa.String(36), nullable=True))
+    op.create_index("uq_surveys_client_key", "surveys", ["client_key"], unique=True)
+
+
+def downgrade():
+    op.drop_index("uq_surveys_client_key", table_name="surveys")
+    with op.batch_alter_table("surveys") as batch_op:
+        batch_op.drop_column("client_key")
@@ -0,0 +1,68 @@
+"""Respostas armazenadas pelo id da opção (option_id) em vez do texto repetido
+
+Adiciona survey_responses.option_id (FK para question_options) e converte as
+linhas existentes em lotes por faixa de id: o option_id é preenchido pela
+opção com o mesmo texto e response_value passa a NULL. Respostas que não
+correspondem a nenhuma opção mantêm o texto.
+
+Revision ID: 0004_response_option_id
+Revises: 0003_survey_client_key
+Create Date: 2025-10-09
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_response_option_id"
+down_revision = "0003_survey_client_key"
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 5000
+
+
+def _id_batches(bind):
+    low, high = bind.execute(sa.text("SELECT MIN(id), MAX(id) FROM survey_responses")).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield {"low": start, "high": start + BATCH_SIZE - 1}
+
+
+def upgrade():
+    with op.batch_alter_table("survey_responses") as batch_op:
+        batch_op.add_column(sa.Column("option_id", sa.Integer(), nullable=True))
+        batch_op.alter_column("response_value", existing_type=sa.String(255), nullable=True)
+        batch_op.create_foreign_key(
+            "fk_survey_responses_option_id", "question_options", ["option_id"], ["id"]
+        )
+
+    bind = op.get_bind()
+    for bounds in _id_batches(bind):
+        bind.execute(sa.text(
+            "UPDATE survey_responses SET option_id = ("
+            " SELECT MIN(qo.id) FROM question_options qo"
+            " WHERE qo.question_id = survey_responses.question_id"
+            " AND qo.option_text = survey_responses.response_value)"
+            " WHERE id BETWEEN :low AND :high AND option_id IS NULL"
+        ), bounds)
+        bind.execute(sa.text(
+            "UPDATE survey_responses SET response_value = NULL"
+            " WHERE id BETWEEN :low AND :high AND option_id IS NOT NULL"
+        ), bounds)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for bounds in _id_batches(bind):
+        bind.execute(sa.text(
+            "UPDATE survey_responses SET response_value = ("
+            " SELECT qo.option_text FROM question_options qo WHERE qo.id = survey_responses.option_id)"
+            " WHERE id BETWEEN :low AND :high AND option_id IS NOT NULL"
+        ), bounds)
+
+    with op.batch_alter_table("survey_responses") as batch_op:
+        batch_op.drop_constraint("fk_survey_responses_option_id", type_="foreignkey")
+        batch_op.drop_column("option_id")
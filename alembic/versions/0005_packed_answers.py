@@ -0,0 +1,76 @@
+"""Modo de respostas compactas (uma linha por pesquisa) e visões em formato longo
+
+Adiciona surveys.answers_packed (um caractere por pergunta) e
+surveys.questionnaire_version, a tabela questionnaire_layouts que decodifica
+cada versão do questionário e as visões:
+
+- survey_answers_packed: respostas compactas decodificadas, uma linha por resposta
+- survey_answers_long: survey_responses + survey_answers_packed com o texto da opção
+
+Revision ID: 0005_packed_answers
+Revises: 0004_response_option_id
+Create Date: 2025-10-10
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005_packed_answers"
+down_revision = "0004_response_option_id"
+branch_labels = None
+depends_on = None
+
+
+PACKED_VIEW = """
+CREATE VIEW survey_answers_packed AS
+SELECT s.id AS survey_id, l.question_id AS question_id, l.option_id AS option_id,
+       l.option_value AS response_score
+FROM surveys s
+JOIN questionnaire_layouts l
+  ON l.version = s.questionnaire_version
+ AND l.answer_code = SUBSTR(s.answers_packed, l.position, 1)
+WHERE s.answers_packed IS NOT NULL
+"""
+
+LONG_VIEW = """
+CREATE VIEW survey_answers_long AS
+SELECT sr.survey_id AS survey_id, sr.question_id AS question_id, sr.option_id AS option_id,
+       COALESCE(qo.option_text, sr.response_value) AS answer_text, sr.response_score AS response_score
+FROM survey_responses sr
+LEFT JOIN question_options qo ON qo.id = sr.option_id
+UNION ALL
+SELECT p.survey_id, p.question_id, p.option_id, qo.option_text, p.response_score
+FROM survey_answers_packed p
+JOIN question_options qo ON qo.id = p.option_id
+"""
+
+
+def upgrade():
+    op.create_table(
+        "questionnaire_layouts",
+        sa.Column("version", sa.String(12), primary_key=True),
+        sa.Column("position", sa.Integer(), primary_key=True),
+        sa.Column("answer_code", sa.String(1), primary_key=True),
+        sa.Column("question_id", sa.Integer(), sa.ForeignKey("questions.id"), nullable=False),
+        sa.Column("option_id", sa.Integer(), sa.ForeignKey("question_options.id"), nullable=False),
+        sa.Column("option_value", sa.Integer(), nullable=True),
+    )
+    op.add_column("surveys", sa.Column("answers_packed", sa.String(64), nullable=True))
+    op.add_column("surveys", sa.Column("questionnaire_version", sa.String(12), nullable=True))
+    op.execute(PACKED_VIEW)
+    op.execute(LONG_VIEW)
+
+
+def downgrade():
+    # Expande as respostas compactas em linhas antes de remover as colunas
+    op.execute(
+        "INSERT INTO survey_responses (survey_id, question_id, option_id, response_score) "
+        "SELECT survey_id, question_id, option_id, response_score FROM survey_answers_packed"
+    )
+    op.execute("DROP VIEW survey_answers_long")
+    op.execute("DROP VIEW survey_answers_packed")
+    with op.batch_alter_table("surveys") as batch_op:
+        batch_op.drop_column("questionnaire_version")
+        batch_op.drop_column("answers_packed")
+    op.drop_table("questionnaire_layouts")
@@ -0,0 +1,170 @@
+"""Datas de internação e alta como DATE, dias de internação e índice analítico
+
+admission_date/discharge_date deixam de ser texto. A conversão é feita em lotes
+por faixa de id; valores que não puderam ser interpretados ficam com a data
+NULL e o texto original é guardado em legacy_dates (JSON) para revisão.
+length_of_stay_days é calculado para as pesquisas com as duas datas válidas.
+
+As visões da revisão 0005 são recriadas porque, no SQLite, a alteração de
+surveys recria a tabela.
+
+Revision ID: 0006_survey_dates
+Revises: 0005_packed_answers
+Create Date: 2025-10-13
+"""
+
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006_survey_dates"
+down_revision = "0005_packed_answers"
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 2000
+
+# Formatos aceitos em dados antigos (o formulário envia AAAA-MM-DD)
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%y"]
+
+# Mesmas definições da revisão 0005
+PACKED_VIEW = """
+CREATE VIEW survey_answers_packed AS
+SELECT s.id AS survey_id, l.question_id AS question_id, l.option_id AS option_id,
+       l.option_value AS response_score
+FROM surveys s
+JOIN questionnaire_layouts l
+  ON l.version = s.questionnaire_version
+ AND l.answer_code = SUBSTR(s.answers_packed, l.position, 1)
+WHERE s.answers_packed IS NOT NULL
+"""
+
+LONG_VIEW = """
+CREATE VIEW survey_answers_long AS
+SELECT sr.survey_id AS survey_id, sr.question_id AS question_id, sr.option_id AS option_id,
+       COALESCE(qo.option_text, sr.response_value) AS answer_text, sr.response_score AS response_score
+FROM survey_responses sr
+LEFT JOIN question_options qo ON qo.id = sr.option_id
+UNION ALL
+SELECT p.survey_id, p.question_id, p.option_id, qo.option_text, p.response_score
+FROM survey_answers_packed p
+JOIN question_options qo ON qo.id = p.option_id
+"""
+
+
+def parse_date(value):
+    """Texto -> date; None se vazio ou fora dos formatos conhecidos"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _id_batches(bind):
+    low, high = bind.execute(sa.text("SELECT MIN(id), MAX(id) FROM surveys")).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE - 1
+
+
+def _drop_views():
+    op.execute("DROP VIEW IF EXISTS survey_answers_long")
+    op.execute("DROP VIEW IF EXISTS survey_answers_packed")
+
+
+def _create_views():
+    op.execute(PACKED_VIEW)
+    op.execute(LONG_VIEW)
+
+
+def upgrade():
+    _drop_views()
+    op.add_column("surveys", sa.Column("admission_on", sa.Date(), nullable=True))
+    op.add_column("surveys", sa.Column("discharge_on", sa.Date(), nullable=True))
+    op.add_column("surveys", sa.Column("length_of_stay_days", sa.Integer(), nullable=True))
+    op.add_column("surveys", sa.Column("legacy_dates", sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    update = sa.text(
+        "UPDATE surveys SET admission_on = :admission, discharge_on = :discharge, "
+        "length_of_stay_days = :los, legacy_dates = :legacy WHERE id = :id"
+    )
+    unparsed = 0
+    for low, high in _id_batches(bind):
+        rows = bind.execute(sa.text(
+            "SELECT id, admission_date, discharge_date FROM surveys WHERE id BETWEEN :low AND :high"
+        ), {"low": low, "high": high}).all()
+        params = []
+        for survey_id, admission_text, discharge_text in rows:
+            admission = parse_date(admission_text)
+            discharge = parse_date(discharge_text)
+            legacy = None
+            if (admission_text and admission is None) or (discharge_text and discharge is None):
+                legacy = json.dumps(
+                    {"admission_date": admission_text, "discharge_date": discharge_text},
+                    ensure_ascii=False,
+                )
+                unparsed += 1
+            los = (discharge - admission).days if admission and discharge else None
+            params.append({
+                "id": survey_id, "admission": admission, "discharge": discharge,
+                "los": los if los is None or los >= 0 else None, "legacy": legacy,
+            })
+        if params:
+            bind.execute(update, params)
+    if unparsed:
+        print(f"{unparsed} pesquisas com datas não convertidas (ver surveys.legacy_dates)")
+
+    with op.batch_alter_table("surveys") as batch_op:
+        batch_op.drop_column("admission_date")
+        batch_op.drop_column("discharge_date")
+        batch_op.alter_column("admission_on", new_column_name="admission_date", existing_type=sa.Date())
+        batch_op.alter_column("discharge_on", new_column_name="discharge_date", existing_type=sa.Date())
+    op.create_index(
+        "ix_surveys_discharge_los_score", "surveys",
+        ["discharge_date", "length_of_stay_days", "satisfaction_score"],
+    )
+    _create_views()
+
+
+def downgrade():
+    _drop_views()
+    op.drop_index("ix_surveys_discharge_los_score", table_name="surveys")
+    op.add_column("surveys", sa.Column("admission_text", sa.String(50), nullable=True))
+    op.add_column("surveys", sa.Column("discharge_text", sa.String(50), nullable=True))
+
+    bind = op.get_bind()
+    update = sa.text("UPDATE surveys SET admission_text = :admission, discharge_text = :discharge WHERE id = :id")
+    for low, high in _id_batches(bind):
+        rows = bind.execute(sa.text(
+            "SELECT id, admission_date, discharge_date, legacy_dates FROM surveys WHERE id BETWEEN :low AND :high"
+        ), {"low": low, "high": high}).all()
+        params = []
+        for survey_id, admission, discharge, legacy in rows:
+            original = json.loads(legacy) if legacy else {}
+            params.append({
+                "id": survey_id,
+                "admission": original.get("admission_date") or (str(admission) if admission else None),
+                "discharge": original.get("discharge_date") or (str(discharge) if discharge else None),
+            })
+        if params:
+            bind.execute(update, params)
+
+    with op.batch_alter_table("surveys") as batch_op:
+        batch_op.drop_column("legacy_dates")
+        batch_op.drop_column("length_of_stay_days")
+        batch_op.drop_column("admission_date")
+        batch_op.drop_column("discharge_date")
+        batch_op.alter_column("admission_text", new_column_name="admission_date", existing_type=sa.String(50))
+        batch_op.alter_column("discharge_text", new_column_name="discharge_date", existing_type=sa.String(50))
+    _create_views()
@@ -0,0 +1,154 @@
+"""Dimensões de alas e cidades com chaves inteiras em surveys
+
+Cria wards/cities (nome de exibição + chave normalizada única) e as tabelas de
+aliases, adiciona surveys.ward_id/city_id e converte os textos existentes:
+grafias com a mesma chave normalizada ('UTI', 'uti ', 'U.T.I.') viram um único
+registro, cujo nome é a grafia mais frequente. surveys.ward/city passam a
+guardar o nome canônico. Os índices por texto são trocados pelos índices por id.
+
+As visões da revisão 0005 são recriadas porque, no SQLite, a alteração de
+surveys recria a tabela.
+
+Revision ID: 0007_ward_city_dimensions
+Revises: 0006_survey_dates
+Create Date: 2025-10-14
+"""
+
+import re
+import unicodedata
+from collections import Counter
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_ward_city_dimensions"
+down_revision = "0006_survey_dates"
+branch_labels = None
+depends_on = None
+
+
+# (tabela da dimensão, tabela de aliases, coluna em surveys, coluna FK, tamanho do nome)
+DIMENSIONS = [
+    ("wards", "ward_aliases", "ward", "ward_id", 100),
+    ("cities", "city_aliases", "city", "city_id", 255),
+]
+
+# Índices por texto substituídos (qualquer nome, identificados pelas colunas)
+TEXT_INDEX_COLUMNS = [("ward",), ("city",), ("created_at", "ward", "satisfaction_score")]
+
+# Mesmas definições da revisão 0005
+PACKED_VIEW = """
+CREATE VIEW survey_answers_packed AS
+SELECT s.id AS survey_id, l.question_id AS question_id, l.option_id AS option_id,
+       l.option_value AS response_score
+FROM surveys s
+JOIN questionnaire_layouts l
+  ON l.version = s.questionnaire_version
+ AND l.answer_code = SUBSTR(s.answers_packed, l.position, 1)
+WHERE s.answers_packed IS NOT NULL
+"""
+
+LONG_VIEW = """
+CREATE VIEW survey_answers_long AS
+SELECT sr.survey_id AS survey_id, sr.question_id AS question_id, sr.option_id AS option_id,
+       COALESCE(qo.option_text, sr.response_value) AS answer_text, sr.response_score AS response_score
+FROM survey_responses sr
+LEFT JOIN question_options qo ON qo.id = sr.option_id
+UNION ALL
+SELECT p.survey_id, p.question_id, p.option_id, qo.option_text, p.response_score
+FROM survey_answers_packed p
+JOIN question_options qo ON qo.id = p.option_id
+"""
+
+
+def normalize_key(value):
+    """Mesma regra de main.normalize_dimension_key"""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return re.sub(r"[^a-z0-9]", "", "".join(c for c in decomposed if not unicodedata.combining(c)).lower())
+
+
+def _drop_views():
+    op.execute("DROP VIEW IF EXISTS survey_answers_long")
+    op.execute("DROP VIEW IF EXISTS survey_answers_packed")
+
+
+def _create_views():
+    op.execute(PACKED_VIEW)
+    op.execute(LONG_VIEW)
+
+
+def _backfill(bind, table, column, fk_column):
+    """Cria os registros da dimensão e preenche surveys.<fk_column>; uma atualização por grafia"""
+    spellings = bind.execute(sa.text(
+        f"SELECT {column}, COUNT(*) FROM surveys WHERE {column} IS NOT NULL GROUP BY {column}"
+    )).all()
+    groups = {}
+    for raw, count in spellings:
+        key = normalize_key(raw)
+        if key:
+            groups.setdefault(key, Counter())[raw] += count
+
+    for key, counter in groups.items():
+        name = " ".join(counter.most_common(1)[0][0].split())
+        bind.execute(sa.text(f"INSERT INTO {table} (name, name_key) VALUES (:name, :key)"), {"name": name, "key": key})
+        dimension_id = bind.execute(sa.text(f"SELECT id FROM {table} WHERE name_key = :key"), {"key": key}).scalar()
+        bind.execute(
+            sa.text(f"UPDATE surveys SET {fk_column} = :id, {column} = :name WHERE {column} = :raw"),
+            [{"id": dimension_id, "name": name, "raw": raw} for raw in counter],
+        )
+
+
+def upgrade():
+    _drop_views()
+    for table, alias_table, _column, fk_column, size in DIMENSIONS:
+        op.create_table(
+            table,
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String(size), nullable=False),
+            sa.Column("name_key", sa.String(size), nullable=False, unique=True),
+        )
+        op.create_table(
+            alias_table,
+            sa.Column("alias_key", sa.String(size), primary_key=True),
+            sa.Column(fk_column, sa.Integer(), sa.ForeignKey(f"{table}.id"), nullable=False),
+        )
+
+    inspector = sa.inspect(op.get_bind())
+    for index in inspector.get_indexes("surveys"):
+        if tuple(index["column_names"]) in TEXT_INDEX_COLUMNS:
+            op.drop_index(index["name"], table_name="surveys")
+
+    with op.batch_alter_table("surveys") as batch_op:
+        for table, _alias_table, _column, fk_column, _size in DIMENSIONS:
+            batch_op.add_column(sa.Column(fk_column, sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(f"fk_surveys_{fk_column}", table, [fk_column], ["id"])
+
+    bind = op.get_bind()
+    for table, _alias_table, column, fk_column, _size in DIMENSIONS:
+        _backfill(bind, table, column, fk_column)
+
+    op.create_index("ix_surveys_ward_id", "surveys", ["ward_id"])
+    op.create_index("ix_surveys_city_id", "surveys", ["city_id"])
+    op.create_index("ix_surveys_created_ward_id_score", "surveys", ["created_at", "ward_id", "satisfaction_score"])
+    _create_views()
+
+
+def downgrade():
+    _drop_views()
+    op.drop_index("ix_surveys_created_ward_id_score", table_name="surveys")
+    op.drop_index("ix_surveys_city_id", table_name="surveys")
+    op.drop_index("ix_surveys_ward_id", table_name="surveys")
+    with op.batch_alter_table("surveys") as batch_op:
+        for _table, _alias_table, _column, fk_column, _size in DIMENSIONS:
+            batch_op.drop_constraint(f"fk_surveys_{fk_column}", type_="foreignkey")
+            batch_op.drop_column(fk_column)
+    for table, alias_table, _column, _fk_column, _size in DIMENSIONS:
+        op.drop_table(alias_table)
+        op.drop_table(table)
+
+    # Os nomes continuam normalizados; só os índices por texto são restaurados
+    op.create_index("ix_surveys_ward", "surveys", ["ward"])
+    op.create_index("ix_surveys_city", "surveys", ["city"])
+    op.create_index("ix_surveys_created_ward_score", "surveys", ["created_at", "ward", "satisfaction_score"])
+    _create_views()
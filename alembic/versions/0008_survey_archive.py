@@ -0,0 +1,45 @@
+"""Catálogo e totais dos meses arquivados
+
+archived_months guarda, por mês movido para o arquivo, a faixa de ids e os
+totais usados pelo dashboard; archived_question_stats, as somas de score por
+pergunta. As tabelas de arquivo em si são criadas por archive_month.
+
+Revision ID: 0008_survey_archive
+Revises: 0007_ward_city_dimensions
+Create Date: 2025-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_survey_archive"
+down_revision = "0007_ward_city_dimensions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "archived_months",
+        sa.Column("month", sa.String(7), primary_key=True),
+        sa.Column("first_id", sa.Integer(), nullable=False),
+        sa.Column("last_id", sa.Integer(), nullable=False),
+        sa.Column("surveys", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Integer(), nullable=False),
+        sa.Column("score_sum", sa.Float(), nullable=False),
+        sa.Column("score_count", sa.Integer(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=True),
+    )
+    op.create_table(
+        "archived_question_stats",
+        sa.Column("month", sa.String(7), sa.ForeignKey("archived_months.month"), primary_key=True),
+        sa.Column("question_id", sa.Integer(), sa.ForeignKey("questions.id"), primary_key=True),
+        sa.Column("score_sum", sa.Float(), nullable=False),
+        sa.Column("score_count", sa.Integer(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("archived_question_stats")
+    op.drop_table("archived_months")
@@ -0,0 +1,61 @@
+"""Estatísticas suficientes diárias por ala e pergunta
+
+survey_daily_stats guarda contagem, soma, soma dos quadrados e respostas
+favoráveis (score >= 4) por (dia, ala, pergunta); question_id 0 é a satisfação
+geral da pesquisa e ward_id 0, pesquisas sem ala. Alimenta as comparações de
+/api/analytics/compare sem reler respostas.
+
+O preenchimento inicial usa as tabelas principais; meses já arquivados antes
+desta revisão não entram.
+
+Revision ID: 0009_daily_stats
+Revises: 0008_survey_archive
+Create Date: 2025-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_daily_stats"
+down_revision = "0008_survey_archive"
+branch_labels = None
+depends_on = None
+
+BACKFILL = """
+INSERT INTO survey_daily_stats (day, ward_id, question_id, responses, score_sum, score_sq_sum, favorable)
+SELECT DATE(s.created_at), COALESCE(s.ward_id, 0), a.question_id, COUNT(*), SUM(a.response_score),
+       SUM(a.response_score * a.response_score), SUM(CASE WHEN a.response_score >= 4 THEN 1 ELSE 0 END)
+FROM survey_answers_long a
+JOIN surveys s ON s.id = a.survey_id
+WHERE a.response_score IS NOT NULL AND s.created_at IS NOT NULL
+GROUP BY DATE(s.created_at), COALESCE(s.ward_id, 0), a.question_id
+"""
+
+BACKFILL_OVERALL = """
+INSERT INTO survey_daily_stats (day, ward_id, question_id, responses, score_sum, score_sq_sum, favorable)
+SELECT DATE(created_at), COALESCE(ward_id, 0), 0, COUNT(*), SUM(satisfaction_score),
+       SUM(satisfaction_score * satisfaction_score), SUM(CASE WHEN satisfaction_score >= 4 THEN 1 ELSE 0 END)
+FROM surveys
+WHERE satisfaction_score > 0 AND created_at IS NOT NULL
+GROUP BY DATE(created_at), COALESCE(ward_id, 0)
+"""
+
+
+def upgrade():
+    op.create_table(
+        "survey_daily_stats",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("ward_id", sa.Integer(), primary_key=True),
+        sa.Column("question_id", sa.Integer(), primary_key=True),
+        sa.Column("responses", sa.Integer(), nullable=False),
+        sa.Column("score_sum", sa.Float(), nullable=False),
+        sa.Column("score_sq_sum", sa.Float(), nullable=False),
+        sa.Column("favorable", sa.Integer(), nullable=False),
+    )
+    op.execute(BACKFILL)
+    op.execute(BACKFILL_OVERALL)
+
+
+def downgrade():
+    op.drop_table("survey_daily_stats")
@@ -0,0 +1,57 @@
+"""Totais mensais da satisfação por ala e por cidade
+
+dimension_score_stats guarda pesquisas, soma e soma dos quadrados da satisfação
+geral por (mês, ala ou cidade); dimension_id 0 são as pesquisas sem ala/cidade.
+Alimenta os rankings de /api/analytics/rankings sem reler pesquisas.
+
+O preenchimento inicial usa as tabelas principais (agregado em Python, para não
+depender da função de data de cada banco); meses já arquivados não entram.
+
+Revision ID: 0010_dimension_score_stats
+Revises: 0009_daily_stats
+Create Date: 2025-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_dimension_score_stats"
+down_revision = "0009_daily_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    stats = op.create_table(
+        "dimension_score_stats",
+        sa.Column("month", sa.String(length=7), primary_key=True),
+        sa.Column("dimension", sa.String(length=5), primary_key=True),
+        sa.Column("dimension_id", sa.Integer(), primary_key=True),
+        sa.Column("surveys", sa.Integer(), nullable=False),
+        sa.Column("score_sum", sa.Float(), nullable=False),
+        sa.Column("score_sq_sum", sa.Float(), nullable=False),
+    )
+
+    totals = {}
+    rows = op.get_bind().execute(sa.text(
+        "SELECT created_at, ward_id, city_id, satisfaction_score FROM surveys "
+        "WHERE satisfaction_score > 0 AND created_at IS NOT NULL"
+    ))
+    for created_at, ward_id, city_id, score in rows:
+        month = str(created_at)[:7]
+        for dimension, dimension_id in (("ward", ward_id), ("city", city_id)):
+            entry = totals.setdefault((month, dimension, dimension_id or 0), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += score
+            entry[2] += score * score
+    if totals:
+        op.bulk_insert(stats, [
+            {"month": month, "dimension": dimension, "dimension_id": dimension_id,
+             "surveys": surveys, "score_sum": score_sum, "score_sq_sum": score_sq_sum}
+            for (month, dimension, dimension_id), (surveys, score_sum, score_sq_sum) in totals.items()
+        ])
+
+
+def downgrade():
+    op.drop_table("dimension_score_stats")
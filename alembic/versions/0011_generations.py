@@ -0,0 +1,33 @@
+"""Contadores de geração compartilhados entre os workers
+
+generations guarda um contador por nome; "data" muda a cada operação de
+manutenção que altera pesquisas já gravadas (arquivamento, remoção de
+duplicatas, aliases que movem pesquisas). Junto com o maior id de surveys,
+forma a versão dos dados usada pelo coalescing e pelos caches de resultados.
+
+Revision ID: 0011_generations
+Revises: 0010_dimension_score_stats
+Create Date: 2025-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_generations"
+down_revision = "0010_dimension_score_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    generations = op.create_table(
+        "generations",
+        sa.Column("name", sa.String(length=20), primary_key=True),
+        sa.Column("value", sa.Integer(), nullable=False),
+    )
+    op.bulk_insert(generations, [{"name": "data", "value": 0}])
+
+
+def downgrade():
+    op.drop_table("generations")
@@ -0,0 +1,30 @@
+"""Perfil de administrador (is_admin) em users e geração "users"
+
+Somente administradores desativam usuários. O usuário padrão "admin" recebe o
+perfil. A geração "users" avisa os workers para descartar o cache de usuários.
+
+Revision ID: 0012_user_admin
+Revises: 0011_generations
+Create Date: 2025-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0012_user_admin"
+down_revision = "0011_generations"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("users", sa.Column("is_admin", sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.get_bind().execute(sa.text("UPDATE users SET is_admin = :admin WHERE username = 'admin'"), {"admin": True})
+    op.execute("INSERT INTO generations (name, value) VALUES ('users', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM generations WHERE name = 'users'")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("is_admin")
@@ -0,0 +1,50 @@
+"""Estado compartilhado do detector de alertas de satisfação
+
+alert_series guarda, por (ala, métrica), a EWMA rápida, a linha de base, a
+variância e o alerta ativo; alert_events, os alertas e recuperações em ordem.
+Todos os workers atualizam e leem as mesmas séries: uma ala não tem mais uma
+série por worker, e /api/alerts e o stream mostram os mesmos eventos.
+
+Revision ID: 0013_alert_state
+Revises: 0012_user_admin
+Create Date: 2025-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0013_alert_state"
+down_revision = "0012_user_admin"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "alert_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("kind", sa.String(length=10), nullable=False),
+        sa.Column("ward_id", sa.Integer(), nullable=False),
+        sa.Column("metric", sa.String(length=255), nullable=False),
+        sa.Column("recent_mean", sa.Float(), nullable=False),
+        sa.Column("baseline", sa.Float(), nullable=False),
+        sa.Column("threshold", sa.Float(), nullable=False),
+        sa.Column("surveys", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "alert_series",
+        sa.Column("ward_id", sa.Integer(), primary_key=True),
+        sa.Column("metric", sa.String(length=255), primary_key=True),
+        sa.Column("surveys", sa.Integer(), nullable=False),
+        sa.Column("fast", sa.Float(), nullable=False),
+        sa.Column("baseline", sa.Float(), nullable=False),
+        sa.Column("variance", sa.Float(), nullable=False),
+        sa.Column("alert_id", sa.Integer(), sa.ForeignKey("alert_events.id"), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("alert_series")
+    op.drop_table("alert_events")
@@ -0,0 +1,180 @@
+"""
+Benchmark dos índices analíticos (revisão 0002_analytic_indexes)
+
+Cria um banco SQLite temporário (ou usa BENCH_DATABASE_URL), aplica o esquema
+inicial, popula com uma massa grande de pesquisas e mede planos de execução e
+tempos das consultas do dashboard e das exportações antes e depois da revisão.
+
+Uso:
+    python bench_indexes.py --surveys 50000 --repeat 5 --output bench_output.txt
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WARDS = ["Ala Shibata", "Ala Palandri", "Pronto Atendimento", "Hemodiálise", None]
+CITIES = ["Colorado", "Maringá", "Paranavaí", "Nova Esperança", None]
+
+# Consultas equivalentes às rotas /dashboard, /api/dashboard-data, /api/surveys/{id} e exportações
+QUERIES = {
+    "total_concluidas": "SELECT COUNT(*) FROM surveys WHERE completed = 1",
+    "media_satisfacao": "SELECT AVG(satisfaction_score) FROM surveys WHERE satisfaction_score IS NOT NULL",
+    "media_por_secao": (
+        "SELECT AVG(response_score) FROM survey_responses "
+        "WHERE question_id IN (1, 2, 3) AND response_score IS NOT NULL"
+    ),
+    "recentes": "SELECT * FROM surveys WHERE completed = 1 ORDER BY created_at DESC LIMIT 10",
+    "detalhe_pesquisa": (
+        "SELECT sr.* FROM survey_responses sr JOIN questions q ON sr.question_id = q.id "
+        "WHERE sr.survey_id = :survey_id ORDER BY q.section_order, q.question_order"
+    ),
+    "por_ala_30_dias": (
+        "SELECT ward, COUNT(*), AVG(satisfaction_score) FROM surveys "
+        "WHERE created_at >= :since GROUP BY ward"
+    ),
+    "score_opcao": (
+        "SELECT option_value FROM question_options "
+        "WHERE question_id = 5 AND option_text = 'Sim'"
+    ),
+    "export_csv": (
+        "SELECT s.id, s.created_at, q.question_id, sr.response_value, sr.response_score "
+        "FROM surveys s JOIN survey_responses sr ON sr.survey_id = s.id "
+        "JOIN questions q ON sr.question_id = q.id "
+        "ORDER BY s.created_at DESC, s.id, q.section_order, q.question_order"
+    ),
+}
+
+
+def seed_surveys(engine, total, batch_size=2000):
+    """Insere ``total`` pesquisas completas com respostas aleatórias"""
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        options = conn.execute(text(
+            "SELECT question_id, option_text, option_value FROM question_options"
+        )).all()
+    options_by_question = {}
+    for question_id, option_text, option_value in options:
+        options_by_question.setdefault(question_id, []).append((option_text, option_value))
+
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=730)
+    next_id = 1
+    while next_id <= total:
+        surveys, responses = [], []
+        for survey_id in range(next_id, min(total, next_id + batch_size - 1) + 1):
+            scores = []
+            for question_id, choices in options_by_question.items():
+                option_text, option_value = rng.choice(choices)
+                scores.append(option_value)
+                responses.append({
+                    "survey_id": survey_id, "question_id": question_id,
+                    "response_value": option_text, "response_score": option_value,
+                })
+            created_at = start + timedelta(minutes=rng.randrange(730 * 24 * 60))
+            surveys.append({
+                "id": survey_id, "patient_name": None, "is_anonymous": True,
+                "admission_date": created_at.strftime("%Y-%m-%d"),
+                "discharge_date": created_at.strftime("%Y-%m-%d"),
+                "observations": "", "created_at": created_at, "completed": True,
+                "satisfaction_score": sum(scores) / len(scores),
+                "city": rng.choice(CITIES), "ward": rng.choice(WARDS),
+            })
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO surveys (id, patient_name, is_anonymous, admission_date, discharge_date, "
+                "observations, created_at, completed, satisfaction_score, city, ward) VALUES "
+                "(:id, :patient_name, :is_anonymous, :admission_date, :discharge_date, "
+                ":observations, :created_at, :completed, :satisfaction_score, :city, :ward)"
+            ), surveys)
+            conn.execute(text(
+                "INSERT INTO survey_responses (survey_id, question_id, response_value, response_score) "
+                "VALUES (:survey_id, :question_id, :response_value, :response_score)"
+            ), responses)
+        next_id += batch_size
+
+
+def measure(engine, total, repeat):
+    """Retorna {consulta: (plano, mediana_ms)}"""
+    from sqlalchemy import text
+
+    params = {
+        "survey_id": max(1, total // 2),
+        "since": datetime.utcnow() - timedelta(days=30),
+    }
+    explain = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            plan_rows = conn.execute(text(explain + sql), params).all()
+            plan = "; ".join(str(row[-1]) for row in plan_rows)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (plan, statistics.median(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos índices analíticos")
+    parser.add_argument("--surveys", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="arquivo para gravar o relatório")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not os.getenv("BENCH_DATABASE_URL"):
+        tmpdir = tempfile.mkdtemp(prefix="bench_indexes_")
+        os.environ["BENCH_DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+
+    sys.path.insert(0, BASE_DIR)
+    from alembic import command
+    from main import engine
+    from manage import alembic_config, seed
+
+    config = alembic_config()
+    command.upgrade(config, "0001_initial_schema")
+    seed()
+
+    started = time.perf_counter()
+    seed_surveys(engine, args.surveys)
+    print(f"{args.surveys} pesquisas inseridas em {time.perf_counter() - started:.1f}s")
+
+    before = measure(engine, args.surveys, args.repeat)
+    command.upgrade(config, "0002_analytic_indexes")
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("ANALYZE")
+    after = measure(engine, args.surveys, args.repeat)
+
+    lines = [f"Benchmark de índices - {args.surveys} pesquisas, mediana de {args.repeat} execuções", ""]
+    lines.append(f"{'consulta':<20} {'antes (ms)':>12} {'depois (ms)':>12} {'ganho':>8}")
+    for name in QUERIES:
+        b, a = before[name][1], after[name][1]
+        lines.append(f"{name:<20} {b:>12.2f} {a:>12.2f} {b / a if a else 0:>7.1f}x")
+    lines.append("")
+    for name in QUERIES:
+        lines.append(f"[{name}]")
+        lines.append(f"  antes:  {before[name][0]}")
+        lines.append(f"  depois: {after[name][0]}")
+    report = "\n".join(lines)
+    print(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark do custo de leitura e validação de uma submissão
+
+Compara, sem tocar no banco, o caminho de formulário (multipart lido pelo
+Starlette + montagem do SurveyCreate) com o envio compacto em JSON e em
+MessagePack (SurveyCreate + validação contra o questionário em cache).
+
+Uso:
+    python bench_submission.py --iterations 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+from starlette.requests import Request  # noqa: E402
+
+from main import QUESTIONNAIRE_SECTIONS, Questionnaire, SurveyCreate, msgpack  # noqa: E402
+
+
+class _Row:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def build_questionnaire() -> Questionnaire:
+    """Questionário padrão montado em memória, sem banco"""
+    rows = []
+    option_id = 0
+    for section_order, section in enumerate(QUESTIONNAIRE_SECTIONS, 1):
+        for question_order, data in enumerate(section["questions"], 1):
+            question = _Row(
+                id=len({r[0].id for r in rows}) + 1, question_id=data["id"], question_text=data["text"],
+                question_type=data["type"], section_title=section["title"],
+            )
+            for option_text, option_value in data["options"]:
+                option_id += 1
+                rows.append((question, _Row(id=option_id, option_text=option_text, option_value=option_value)))
+    return Questionnaire(rows)
+
+
+def multipart_body(fields: dict, boundary: str) -> bytes:
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return "".join(parts).encode("utf-8")
+
+
+def make_request(body: bytes, content_type: str) -> Request:
+    scope = {
+        "type": "http", "method": "POST", "path": "/", "query_string": b"",
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+async def parse_form(body: bytes, content_type: str, questionnaire: Questionnaire) -> SurveyCreate:
+    form_data = await make_request(body, content_type).form()
+    data = SurveyCreate(
+        patient_name=form_data.get("patient_name"),
+        is_anonymous=form_data.get("is_anonymous") or False,
+        admission_date=form_data.get("admission_date"),
+        discharge_date=form_data.get("discharge_date"),
+        observations=form_data.get("observations", ""),
+        city=form_data.get("city", ""),
+        ward=form_data.get("ward", ""),
+        responses={code: form_data[code] for code in questionnaire.question_pks if code in form_data},
+        client_key=form_data.get("client_key"),
+    )
+    return questionnaire.resolve(data)
+
+
+def timed(label: str, iterations: int, func, submissions: int = None) -> float:
+    """Executa ``func`` ``iterations`` vezes e imprime o custo por submissão"""
+    submissions = submissions or iterations
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    per_call = (time.perf_counter() - started) / submissions * 1e6
+    print(f"{label:<28} {per_call:>9.1f} µs/submissão")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de leitura e validação de submissões")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    questionnaire = build_questionnaire()
+    client_key = str(uuid.uuid4())
+    patient = {
+        "patient_name": "Maria Silva", "admission_date": "2025-09-20", "discharge_date": "2025-09-22",
+        "observations": "Excelente atendimento da equipe de enfermagem!", "city": "Colorado",
+        "ward": "Ala Shibata", "client_key": client_key,
+    }
+
+    # Formulário: texto de cada opção escolhida
+    form_fields = dict(patient)
+    for question in questionnaire.questions:
+        form_fields[question["id"]] = question["options"][0]["text"]
+    boundary = "----bench" + uuid.uuid4().hex
+    form_body = multipart_body(form_fields, boundary)
+    form_type = f"multipart/form-data; boundary={boundary}"
+
+    # Compacto: índice da opção por pergunta
+    compact = dict(patient, answers=[0] * questionnaire.total_questions,
+                   questionnaire_version=questionnaire.version)
+    json_body = json.dumps(compact).encode("utf-8")
+
+    loop = asyncio.new_event_loop()
+    print(f"Tamanho do corpo: formulário {len(form_body)} B, JSON compacto {len(json_body)} B", end="")
+    if msgpack is not None:
+        msgpack_body = msgpack.packb(compact)
+        print(f", MessagePack {len(msgpack_body)} B")
+    else:
+        print()
+
+    async def parse_forms():
+        for _ in range(args.iterations):
+            await parse_form(form_body, form_type, questionnaire)
+
+    # Um único run_until_complete para não medir o custo do event loop
+    form_cost = timed("formulário multipart", 1, lambda: loop.run_until_complete(parse_forms()),
+                      submissions=args.iterations)
+    json_cost = timed("JSON compacto", args.iterations,
+                      lambda: questionnaire.resolve(SurveyCreate.model_validate_json(json_body)))
+    if msgpack is not None:
+        timed("MessagePack compacto", args.iterations,
+              lambda: questionnaire.resolve(SurveyCreate.model_validate(msgpack.unpackb(msgpack_body))))
+    print(f"JSON compacto: {form_cost / json_cost:.1f}x menos custo que o formulário")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Build dos arquivos estáticos - Sistema de Pesquisa de Satisfação
+
+1. download: copia Bootstrap, Font Awesome e Chart.js do CDN para static/vendor
+2. build:    gera static/dist com nomes contendo o hash do conteúdo, versões
+             pré-comprimidas (.gz e, se o pacote brotli existir, .br) e o
+             manifesto static/dist/manifest.json usado por static_url()
+
+Uso:
+    python build_assets.py            # download + build
+    python build_assets.py build      # apenas build (vendor já presente)
+
+Execute em uma máquina com acesso à internet (ou no build da imagem Docker);
+os tablets passam a carregar tudo do próprio servidor.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+from main import STATIC_DIR, VENDOR_ASSETS, brotli  # noqa: E402
+
+STATIC_ROOT = os.path.join(BASE_DIR, STATIC_DIR)
+DIST_DIR = os.path.join(STATIC_ROOT, "dist")
+
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".ttf", ".html", ".txt"}
+CSS_URL_PATTERN = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+def download():
+    """Baixa as bibliotecas de VENDOR_ASSETS para static/"""
+    for relative_path, url in VENDOR_ASSETS.items():
+        target = os.path.join(STATIC_ROOT, relative_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        print(f"Baixando {url}")
+        with urllib.request.urlopen(url, timeout=60) as response, open(target, "wb") as fh:
+            shutil.copyfileobj(response, fh)
+
+
+def fingerprint_name(relative_path: str, content: bytes) -> str:
+    """'vendor/x/app.min.css' -> 'dist/vendor/x/app.min.<hash>.css'"""
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, ext = posixpath.splitext(relative_path)
+    return f"dist/{root}.{digest}{ext}"
+
+
+def rewrite_css_urls(relative_path: str, css: bytes, manifest: dict) -> bytes:
+    """Troca referências relativas (ex.: ../webfonts/x.woff2) pelos nomes com hash"""
+    css_dir = posixpath.dirname(relative_path)
+
+    def replace(match):
+        quote, url = match.group(1), match.group(2)
+        if url.startswith(("data:", "http:", "https:", "/")):
+            return match.group(0)
+        path, sep, suffix = url.partition("?")
+        if not sep:
+            path, sep, suffix = url.partition("#")
+        target = posixpath.normpath(posixpath.join(css_dir, path))
+        if target not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[target][len("dist/"):], css_dir)
+        return f"url({quote}{hashed}{sep}{suffix}{quote})"
+
+    return CSS_URL_PATTERN.sub(replace, css.decode("utf-8")).encode("utf-8")
+
+
+def write_output(hashed_path: str, content: bytes):
+    """Grava o arquivo com hash e suas variantes comprimidas"""
+    target = os.path.join(STATIC_ROOT, hashed_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as fh:
+        fh.write(content)
+    if os.path.splitext(target)[1] in COMPRESSIBLE_EXTENSIONS:
+        with open(target + ".gz", "wb") as fh:
+            fh.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + ".br", "wb") as fh:
+                fh.write(brotli.compress(content, quality=11))
+
+
+def build():
+    """Gera static/dist e o manifesto a partir de todos os arquivos em static/"""
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    sources = []
+    for directory, _dirs, files in os.walk(STATIC_ROOT):
+        for name in sorted(files):
+            full_path = os.path.join(directory, name)
+            sources.append(os.path.relpath(full_path, STATIC_ROOT).replace(os.sep, "/"))
+
+    # CSS por último, para que fontes e imagens referenciadas já tenham hash
+    sources.sort(key=lambda path: (path.endswith(".css"), path))
+
+    manifest = {}
+    for relative_path in sources:
+        with open(os.path.join(STATIC_ROOT, relative_path), "rb") as fh:
+            content = fh.read()
+        if relative_path.endswith(".css"):
+            content = rewrite_css_urls(relative_path, content, manifest)
+        hashed_path = fingerprint_name(relative_path, content)
+        write_output(hashed_path, content)
+        manifest[relative_path] = hashed_path
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(os.path.join(DIST_DIR, "manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    print(f"{len(manifest)} arquivos gerados em {os.path.relpath(DIST_DIR, BASE_DIR)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build dos arquivos estáticos")
+    parser.add_argument("command", nargs="?", default="all", choices=["all", "download", "build"])
+    args = parser.parse_args()
+
+    if args.command in ("all", "download"):
+        download()
+    if args.command in ("all", "build"):
+        build()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,10 @@ CREATE TABLE surveys (
     id INT AUTO_INCREMENT PRIMARY KEY,
     patient_name VARCHAR(255) NULL COMMENT 'Nome do paciente (NULL se anônimo)',
     is_anonymous BOOLEAN DEFAULT FALSE COMMENT 'Se a pesquisa é anônima',
-    admission_date VARCHAR(50) NOT NULL COMMENT 'Data de internação',
-    discharge_date VARCHAR(50) NOT NULL COMMENT 'Data de alta',
+    admission_date DATE NULL COMMENT 'Data de internação',
+    discharge_date DATE NULL COMMENT 'Data de alta',
+    length_of_stay_days INT NULL COMMENT 'Dias de internação (alta - internação)',
+    legacy_dates TEXT NULL COMMENT 'Texto original de datas antigas não convertidas',
     observations TEXT NULL COMMENT 'Observações e comentários',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Data de criação da pesquisa',
     completed BOOLEAN DEFAULT FALSE COMMENT 'Se a pesquisa foi concluída',
@@ -26,7 +28,8 @@ CREATE TABLE surveys (
 
     INDEX idx_created_at (created_at),
     INDEX idx_completed (completed),
-    INDEX idx_satisfaction_score (satisfaction_score)
+    INDEX idx_satisfaction_score (satisfaction_score),
+    INDEX ix_surveys_discharge_los_score (discharge_date, length_of_stay_days, satisfaction_score)
 ) COMMENT = 'Pesquisas de satisfação dos pacientes';
 
 -- Tabela de perguntas do questionário
@@ -1,50 +1,328 @@
-
 """
 Sistema de Pesquisa de Satisfação - Hospital Santa Clara
 Aplicação FastAPI completa com MySQL, templates HTML e dashboard de insights
 """
 
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Optional, List
 import json
 import os
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse, FileResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, func, text, inspect
+from jinja2 import FileSystemBytecodeCache, pass_context
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, Text, Boolean, Float, ForeignKey, Index, func, text, literal, extract, insert, table, column, case, select, false, delete, MetaData, Table
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session, relationship
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError, model_validator
 import uvicorn
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 import io
 import csv
+import asyncio
+import bisect
 import hashlib
+import hmac
+import math
 import secrets
+from statistics import NormalDist
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import zlib
+import uuid
+import tempfile
+import mimetypes
+import re
+import stat as stat_module
+import unicodedata
+import anyio
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+try:
+    # Serialização JSON rápida (orjson); sem ela, usa o JSONResponse padrão
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    # Cubo de contagens das opções (opcional); sem NumPy, as distribuições vêm do banco
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
 
 # ====== CONFIGURAÇÕES DE BANCO DE DADOS ======
 
 # DATABASE_URL padrão para desenvolvimento local com SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hospital_satisfaction.db")
 
-# Configuração do engine conforme o dialeto
-engine_kwargs = {"pool_pre_ping": True}
 
-if DATABASE_URL.startswith("sqlite"):
-    # Melhor compatibilidade com SQLite em ambientes multi-thread
-    engine_kwargs["connect_args"] = {"check_same_thread": False}
-else:
-    # Para MySQL, reciclar conexões antigas
-    engine_kwargs["pool_recycle"] = 3600
+# Réplica de leitura opcional (dashboard, análises e exportações), com pool próprio
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "5"))
+READ_MAX_OVERFLOW = int(os.getenv("READ_MAX_OVERFLOW", "10"))
+# Atraso máximo aceito da réplica (segundos) e intervalo entre verificações;
+# acima do limite, ou com a réplica fora do ar, as leituras vão para o primário
+READ_REPLICA_MAX_LAG = float(os.getenv("READ_REPLICA_MAX_LAG", "60"))
+READ_REPLICA_CHECK_INTERVAL = float(os.getenv("READ_REPLICA_CHECK_INTERVAL", "5"))
+
+
+# Vagas simultâneas por classe de requisição (ver CONTROLE DE ADMISSÃO). O pool do
+# primário é apenas dimensionado pela soma das vagas e das consultas paralelas do
+# dashboard, mais uma folga para rotas sem classe: não há conexões reservadas por
+# classe. Cada requisição admitida usa uma conexão por vez, então com as vagas no
+# limite o pool não se esgota; aumentar DB_POOL_SIZE acima disso não isola nada
+ADMISSION_LIMITS = {
+    lane: int(os.getenv(f"ADMISSION_{lane.upper()}_LIMIT", str(default)))
+    for lane, default in (("ingest", 8), ("interactive", 4), ("bulk", 2))
+}
+# Consultas do dashboard disparadas em paralelo, cada uma em conexão própria
+DASHBOARD_QUERY_WORKERS = int(os.getenv("DASHBOARD_QUERY_WORKERS", "4"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(sum(ADMISSION_LIMITS.values()) + DASHBOARD_QUERY_WORKERS + 2)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+PRIMARY_POOL = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+
+
+def make_engine(database_url: str, **pool_kwargs):
+    """Engine com pool de conexões, configurado conforme o dialeto"""
+    engine_kwargs = {"pool_pre_ping": True, **pool_kwargs}
+
+    if database_url.startswith("sqlite"):
+        # Melhor compatibilidade com SQLite em ambientes multi-thread
+        engine_kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        # Para MySQL, reciclar conexões antigas
+        engine_kwargs["pool_recycle"] = 3600
+
+    return create_engine(database_url, **engine_kwargs)
+
 
-engine = create_engine(DATABASE_URL, **engine_kwargs)
+engine = make_engine(DATABASE_URL, **PRIMARY_POOL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+# ====== HOSPITAIS (MULTI-TENANT) ======
+
+# Um banco por hospital: "chave=url,chave=url". Sem TENANTS, há um único hospital
+# ("default") no DATABASE_URL e nenhuma rota muda.
+TENANTS = os.getenv("TENANTS", "")
+# Réplicas de leitura por hospital, no mesmo formato (hospitais ausentes leem do primário)
+TENANTS_READ = os.getenv("TENANTS_READ", "")
+DEFAULT_TENANT = "default"
+TENANT_KEY_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+def parse_tenants(spec: str, setting: str = "TENANTS") -> "OrderedDict[str, str]":
+    """'hsc=sqlite:///./hsc.db, hsm=mysql+pymysql://...' -> {chave: url}"""
+    tenants = OrderedDict()
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        key, sep, url = item.partition("=")
+        key = key.strip().lower()
+        if not sep or not url.strip() or not TENANT_KEY_PATTERN.match(key):
+            raise RuntimeError(f"{setting} inválido: {item.strip()!r} (use chave=url)")
+        tenants[key] = url.strip()
+    return tenants
+
+
+# Engine da réplica -> engine do primário (caches por banco são compartilhados entre os dois)
+replica_primaries: dict = {}
+
+
+class Tenant:
+    """Banco de um hospital: engine com pool e fábrica de sessões criados no primeiro uso"""
+
+    def __init__(self, key: str, database_url: str, tenant_engine=None, read_url: Optional[str] = None):
+        self.key = key
+        self.database_url = database_url
+        self.read_url = read_url or None
+        self._engine = tenant_engine
+        self._session_factory = None
+        self._read_engine = None
+        self._read_session_factory = None
+        self._replica_checked_at = None
+        self._replica_ok = False
+        self._lock = threading.RLock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = make_engine(self.database_url, **PRIMARY_POOL)
+        return self._engine
+
+    @property
+    def SessionLocal(self):
+        if self._session_factory is None:
+            with self._lock:
+                if self._session_factory is None:
+                    self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        return self._session_factory
+
+    @property
+    def read_engine(self):
+        if self._read_engine is None:
+            with self._lock:
+                if self._read_engine is None:
+                    read_engine = make_engine(self.read_url, pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW)
+                    replica_primaries[read_engine] = self.engine
+                    self._read_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+                    self._read_engine = read_engine
+        return self._read_engine
+
+    def replica_lag(self) -> float:
+        """Segundos entre a pesquisa mais recente do primário e a da réplica"""
+        latest = select(func.max(Survey.created_at))
+        with self.engine.connect() as conn:
+            primary_latest = conn.execute(latest).scalar()
+        with self.read_engine.connect() as conn:
+            replica_latest = conn.execute(latest).scalar()
+        if primary_latest is None:
+            return 0.0
+        if replica_latest is None:
+            return float("inf")
+        return max(0.0, (primary_latest - replica_latest).total_seconds())
+
+    def replica_usable(self) -> bool:
+        """Réplica configurada, acessível e dentro do atraso máximo (verificado a cada intervalo)"""
+        if self.read_url is None:
+            return False
+        checked_at = self._replica_checked_at
+        if checked_at is not None and time.monotonic() - checked_at < READ_REPLICA_CHECK_INTERVAL:
+            return self._replica_ok
+        with self._lock:
+            if self._replica_checked_at is checked_at:
+                try:
+                    lag = self.replica_lag()
+                    ok, reason = lag <= READ_REPLICA_MAX_LAG, f"atraso de {lag:.0f}s"
+                except Exception as e:
+                    ok, reason = False, str(e)
+                if ok != self._replica_ok or checked_at is None:
+                    state = "em uso" if ok else f"ignorada ({reason})"
+                    print(f"Réplica de leitura do hospital {self.key}: {state}")
+                self._replica_ok = ok
+                self._replica_checked_at = time.monotonic()
+        return self._replica_ok
+
+    def read_session(self) -> Session:
+        """Sessão para rotas somente leitura: réplica quando utilizável, senão o primário"""
+        if self.replica_usable():
+            return self._read_session_factory()
+        return self.SessionLocal()
+
+
+class TenantRegistry:
+    """Hospitais configurados; o engine de cada um é compartilhado por todas as requisições do worker"""
+
+    def __init__(self, spec: str = TENANTS, read_spec: str = TENANTS_READ):
+        configured = parse_tenants(spec)
+        read_urls = parse_tenants(read_spec, "TENANTS_READ")
+        self.multi = bool(configured)
+        self._tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+        if not configured:
+            configured[DEFAULT_TENANT] = DATABASE_URL
+            read_urls[DEFAULT_TENANT] = DATABASE_READ_URL
+        for key, url in configured.items():
+            # O hospital no DATABASE_URL reaproveita o engine global (scripts e Alembic)
+            self._tenants[key] = Tenant(key, url, engine if url == DATABASE_URL else None, read_urls.get(key))
+
+    def get(self, key: Optional[str]) -> Optional[Tenant]:
+        return self._tenants.get((key or "").lower())
+
+    def all(self) -> List[Tenant]:
+        return list(self._tenants.values())
+
+    def default(self) -> Tenant:
+        return next(iter(self._tenants.values()))
+
+    def key_of(self, db_or_connection) -> str:
+        """Chave do hospital dono da sessão ou conexão (pelo engine)"""
+        bound = db_or_connection.get_bind().engine if isinstance(db_or_connection, Session) else db_or_connection.engine
+        bound = replica_primaries.get(bound, bound)
+        for tenant in self._tenants.values():
+            if tenant._engine is bound:
+                return tenant.key
+        return self.default().key
+
+    def resolve(self, scope) -> tuple[Optional[Tenant], str, str]:
+        """(hospital, path, root_path) de uma requisição ASGI.
+
+        O prefixo ``/t/<chave>/`` tem precedência (testes e integrações); senão
+        vale o primeiro rótulo do Host (``hsc.pesquisa.exemplo`` -> ``hsc``).
+        """
+        path = scope.get("path", "")
+        root_path = scope.get("root_path", "")
+        if not self.multi:
+            return self.default(), path, root_path
+
+        if path.startswith("/t/"):
+            key, _, rest = path[3:].partition("/")
+            tenant = self.get(key)
+            if tenant is not None:
+                return tenant, "/" + rest, root_path + "/t/" + key
+
+        host = Headers(scope=scope).get("host", "").split(":")[0]
+        return self.get(host.split(".")[0]), path, root_path
+
+
+tenants = TenantRegistry()
+
+
+class PerDatabase:
+    """Uma instância de cache por banco de hospital, escolhida pelo engine da sessão.
+
+    Métodos chamados com a sessão como primeiro argumento (``get(db)``,
+    ``resolve(db, ...)``) são repassados à instância do banco da sessão.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances: dict = {}
+        self._lock = threading.Lock()
+
+    def of(self, db_or_engine):
+        bound = db_or_engine.get_bind().engine if isinstance(db_or_engine, Session) else db_or_engine.engine
+        bound = replica_primaries.get(bound, bound)
+        instance = self._instances.get(bound)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.setdefault(bound, self._factory())
+        return instance
+
+    def __getattr__(self, name):
+        def dispatch(db, *args, **kwargs):
+            return getattr(self.of(db), name)(db, *args, **kwargs)
+        return dispatch
+
+
 # ====== MODELOS DO BANCO DE DADOS ======
 
 class Survey(Base):
@@ -54,18 +332,35 @@ class Survey(Base):
     id = Column(Integer, primary_key=True, index=True)
     patient_name = Column(String(255), nullable=True)  # Pode ser nulo se anônimo
     is_anonymous = Column(Boolean, default=False)
-    admission_date = Column(String(50))
-    discharge_date = Column(String(50))
+    admission_date = Column(Date, nullable=True)
+    discharge_date = Column(Date, nullable=True)
+    length_of_stay_days = Column(Integer, nullable=True)  # discharge_date - admission_date
+    legacy_dates = Column(Text, nullable=True)  # Texto original de datas antigas não convertidas
     observations = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed = Column(Boolean, default=False)
     satisfaction_score = Column(Float, nullable=True)  # Score médio calculado
-    city = Column(String(255), nullable=True)
-    ward = Column(String(100), nullable=True)
+    city = Column(String(255), nullable=True)  # Nome canônico (cities.name)
+    ward = Column(String(100), nullable=True)  # Nome canônico (wards.name)
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=True, index=True)
+    ward_id = Column(Integer, ForeignKey("wards.id"), nullable=True, index=True)
+    client_key = Column(String(36), nullable=True)  # Chave de idempotência gerada pelo tablet
+    # Modo compacto (ANSWER_STORAGE=packed): um caractere por pergunta, decodificado
+    # pelo layout da versão do questionário
+    answers_packed = Column(String(64), nullable=True)
+    questionnaire_version = Column(String(12), nullable=True)
 
     # Relacionamentos
     responses = relationship("SurveyResponse", back_populates="survey")
 
+    __table_args__ = (
+        Index("ix_surveys_created_ward_id_score", "created_at", "ward_id", "satisfaction_score"),
+        Index("ix_surveys_completed_created_at", "completed", "created_at"),
+        Index("ix_surveys_satisfaction_score", "satisfaction_score"),
+        Index("uq_surveys_client_key", "client_key", unique=True),
+        Index("ix_surveys_discharge_los_score", "discharge_date", "length_of_stay_days", "satisfaction_score"),
+    )
+
 
 class Question(Base):
     """Tabela de perguntas do questionário"""
@@ -83,6 +378,10 @@ class Question(Base):
     responses = relationship("SurveyResponse", back_populates="question")
     options = relationship("QuestionOption", back_populates="question")
 
+    __table_args__ = (
+        Index("ix_questions_section_order", "section_order", "question_order"),
+    )
+
 
 class QuestionOption(Base):
     """Opções de resposta para cada pergunta"""
@@ -97,20 +396,181 @@ class QuestionOption(Base):
     # Relacionamentos
     question = relationship("Question", back_populates="options")
 
+    __table_args__ = (
+        Index("ix_question_options_question_text", "question_id", "option_text"),
+    )
+
 
 class SurveyResponse(Base):
     """Respostas individuais para cada pergunta"""
     __tablename__ = "survey_responses"
 
     id = Column(Integer, primary_key=True, index=True)
-    survey_id = Column(Integer, ForeignKey("surveys.id"))
+    survey_id = Column(Integer, ForeignKey("surveys.id"), index=True)
     question_id = Column(Integer, ForeignKey("questions.id"))
-    response_value = Column(String(255))  # Resposta textual
+    option_id = Column(Integer, ForeignKey("question_options.id"), nullable=True)  # Opção escolhida
+    response_value = Column(String(255), nullable=True)  # Texto apenas quando não corresponde a uma opção
     response_score = Column(Integer, nullable=True)  # Score numérico
 
     # Relacionamentos
     survey = relationship("Survey", back_populates="responses")
     question = relationship("Question", back_populates="responses")
+    option = relationship("QuestionOption")
+
+    __table_args__ = (
+        Index("uq_survey_responses_survey_question", "survey_id", "question_id", unique=True),
+        Index("ix_survey_responses_question_score", "question_id", "response_score"),
+    )
+
+
+class QuestionnaireLayout(Base):
+    """Layout das respostas compactas: posição e código do caractere -> opção, por versão"""
+    __tablename__ = "questionnaire_layouts"
+
+    version = Column(String(12), primary_key=True)
+    position = Column(Integer, primary_key=True)  # 1-based, como SUBSTR
+    answer_code = Column(String(1), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), nullable=False)
+    option_id = Column(Integer, ForeignKey("question_options.id"), nullable=False)
+    option_value = Column(Integer, nullable=True)
+
+
+# Visão em formato longo (uma linha por resposta) que junta survey_responses e as
+# respostas compactas; criada pela migração 0005, fora do metadata dos modelos
+survey_answers_long = table(
+    "survey_answers_long",
+    column("survey_id"), column("question_id"), column("option_id"),
+    column("answer_text"), column("response_score"),
+)
+
+
+class ArchivedMonth(Base):
+    """Mês movido para o arquivo, com os totais usados pelo dashboard"""
+    __tablename__ = "archived_months"
+
+    month = Column(String(7), primary_key=True)  # AAAA-MM de created_at
+    first_id = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    surveys = Column(Integer, nullable=False)
+    completed = Column(Integer, nullable=False)
+    score_sum = Column(Float, nullable=False)
+    score_count = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedQuestionStat(Base):
+    """Soma e contagem de scores por pergunta de um mês arquivado"""
+    __tablename__ = "archived_question_stats"
+
+    month = Column(String(7), ForeignKey("archived_months.month"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    score_sum = Column(Float, nullable=False)
+    score_count = Column(Integer, nullable=False)
+
+
+class SurveyDailyStat(Base):
+    """Estatísticas suficientes por dia, ala e pergunta, atualizadas a cada submissão.
+
+    ``question_id`` 0 guarda a satisfação geral da pesquisa; ``ward_id`` 0, as
+    pesquisas sem ala. Não são removidas no arquivamento mensal.
+    """
+    __tablename__ = "survey_daily_stats"
+
+    day = Column(Date, primary_key=True)
+    ward_id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    responses = Column(Integer, nullable=False)
+    score_sum = Column(Float, nullable=False)
+    score_sq_sum = Column(Float, nullable=False)
+    favorable = Column(Integer, nullable=False)  # respostas com score >= FAVORABLE_SCORE
+
+
+class DimensionScoreStat(Base):
+    """Soma e soma dos quadrados da satisfação geral por mês e ala ou cidade (rankings).
+
+    ``dimension_id`` 0 guarda as pesquisas sem ala/cidade. Como survey_daily_stats,
+    não é removida no arquivamento mensal.
+    """
+    __tablename__ = "dimension_score_stats"
+
+    month = Column(String(7), primary_key=True)  # AAAA-MM de created_at
+    dimension = Column(String(5), primary_key=True)  # "ward" ou "city"
+    dimension_id = Column(Integer, primary_key=True)
+    surveys = Column(Integer, nullable=False)
+    score_sum = Column(Float, nullable=False)
+    score_sq_sum = Column(Float, nullable=False)
+
+
+class AlertEvent(Base):
+    """Alerta de queda de satisfação (ou recuperação) de uma série (ala, métrica)"""
+    __tablename__ = "alert_events"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    kind = Column(String(10), nullable=False)  # "drop" ou "recovered"
+    ward_id = Column(Integer, nullable=False)  # 0 = pesquisas sem ala
+    metric = Column(String(255), nullable=False)
+    recent_mean = Column(Float, nullable=False)
+    baseline = Column(Float, nullable=False)
+    threshold = Column(Float, nullable=False)
+    surveys = Column(Integer, nullable=False)
+
+
+class AlertSeries(Base):
+    """EWMA rápida e linha de base de uma série (ala, métrica) do detector de alertas,
+    compartilhada pelos workers; ``alert_id`` aponta o alerta ativo"""
+    __tablename__ = "alert_series"
+
+    ward_id = Column(Integer, primary_key=True)
+    metric = Column(String(255), primary_key=True)  # "Satisfação geral" ou título da seção
+    surveys = Column(Integer, nullable=False)
+    fast = Column(Float, nullable=False)
+    baseline = Column(Float, nullable=False)
+    variance = Column(Float, nullable=False)
+    alert_id = Column(Integer, ForeignKey("alert_events.id"), nullable=True)
+
+
+class Generation(Base):
+    """Contador compartilhado entre workers, incrementado na mesma transação da
+    mudança que ele sinaliza (ver bump_generation)"""
+    __tablename__ = "generations"
+
+    name = Column(String(20), primary_key=True)  # "data" ou "users"
+    value = Column(Integer, nullable=False, default=0)
+
+
+class Ward(Base):
+    """Dimensão de alas: um registro por nome normalizado"""
+    __tablename__ = "wards"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    name_key = Column(String(100), nullable=False, unique=True)  # normalize_dimension_key(name)
+
+
+class WardAlias(Base):
+    """Grafias alternativas de uma ala (ex.: 'Terapia Intensiva' -> UTI)"""
+    __tablename__ = "ward_aliases"
+
+    alias_key = Column(String(100), primary_key=True)
+    ward_id = Column(Integer, ForeignKey("wards.id"), nullable=False)
+
+
+class City(Base):
+    """Dimensão de cidades: um registro por nome normalizado"""
+    __tablename__ = "cities"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    name_key = Column(String(255), nullable=False, unique=True)
+
+
+class CityAlias(Base):
+    """Grafias alternativas de uma cidade"""
+    __tablename__ = "city_aliases"
+
+    alias_key = Column(String(255), primary_key=True)
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
 
 
 class User(Base):
@@ -121,26 +581,65 @@ class User(Base):
     username = Column(String(50), unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
+    is_admin = Column(Boolean, nullable=False, default=False, server_default=false())
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
 # ====== MODELOS PYDANTIC ======
 
 class SurveyCreate(BaseModel):
+    """Pesquisa enviada pelo tablet.
+
+    As respostas podem vir por texto (``responses``: código -> texto da opção) ou no
+    formato compacto (``answers``: índice da opção para cada pergunta, na ordem do
+    questionário ``questionnaire_version``; ``None`` para não respondida).
+    """
     patient_name: Optional[str] = None
     is_anonymous: bool = False
-    admission_date: str
-    discharge_date: str
-    responses: dict
+    admission_date: date
+    discharge_date: date
+    responses: dict[str, str] = {}
+    answers: Optional[List[Optional[int]]] = None
+    questionnaire_version: Optional[str] = None
     observations: Optional[str] = None
+    city: Optional[str] = None
+    ward: Optional[str] = None
+    client_key: Optional[uuid.UUID] = None
+
+    @model_validator(mode="after")
+    def check_dates(self):
+        if self.discharge_date < self.admission_date:
+            raise ValueError("Data de alta anterior à data de internação")
+        return self
+
+    @property
+    def length_of_stay_days(self) -> int:
+        return (self.discharge_date - self.admission_date).days
+
+
+class SurveyBatch(BaseModel):
+    """Lote de pesquisas enviadas pela fila offline do tablet (validadas item a item)"""
+    surveys: List[dict]
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: str
+    survey_id: Optional[int] = None
+    replayed: bool = False
+    message: Optional[str] = None
+
+
+class SurveyBatchResult(BaseModel):
+    results: List[BatchItemResult]
 
 
 class SurveyResponseModel(BaseModel):
     id: int
     patient_name: Optional[str]
     is_anonymous: bool
-    admission_date: str
-    discharge_date: str
+    admission_date: Optional[date]
+    discharge_date: Optional[date]
     created_at: datetime
     satisfaction_score: Optional[float]
 
@@ -157,692 +656,4239 @@ class UserResponse(BaseModel):
     id: int
     username: str
     is_active: bool
+    is_admin: bool = False
     created_at: datetime
 
     class Config:
         from_attributes = True
 
 
-# ====== DEPENDÊNCIAS ======
+class SubmitSurveyResult(BaseModel):
+    status: str
+    message: str
+    survey_id: int
+    replayed: bool = False
 
-def get_db():
-    """Dependência para obter sessão do banco de dados"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+class RecentSurveyItem(BaseModel):
+    id: int
+    patient: Optional[str]
+    date: str
+    score: float
+    observations: str
+    city: str
+    ward: str
 
-# ====== FUNÇÕES DE AUTENTICAÇÃO ======
 
-def hash_password(password: str) -> str:
-    """Cria hash da senha usando SHA-256 com salt"""
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-    return f"{salt}:{password_hash}"
+class DashboardData(BaseModel):
+    totalSurveys: int
+    avgSatisfaction: float
+    sectionScores: dict[str, float]
+    monthlyTrend: List[float]
+    recentSurveys: List[RecentSurveyItem]
 
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    """Verifica se a senha está correta"""
-    try:
-        salt, hash_part = hashed_password.split(':')
-        password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-        return password_hash == hash_part
-    except:
-        return False
+class QuestionItem(BaseModel):
+    id: str
+    text: str
+    type: str
+    options: List[str]
 
 
-def create_default_user(db: Session):
-    """Cria usuário padrão se não existir nenhum"""
-    if db.query(User).count() == 0:
-        default_user = User(
-            username="admin",
-            password_hash=hash_password("admin123"),
-            is_active=True
-        )
-        db.add(default_user)
-        db.commit()
-        print("Usuário padrão criado: admin / admin123")
+class QuestionSection(BaseModel):
+    title: str
+    questions: List[QuestionItem]
 
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
-    """Obtém o usuário atual da sessão"""
-    username = request.session.get("username")
-    if username:
-        user = db.query(User).filter(User.username == username, User.is_active == True).first()
-        return user
-    return None
+class SurveyAnswerItem(BaseModel):
+    questionId: str
+    question: str
+    answer: Optional[str]
+    score: Optional[int]
 
 
-def require_auth(current_user: Optional[User] = Depends(get_current_user)):
-    """Dependência que exige autenticação"""
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Não autorizado"
-        )
-    return current_user
+class SurveyAnswerSection(BaseModel):
+    title: str
+    items: List[SurveyAnswerItem]
 
 
-# ====== INICIALIZAÇÃO DOS DADOS ======
+class SurveyDetails(BaseModel):
+    """Pesquisa completa no formato da API (camelCase), usada em detalhes e exportação"""
+    id: int
+    createdAt: str
+    patient: Optional[str]
+    isAnonymous: bool
+    admissionDate: Optional[date]
+    dischargeDate: Optional[date]
+    lengthOfStayDays: Optional[int] = None
+    city: str
+    ward: str
+    observations: str
+    satisfactionScore: float
+    sections: List[SurveyAnswerSection]
 
-def init_questions(db: Session):
-    """Inicializa as perguntas no banco de dados"""
 
-    # Verifica se já existem perguntas
-    if db.query(Question).count() > 0:
-        return
+survey_details_list = TypeAdapter(List[SurveyDetails])
 
-    sections_data = [
-        {
-            "title": "Seção 1: Atendimento",
-            "questions": [
-                {
-                    "id": "q1_1",
-                    "text": "1. Como você avaliaria a qualidade do atendimento recebido no hospital?",
-                    "options": [
-                        ("Muito satisfeito(a)", 5),
-                        ("Satisfeito(a)", 4),
-                        ("Neutro(a)", 3),
-                        ("Insatisfeito(a)", 2),
-                        ("Muito insatisfeito(a)", 1)
-                    ],
-                    "type": "satisfaction_scale"
-                },
-                {
-                    "id": "q1_2",
-                    "text": "2. Os profissionais de saúde foram atenciosos e respeitosos com você?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                },
-                {
-                    "id": "q1_3",
-                    "text": "3. Você sentiu que suas necessidades foram atendidas de forma eficaz?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                }
-            ]
-        },
-        {
-            "title": "Seção 2: Instalações e recursos",
-            "questions": [
-                {
-                    "id": "q2_1",
-                    "text": "1. Como você avaliaria as instalações do hospital (limpeza, conforto, etc.)?",
-                    "options": [
-                        ("Muito satisfeito(a)", 5),
-                        ("Satisfeito(a)", 4),
-                        ("Neutro(a)", 3),
-                        ("Insatisfeito(a)", 2),
-                        ("Muito insatisfeito(a)", 1)
-                    ],
-                    "type": "satisfaction_scale"
-                },
-                {
-                    "id": "q2_2",
-                    "text": "2. Os equipamentos e recursos disponíveis no hospital foram suficientes para o seu tratamento?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                }
-            ]
-        },
-        {
-            "title": "Seção 3: Comunicação",
-            "questions": [
-                {
-                    "id": "q3_1",
-                    "text": "1. Você sentiu que os profissionais de saúde explicaram claramente o seu diagnóstico e tratamento?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                },
-                {
-                    "id": "q3_2",
-                    "text": "2. Você foi informado sobre os seus direitos e responsabilidades como paciente?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                }
-            ]
-        },
-        {
-            "title": "Seção 4: Filantropia e apoio",
-            "questions": [
-                {
-                    "id": "q4_1",
-                    "text": "1. Você sabe que o hospital é filantrópico e que sua missão é ajudar aqueles que não têm recursos?",
-                    "options": [("Sim", 5), ("Não", 1)],
-                    "type": "yes_no"
-                },
-                {
-                    "id": "q4_2",
-                    "text": "2. Você sente que o hospital está fazendo uma diferença positiva na comunidade?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                }
-            ]
-        },
-        {
-            "title": "Seção 5: Recomendação",
-            "questions": [
-                {
-                    "id": "q5_1",
-                    "text": "1. Você recomendaria este hospital para amigos e familiares?",
-                    "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
-                    "type": "yes_no_partial"
-                }
-            ]
-        }
-    ]
 
-    for section_order, section in enumerate(sections_data, 1):
-        for question_order, question_data in enumerate(section["questions"], 1):
-            # Criar pergunta
-            question = Question(
-                question_id=question_data["id"],
-                section_title=section["title"],
-                question_text=question_data["text"],
-                question_type=question_data["type"],
-                section_order=section_order,
-                question_order=question_order
-            )
-            db.add(question)
-            db.flush()  # Para obter o ID
+class DimensionItem(BaseModel):
+    id: int
+    name: str
 
-            # Criar opções
-            for option_order, (option_text, option_value) in enumerate(question_data["options"], 1):
-                option = QuestionOption(
-                    question_id=question.id,
-                    option_text=option_text,
-                    option_value=option_value,
-                    option_order=option_order
-                )
-                db.add(option)
 
-    db.commit()
+class Dimensions(BaseModel):
+    wards: List[DimensionItem]
+    cities: List[DimensionItem]
 
 
-# ====== APLICAÇÃO FASTAPI ======
+class LengthOfStayBucket(BaseModel):
+    label: str
+    minDays: int
+    maxDays: Optional[int]
+    surveys: int
+    avgSatisfaction: Optional[float]
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Configuração de inicialização e finalização da aplicação"""
-    # Startup
-    Base.metadata.create_all(bind=engine)
 
-    # Migração leve: garantir colunas 'city' e 'ward' na tabela surveys (cross-database)
-    try:
-        inspector = inspect(engine)
-        existing_columns = {col["name"] for col in inspector.get_columns("surveys")}
-        with engine.connect() as conn:
-            if "city" not in existing_columns:
-                conn.execute(text("ALTER TABLE surveys ADD COLUMN city VARCHAR(255)"))
-            if "ward" not in existing_columns:
-                conn.execute(text("ALTER TABLE surveys ADD COLUMN ward VARCHAR(100)"))
-    except Exception:
-        # Evitar quebra de startup por falha de migração; logs podem ser adicionados conforme necessário
-        pass
+class LengthOfStayAnalytics(BaseModel):
+    surveys: int
+    avgLengthOfStay: Optional[float]
+    correlation: Optional[float]  # Pearson entre dias de internação e satisfação
+    buckets: List[LengthOfStayBucket]
 
-    # Inicializar dados
-    db = SessionLocal()
-    try:
-        init_questions(db)
-        create_default_user(db)
-    finally:
-        db.close()
 
-    yield
+class TenantRollup(BaseModel):
+    tenant: str
+    totalSurveys: int
+    avgSatisfaction: float
+    sectionScores: dict[str, float]
+    error: Optional[str] = None
 
-    # Shutdown
-    pass
 
+class GroupAnalytics(BaseModel):
+    totalSurveys: int
+    avgSatisfaction: float
+    sectionScores: dict[str, float]  # média ponderada pelas respostas de cada hospital
+    tenants: List[TenantRollup]
 
-app = FastAPI(
-    title="Sistema de Pesquisa de Satisfação - Hospital Santa Clara",
-    description="Sistema completo para coleta e análise de pesquisas de satisfação de pacientes",
-    version="1.0.0",
-    lifespan=lifespan
-)
 
-# Adicionar middleware de sessão
-from starlette.middleware.sessions import SessionMiddleware
-app.add_middleware(SessionMiddleware, secret_key="hospital-santa-clara-secret-key-2024")
+class SampleSummary(BaseModel):
+    n: int
+    mean: Optional[float]
+    sd: Optional[float]
+    favorableRate: Optional[float]  # proporção de respostas com score >= 4
 
-# Configurar arquivos estáticos e templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
 
+class MetricComparison(BaseModel):
+    metric: str  # "Satisfação geral", título da seção ou código da pergunta
+    a: SampleSummary
+    b: SampleSummary
+    delta: Optional[float]  # média de B - média de A
+    ciLow: Optional[float]
+    ciHigh: Optional[float]
+    t: Optional[float]  # Welch
+    df: Optional[float]
+    pValue: Optional[float]
+    chiSquare: Optional[float]  # favoráveis x não favoráveis, 1 grau de liberdade
+    chiSquarePValue: Optional[float]
+    significant: bool
 
-# ====== ROTAS PRINCIPAIS ======
 
-@app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
-    """Página inicial com a pesquisa"""
-    return templates.TemplateResponse("survey.html", {"request": request})
+class PeriodComparison(BaseModel):
+    confidence: float
+    metrics: List[MetricComparison]
 
 
-@app.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request):
-    """Página de login"""
-    return templates.TemplateResponse("login.html", {"request": request})
+class OptionCount(BaseModel):
+    option: str
+    count: int
+    share: float
 
 
-@app.post("/login")
-async def login(
-    request: Request,
-    username: str = Form(...),
-    password: str = Form(...),
-    db: Session = Depends(get_db)
-):
-    """Processar login do usuário"""
-    user = db.query(User).filter(User.username == username, User.is_active == True).first()
-    
-    if user and verify_password(password, user.password_hash):
-        request.session["username"] = user.username
-        return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
-    else:
-        return templates.TemplateResponse("login.html", {
-            "request": request,
-            "error": "Usuário ou senha incorretos"
-        })
+class QuestionDistribution(BaseModel):
+    questionId: str
+    section: str
+    responses: int
+    options: List[OptionCount]
+    avgScore: Optional[float]
+    topBox: Optional[float]  # proporção de respostas na opção de maior valor
 
 
-@app.get("/logout")
-async def logout(request: Request):
-    """Fazer logout do usuário"""
-    request.session.clear()
-    return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
+class OptionDistribution(BaseModel):
+    source: str  # "cube" (NumPy) ou "sql"
+    sectionScores: dict[str, float]
+    questions: List[QuestionDistribution]
 
 
-@app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    """Dashboard de insights para diretoria"""
+class DriverItem(BaseModel):
+    questionId: str
+    question: str
+    section: str
+    responses: int
+    correlation: Optional[float]  # Pearson com o alvo, nas pesquisas que responderam
+    coefficient: Optional[float]  # OLS: pontos no alvo por ponto na pergunta
+    standardizedCoefficient: Optional[float]
+    relativeWeight: Optional[float]  # fração do R² (pesos relativos de Johnson)
 
-    # Calcular métricas principais
-    total_surveys = db.query(Survey).filter(Survey.completed == True).count()
-    avg_satisfaction = db.query(Survey).filter(Survey.satisfaction_score.isnot(None)).with_entities(
-        func.avg(Survey.satisfaction_score)
-    ).scalar() or 0
 
-    # Buscar pesquisas recentes
-    recent_surveys = db.query(Survey).filter(Survey.completed == True).order_by(
-        Survey.created_at.desc()
-    ).limit(10).all()
+class KeyDrivers(BaseModel):
+    target: str
+    surveys: int
+    rSquared: Optional[float]
+    drivers: List[DriverItem]  # do maior para o menor peso relativo
 
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "total_surveys": total_surveys,
-        "avg_satisfaction": round(avg_satisfaction, 2),
-        "recent_surveys": recent_surveys,
-        "current_user": current_user
-    })
 
+class SatisfactionAlert(BaseModel):
+    id: int
+    kind: str  # "drop" (queda) ou "recovered" (voltou ao normal)
+    createdAt: str
+    wardId: int  # 0 = pesquisas sem ala
+    ward: str
+    metric: str  # "Satisfação geral" ou título da seção
+    recentMean: float  # EWMA rápida
+    baseline: float
+    threshold: float
+    surveys: int
 
-@app.post("/api/submit-survey")
-async def submit_survey(
-    request: Request,
-    patient_name: str = Form(None),
-    is_anonymous: bool = Form(False),
-    admission_date: str = Form(...),
-    discharge_date: str = Form(...),
-    observations: str = Form(""),
-    city: str = Form(""),
-    ward: str = Form(""),
-    db: Session = Depends(get_db)
-):
-    """API para submeter uma nova pesquisa"""
 
-    try:
-        # Coletar todas as respostas do formulário
-        form_data = await request.form()
-        responses = {}
+class AlertsOverview(BaseModel):
+    active: List[SatisfactionAlert]
+    recent: List[SatisfactionAlert]  # mais recentes primeiro
 
-        for key, value in form_data.items():
-            if key.startswith('q') and '_' in key:  # Perguntas no formato q1_1, q2_1, etc
-                responses[key] = value
-
-        # Calcular score de satisfação
-        total_score = 0
-        total_questions = 0
-
-        for question_id, response_text in responses.items():
-            question = db.query(Question).filter(Question.question_id == question_id).first()
-            if question:
-                option = db.query(QuestionOption).filter(
-                    QuestionOption.question_id == question.id,
-                    QuestionOption.option_text == response_text
-                ).first()
-
-                if option:
-                    total_score += option.option_value
-                    total_questions += 1
-
-        satisfaction_score = total_score / total_questions if total_questions > 0 else 0
-
-        # Criar registro da pesquisa
-        survey = Survey(
-            patient_name=patient_name if not is_anonymous else None,
-            is_anonymous=is_anonymous,
-            admission_date=admission_date,
-            discharge_date=discharge_date,
-            observations=observations,
-            completed=True,
-            satisfaction_score=satisfaction_score,
-            city=city or None,
-            ward=ward or None
-        )
 
-        db.add(survey)
-        db.flush()  # Para obter o ID
-
-        # Salvar respostas individuais
-        for question_id, response_text in responses.items():
-            question = db.query(Question).filter(Question.question_id == question_id).first()
-            if question:
-                option = db.query(QuestionOption).filter(
-                    QuestionOption.question_id == question.id,
-                    QuestionOption.option_text == response_text
-                ).first()
-
-                response = SurveyResponse(
-                    survey_id=survey.id,
-                    question_id=question.id,
-                    response_value=response_text,
-                    response_score=option.option_value if option else None
-                )
-                db.add(response)
+class RankedUnit(BaseModel):
+    rank: int
+    id: int
+    name: str
+    surveys: int
+    rawMean: float
+    shrunkMean: float  # média puxada para a média geral conforme o tamanho da amostra
+    ciLow: float
+    ciHigh: float
+    shrinkage: float  # peso da média geral (0 = só os dados da unidade, 1 = só a média geral)
 
-        db.commit()
 
-        return JSONResponse({
-            "status": "success",
-            "message": "Pesquisa enviada com sucesso!",
-            "survey_id": survey.id
-        })
+class Rankings(BaseModel):
+    dimension: str
+    confidence: float
+    units: int
+    grandMean: Optional[float]
+    withinVariance: Optional[float]
+    betweenVariance: Optional[float]
+    top: List[RankedUnit]  # melhores primeiro
+    bottom: List[RankedUnit]  # piores primeiro
 
-    except Exception as e:
-        db.rollback()
-        return JSONResponse({
-            "status": "error",
-            "message": f"Erro ao salvar pesquisa: {str(e)}"
-        }, status_code=500)
 
+class CoalescingMetric(BaseModel):
+    requests: int
+    executions: int
+    coalesced: int  # requisições atendidas por uma execução já em andamento
+    hitRate: float
 
-@app.get("/api/dashboard-data")
-async def get_dashboard_data(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    """API para dados do dashboard"""
 
-    try:
-        # Métricas principais
-        total_surveys = db.query(Survey).filter(Survey.completed == True).count()
-        avg_satisfaction = db.query(Survey).filter(Survey.satisfaction_score.isnot(None)).with_entities(
-            func.avg(Survey.satisfaction_score)
-        ).scalar() or 0
-
-        # Satisfação por seção
-        section_scores = {}
-        sections = db.query(Question.section_title).distinct().all()
-
-        for section in sections:
-            section_name = section[0]
-            section_questions = db.query(Question).filter(Question.section_title == section_name).all()
-
-            if section_questions:
-                question_ids = [q.id for q in section_questions]
-                section_avg = db.query(SurveyResponse).filter(
-                    SurveyResponse.question_id.in_(question_ids),
-                    SurveyResponse.response_score.isnot(None)
-                ).with_entities(
-                    func.avg(SurveyResponse.response_score)
-                ).scalar() or 0
-
-                section_scores[section_name] = round(section_avg, 2)
-
-        # Tendência mensal (simulada para demonstração)
-        monthly_trend = [3.8, 4.0, 4.1, 4.0, 4.2, 4.3, 4.2, 4.1, 4.0, 4.1, 4.2, round(avg_satisfaction, 1)]
-
-        # Pesquisas recentes
-        recent_surveys = []
-        recent_data = db.query(Survey).filter(Survey.completed == True).order_by(
-            Survey.created_at.desc()
-        ).limit(5).all()
-
-        for survey in recent_data:
-            recent_surveys.append({
-                "id": survey.id,
-                "patient": survey.patient_name if not survey.is_anonymous else "Anônimo",
-                "date": survey.created_at.strftime("%Y-%m-%d"),
-                "score": round(survey.satisfaction_score, 1) if survey.satisfaction_score else 0,
-                "observations": survey.observations or "",
-                "city": survey.city or "",
-                "ward": survey.ward or ""
-            })
+# ====== DEPENDÊNCIAS ======
 
-        return JSONResponse({
-            "totalSurveys": total_surveys,
-            "avgSatisfaction": round(avg_satisfaction, 2),
-            "sectionScores": section_scores,
-            "monthlyTrend": monthly_trend,
-            "recentSurveys": recent_surveys
-        })
+def get_tenant(request: Request) -> Tenant:
+    """Hospital da requisição, resolvido pelo TenantMiddleware"""
+    return getattr(request.state, "tenant", None) or tenants.default()
 
-    except Exception as e:
-        return JSONResponse({
-            "error": str(e)
-        }, status_code=500)
 
+def get_db(request: Request):
+    """Dependência para obter sessão do banco de dados do hospital da requisição"""
+    db = get_tenant(request).SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
-@app.get("/api/questions")
-async def get_questions(db: Session = Depends(get_db)):
-    """API para obter todas as perguntas e opções"""
 
+def get_read_db(request: Request):
+    """Dependência das rotas somente leitura: réplica do hospital, se configurada e em dia"""
+    db = get_tenant(request).read_session()
     try:
-        sections = {}
-        questions = db.query(Question).order_by(Question.section_order, Question.question_order).all()
+        yield db
+    finally:
+        db.close()
 
-        for question in questions:
-            section_title = question.section_title
 
-            if section_title not in sections:
-                sections[section_title] = {
-                    "title": section_title,
-                    "questions": []
-                }
+# ====== CONTROLE DE ADMISSÃO ======
 
-            options = db.query(QuestionOption).filter(
-                QuestionOption.question_id == question.id
-            ).order_by(QuestionOption.option_order).all()
+class AdmissionRejected(Exception):
+    """Classe de requisição saturada: fila cheia ou espera além do tempo limite"""
 
-            question_data = {
-                "id": question.question_id,
-                "text": question.question_text,
-                "type": question.question_type,
-                "options": [opt.option_text for opt in options]
-            }
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Classe {lane} saturada")
+        self.lane = lane
+        self.retry_after = retry_after
 
-            sections[section_title]["questions"].append(question_data)
 
-        return JSONResponse(list(sections.values()))
+class AdmissionLane:
+    """Vagas simultâneas de uma classe de requisição, com fila limitada e tempo máximo de espera.
 
-    except Exception as e:
-        return JSONResponse({
-            "error": str(e)
-        }, status_code=500)
+    Limitar as vagas de cada classe limita as conexões que ela ocupa ao mesmo
+    tempo (uma por requisição admitida): exportações e consultas pesadas não
+    esgotam o pool dimensionado pela soma das vagas.
+    Roda no event loop (sem locks); a vaga liberada passa direto ao próximo da fila.
+    """
 
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.rejected = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._avg_hold = 1.0  # média móvel do tempo de uso de uma vaga (segundos)
+
+    def retry_after(self) -> int:
+        """Estimativa de segundos até haver vaga, pelo tempo médio de uso e pela fila"""
+        waiting = len(self._waiters) + 1
+        return min(60, max(1, int(self._avg_hold * waiting / max(1, self.limit) + 0.999)))
+
+    def _reject(self):
+        self.rejected += 1
+        return AdmissionRejected(self.name, self.retry_after())
+
+    async def acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size or self.timeout <= 0:
+            raise self._reject()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # a vaga chegou junto com o cancelamento: devolve
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject() from None
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # a vaga passa ao próximo sem decrementar
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - started)
+            self.release()
+
+
+def _lane(name: str, queue_size: int, timeout: float) -> AdmissionLane:
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionLane(
+        name, ADMISSION_LIMITS[name],
+        queue_size=int(os.getenv(f"{prefix}_QUEUE", str(queue_size))),
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+    )
+
+
+# Submissões esperam mais; exportações são recusadas rapidamente quando saturadas
+admission_lanes = {
+    "ingest": _lane("ingest", queue_size=200, timeout=10),
+    "interactive": _lane("interactive", queue_size=20, timeout=5),
+    "bulk": _lane("bulk", queue_size=2, timeout=1),
+}
+
+
+def admit(lane_name: str):
+    """Dependência que ocupa uma vaga da classe durante toda a requisição
+    (inclusive o envio de respostas em streaming); 503 + Retry-After se saturada"""
+    lane = admission_lanes[lane_name]
+
+    async def dependency():
+        try:
+            async with lane.slot():
+                yield
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado; tente novamente em instantes",
+                headers={"Retry-After": str(e.retry_after)},
+            )
 
-@app.get("/api/surveys/{survey_id}")
-async def get_survey_details(survey_id: int, db: Session = Depends(get_db)):
-    """Retorna detalhes completos de uma pesquisa: dados do paciente e todas as respostas.
-    """
-    try:
-        survey = db.query(Survey).filter(Survey.id == survey_id).first()
-        if not survey:
-            raise HTTPException(status_code=404, detail="Pesquisa não encontrada")
+    return dependency
 
-        # Buscar respostas com perguntas e opções
-        responses = db.query(SurveyResponse).join(Question, SurveyResponse.question_id == Question.id) \
-            .filter(SurveyResponse.survey_id == survey_id) \
-            .order_by(Question.section_order, Question.question_order).all()
-
-        # Estruturar por seção
-        sections: dict[str, dict] = {}
-        for resp in responses:
-            section_title = resp.question.section_title
-            if section_title not in sections:
-                sections[section_title] = {"title": section_title, "items": []}
-            sections[section_title]["items"].append({
-                "questionId": resp.question.question_id,
-                "question": resp.question.question_text,
-                "answer": resp.response_value,
-                "score": resp.response_score
-            })
 
-        payload = {
-            "id": survey.id,
-            "patient": None if survey.is_anonymous else (survey.patient_name or ""),
-            "isAnonymous": survey.is_anonymous,
-            "admissionDate": survey.admission_date,
-            "dischargeDate": survey.discharge_date,
-            "city": survey.city or "",
-            "ward": survey.ward or "",
-            "observations": survey.observations or "",
-            "createdAt": survey.created_at.isoformat(),
-            "satisfactionScore": survey.satisfaction_score or 0,
-            "sections": list(sections.values())
+# ====== COALESCING DE LEITURAS ======
+
+class SingleFlight:
+    """Leituras caras idênticas e simultâneas aguardam uma única execução e
+    compartilham o resultado (nada fica guardado depois que ela termina).
+
+    A execução roda em uma task própria: se quem a iniciou desistir
+    (cliente desconectado), as demais requisições continuam esperando por ela.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self._stats: dict[str, list] = {}  # nome -> [requisições, compartilhadas]
+
+    def record(self, name: str, shared: bool) -> None:
+        stats = self._stats.setdefault(name, [0, 0])
+        stats[0] += 1
+        if shared:
+            stats[1] += 1
+
+    async def run(self, name: str, key, compute):
+        """``compute()`` -> awaitable, chamada só se não houver execução em andamento para ``key``"""
+        task = self._inflight.get(key)
+        self.record(name, task is not None)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # evita o aviso de exceção não lida se ninguém mais aguardar
+
+    def metrics(self) -> dict:
+        return {
+            name: {
+                "requests": requests,
+                "executions": requests - shared,
+                "coalesced": shared,
+                "hitRate": round(shared / requests, 3) if requests else 0.0,
+            }
+            for name, (requests, shared) in sorted(self._stats.items())
         }
 
-        return JSONResponse(payload)
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+single_flight = SingleFlight()
 
 
-@app.get("/api/export-csv")
-async def export_csv(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    """Exporta todas as respostas das pesquisas em formato CSV (long format).
+class ResultCache:
+    """Resultados por (hospital, parâmetros, versão dos dados), com limite de entradas;
+    a próxima pesquisa gravada muda a versão e os torna obsoletos"""
 
-    Colunas: survey_id, created_at, patient, is_anonymous, city, ward,
-    satisfaction_score, question_id, section_title, question_text,
-    response_value, response_score
-    """
-    try:
-        # Consultar respostas com joins necessários
-        query = (
-            db.query(
-                Survey.id.label("survey_id"),
-                Survey.created_at.label("created_at"),
-                Survey.patient_name.label("patient_name"),
-                Survey.is_anonymous.label("is_anonymous"),
-                Survey.city.label("city"),
-                Survey.ward.label("ward"),
-                Survey.satisfaction_score.label("satisfaction_score"),
-                Question.question_id.label("question_id"),
-                Question.section_title.label("section_title"),
-                Question.question_text.label("question_text"),
-                SurveyResponse.response_value.label("response_value"),
-                SurveyResponse.response_score.label("response_score"),
-            )
-            .join(SurveyResponse, SurveyResponse.survey_id == Survey.id)
-            .join(Question, SurveyResponse.question_id == Question.id)
-            .order_by(Survey.created_at.desc(), Survey.id, Question.section_order, Question.question_order)
-        )
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self._results: "OrderedDict[tuple, object]" = OrderedDict()
 
-        # Construir CSV em memória
-        output = io.StringIO()
-        writer = csv.writer(output)
-        header = [
-            "survey_id",
-            "created_at",
-            "patient",
-            "is_anonymous",
-            "city",
-            "ward",
-            "satisfaction_score",
-            "question_id",
-            "section_title",
-            "question_text",
-            "response_value",
-            "response_score",
-        ]
-        writer.writerow(header)
-
-        for row in query.all():
-            writer.writerow([
-                row.survey_id,
-                row.created_at.strftime("%Y-%m-%d %H:%M:%S") if row.created_at else "",
-                "" if row.is_anonymous else (row.patient_name or ""),
-                1 if row.is_anonymous else 0,
-                row.city or "",
-                row.ward or "",
-                f"{row.satisfaction_score:.2f}" if row.satisfaction_score is not None else "",
-                row.question_id,
-                row.section_title,
-                row.question_text,
-                row.response_value,
-                row.response_score if row.response_score is not None else "",
-            ])
-
-        output.seek(0)
+    async def get(self, tenant: "Tenant", params: tuple, compute, primary: bool = False):
+        """Resultado guardado ou ``compute()`` (compartilhada entre requisições simultâneas).
+        ``primary``: ``compute`` lê do primário, e a versão dos dados também"""
+        version = await current_data_version(tenant, primary)
+        key = (tenant.key, params, version)
+        result = self._results.get(key)
+        if result is None:
+            result = await single_flight.run(self.name, key, compute)
+            self._results[key] = result
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+        self._results.move_to_end(key)
+        return result
 
-        # Preparar resposta de streaming
-        filename = f"survey_responses_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
-        return StreamingResponse(
-            output,
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
+
+def bump_generation(db: Session, name: str) -> None:
+    """Incrementa o contador ``name`` na transação de ``db`` (sem commit)"""
+    updated = db.query(Generation).filter(Generation.name == name).update(
+        {Generation.value: Generation.value + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.add(Generation(name=name, value=1))
+        db.flush()
+
+
+def data_version(db: Session) -> tuple:
+    """(maior id de pesquisa, geração "data"): muda a cada pesquisa gravada e a cada
+    arquivamento, remoção de duplicatas ou alias que move pesquisas. Uma consulta
+    pelo índice da chave primária e uma leitura de linha, sem contagens"""
+    return db.query(
+        select(func.max(Survey.id)).scalar_subquery(),
+        select(Generation.value).where(Generation.name == "data").scalar_subquery(),
+    ).one()
+
+
+def in_read_session(tenant: Tenant, func, *args):
+    """Awaitable que executa ``func(db, *args)`` em uma thread, com sessão de leitura própria"""
+    return in_session(tenant.read_session, func, *args)
+
+
+def in_session(session_factory, func, *args):
+    """Como ``in_read_session``, com a sessão criada por ``session_factory``"""
+    def run():
+        db = session_factory()
+        try:
+            return func(db, *args)
+        finally:
+            db.close()
+
+    return anyio.to_thread.run_sync(run)
+
+
+def current_data_version(tenant: Tenant, primary: bool = False):
+    """Awaitable com a versão dos dados lida da mesma fonte da computação (réplica ou
+    primário); leituras simultâneas da versão também compartilham uma consulta"""
+    session_factory = tenant.SessionLocal if primary else tenant.read_session
+    return single_flight.run(
+        "data-version", ("data-version", tenant.key, primary),
+        lambda: in_session(session_factory, data_version),
+    )
+
+
+async def coalesced_read(name: str, tenant: Tenant, params: tuple, compute, primary: bool = False):
+    """Executa ``compute()`` uma vez por (rota, hospital, parâmetros, versão dos dados) em
+    andamento; ``primary`` como em ``ResultCache.get``"""
+    version = await current_data_version(tenant, primary)
+    return await single_flight.run(name, (name, tenant.key, params, version), compute)
+
+
+# ====== FUNÇÕES DE AUTENTICAÇÃO ======
+
+# Parâmetros do scrypt (KDF com uso intensivo de memória: ~128 * N * r bytes)
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+
+# Pool limitado para hashing/verificação, fora do event loop
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    thread_name_prefix="password-hash"
+)
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r * p, dklen=32
+    )
+
+
+def hash_password(password: str) -> str:
+    """Cria hash da senha com scrypt no formato ``scrypt$n$r$p$salt$hash``"""
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """Verifica se a senha está correta (aceita também o formato legado ``salt:hash``)"""
+    try:
+        if hashed_password.startswith("scrypt$"):
+            _, n, r, p, salt, hash_part = hashed_password.split("$")
+            digest = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(digest.hex(), hash_part)
+
+        salt, hash_part = hashed_password.split(':')
+        password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
+        return hmac.compare_digest(password_hash, hash_part)
+    except Exception:
+        return False
+
+
+# Hash fixo verificado quando o usuário não existe ou está inativo: o login leva o
+# mesmo tempo (um scrypt com os parâmetros atuais) e não revela quais usuários existem
+DUMMY_PASSWORD_HASH = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${'00' * 16}${'00' * 32}"
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Indica se o hash é legado ou usa parâmetros diferentes dos atuais"""
+    return not hashed_password.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """Executa ``verify_password`` no pool dedicado sem bloquear o event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """Executa ``hash_password`` no pool dedicado sem bloquear o event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, hash_password, password)
+
+
+# ====== LIMITAÇÃO DE TENTATIVAS DE LOGIN ======
+
+class TokenBucketLimiter:
+    """Token bucket por chave (usuário ou IP) com número limitado de chaves em memória"""
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, tokens: float = 1.0) -> bool:
+        """Consome tokens da chave; retorna False se a chave estiver esgotada"""
+        now = time.monotonic()
+        with self._lock:
+            available, updated_at = self._buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - updated_at) * self.refill_per_second)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            self._buckets[key] = (available, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def retry_after(self, key: str, tokens: float = 1.0) -> int:
+        """Segundos até a chave ter tokens suficientes novamente"""
+        with self._lock:
+            available, updated_at = self._buckets.get(key, (self.capacity, time.monotonic()))
+        available = min(self.capacity, available + (time.monotonic() - updated_at) * self.refill_per_second)
+        missing = max(0.0, tokens - available)
+        return max(1, int(missing / self.refill_per_second + 0.999))
+
+
+# Rajada de 5 tentativas por usuário e 20 por IP, com reposição gradual
+login_user_limiter = TokenBucketLimiter(
+    capacity=float(os.getenv("LOGIN_USER_BURST", "5")),
+    refill_per_second=float(os.getenv("LOGIN_USER_PER_MINUTE", "5")) / 60
+)
+login_ip_limiter = TokenBucketLimiter(
+    capacity=float(os.getenv("LOGIN_IP_BURST", "20")),
+    refill_per_second=float(os.getenv("LOGIN_IP_PER_MINUTE", "20")) / 60
+)
+
+
+def create_default_user(db: Session):
+    """Cria usuário padrão se não existir nenhum"""
+    if db.query(User).count() == 0:
+        default_user = User(
+            username="admin",
+            password_hash=hash_password("admin123"),
+            is_active=True,
+            is_admin=True
+        )
+        db.add(default_user)
+        db.commit()
+        print("Usuário padrão criado: admin / admin123")
+
+
+# ====== CACHE DE USUÁRIOS AUTENTICADOS ======
+
+# Tempo de vida (segundos) e capacidade do cache de usuários por worker
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "256"))
+# Intervalo (segundos) entre conferências da geração "users": limite para que uma
+# desativação feita em outro worker valha neste
+USER_CACHE_CHECK_INTERVAL = float(os.getenv("USER_CACHE_CHECK_INTERVAL", "2"))
+
+
+class UserCache:
+    """Cache LRU com expiração (TTL) de usuários autenticados, indexado pelo id.
+
+    Guarda instantâneos ``UserResponse`` (desacoplados da sessão do banco), de modo
+    que rotas autenticadas não precisem consultar a tabela ``users`` a cada requisição.
+    Alterações de usuários incrementam a geração "users" no banco; cada worker a
+    confere a cada USER_CACHE_CHECK_INTERVAL segundos e descarta o cache se mudou.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_MAX_SIZE,
+                 check_interval: float = USER_CACHE_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[int, tuple[float, UserResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked_at = None
+
+    def sync(self, session_factory) -> None:
+        """Descarta as entradas se a geração "users" mudou (conferida no máximo a
+        cada ``check_interval`` segundos, com uma leitura pela chave primária)"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        db = session_factory()
+        try:
+            generation = db.query(Generation.value).filter(Generation.name == "users").scalar() or 0
+        finally:
+            db.close()
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            self._checked_at = now
+
+    def get(self, user_id: int) -> Optional[UserResponse]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user: UserResponse) -> None:
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Ids de usuário só são únicos dentro do banco de cada hospital
+user_cache = PerDatabase(UserCache)
+
+
+def set_session_user(request: Request, user: User) -> None:
+    """Grava na sessão assinada as claims do usuário autenticado"""
+    request.session["tenant"] = get_tenant(request).key
+    request.session["username"] = user.username
+    request.session["user_id"] = user.id
+    request.session["is_active"] = bool(user.is_active)
+
+
+def deactivate_user(db: Session, user_id: int) -> bool:
+    """Desativa um usuário e invalida sua entrada no cache deste worker; os demais
+    descartam o cache ao ver a geração "users" incrementada"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        return False
+    user.is_active = False
+    bump_generation(db, "users")
+    db.commit()
+    user_cache.of(db).invalidate(user_id)
+    return True
+
+
+def get_current_user(request: Request) -> Optional[UserResponse]:
+    """Obtém o usuário atual a partir das claims da sessão.
+
+    Em regime normal a resposta vem do cache; o banco só é consultado quando a
+    entrada expira, foi invalidada ou a sessão é anterior às claims com ``user_id``.
+    """
+    if not request.session.get("username") or request.session.get("is_active") is False:
+        return None
+
+    # A sessão vale apenas no hospital em que o login foi feito (sessões
+    # anteriores à claim ``tenant`` pertencem ao hospital padrão)
+    tenant = get_tenant(request)
+    if request.session.get("tenant", tenants.default().key) != tenant.key:
+        return None
+
+    cache = user_cache.of(tenant.engine)
+    cache.sync(tenant.SessionLocal)
+    user_id = request.session.get("user_id")
+    if user_id is not None:
+        cached = cache.get(user_id)
+        if cached is not None:
+            return cached if cached.is_active else None
+
+    db = tenant.SessionLocal()
+    try:
+        query = db.query(User)
+        if user_id is not None:
+            query = query.filter(User.id == user_id)
+        else:
+            query = query.filter(User.username == request.session["username"])
+        user = query.first()
+        if not user:
+            request.session.clear()
+            return None
+
+        snapshot = UserResponse.model_validate(user)
+        cache.set(snapshot)
+        if not user.is_active:
+            request.session.clear()
+            return None
+        if user_id is None:
+            set_session_user(request, user)
+        return snapshot
+    finally:
+        db.close()
+
+
+def require_auth(current_user: Optional[UserResponse] = Depends(get_current_user)):
+    """Dependência que exige autenticação"""
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Não autorizado"
+        )
+    return current_user
+
+
+# ====== INICIALIZAÇÃO DOS DADOS ======
+
+# Questionário padrão: seções, perguntas e opções com seus valores numéricos
+QUESTIONNAIRE_SECTIONS = [
+    {
+        "title": "Seção 1: Atendimento",
+        "questions": [
+            {
+                "id": "q1_1",
+                "text": "1. Como você avaliaria a qualidade do atendimento recebido no hospital?",
+                "options": [
+                    ("Muito satisfeito(a)", 5),
+                    ("Satisfeito(a)", 4),
+                    ("Neutro(a)", 3),
+                    ("Insatisfeito(a)", 2),
+                    ("Muito insatisfeito(a)", 1)
+                ],
+                "type": "satisfaction_scale"
+            },
+            {
+                "id": "q1_2",
+                "text": "2. Os profissionais de saúde foram atenciosos e respeitosos com você?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            },
+            {
+                "id": "q1_3",
+                "text": "3. Você sentiu que suas necessidades foram atendidas de forma eficaz?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            }
+        ]
+    },
+    {
+        "title": "Seção 2: Instalações e recursos",
+        "questions": [
+            {
+                "id": "q2_1",
+                "text": "1. Como você avaliaria as instalações do hospital (limpeza, conforto, etc.)?",
+                "options": [
+                    ("Muito satisfeito(a)", 5),
+                    ("Satisfeito(a)", 4),
+                    ("Neutro(a)", 3),
+                    ("Insatisfeito(a)", 2),
+                    ("Muito insatisfeito(a)", 1)
+                ],
+                "type": "satisfaction_scale"
+            },
+            {
+                "id": "q2_2",
+                "text": "2. Os equipamentos e recursos disponíveis no hospital foram suficientes para o seu tratamento?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            }
+        ]
+    },
+    {
+        "title": "Seção 3: Comunicação",
+        "questions": [
+            {
+                "id": "q3_1",
+                "text": "1. Você sentiu que os profissionais de saúde explicaram claramente o seu diagnóstico e tratamento?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            },
+            {
+                "id": "q3_2",
+                "text": "2. Você foi informado sobre os seus direitos e responsabilidades como paciente?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            }
+        ]
+    },
+    {
+        "title": "Seção 4: Filantropia e apoio",
+        "questions": [
+            {
+                "id": "q4_1",
+                "text": "1. Você sabe que o hospital é filantrópico e que sua missão é ajudar aqueles que não têm recursos?",
+                "options": [("Sim", 5), ("Não", 1)],
+                "type": "yes_no"
             },
+            {
+                "id": "q4_2",
+                "text": "2. Você sente que o hospital está fazendo uma diferença positiva na comunidade?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            }
+        ]
+    },
+    {
+        "title": "Seção 5: Recomendação",
+        "questions": [
+            {
+                "id": "q5_1",
+                "text": "1. Você recomendaria este hospital para amigos e familiares?",
+                "options": [("Sim", 5), ("Não", 1), ("Em parte", 3)],
+                "type": "yes_no_partial"
+            }
+        ]
+    }
+]
+
+
+def init_questions(db: Session):
+    """Inicializa as perguntas no banco de dados com inserções em lote"""
+
+    # Verifica se já existem perguntas
+    if db.query(Question.id).first() is not None:
+        return
+
+    question_rows = []
+    for section_order, section in enumerate(QUESTIONNAIRE_SECTIONS, 1):
+        for question_order, question_data in enumerate(section["questions"], 1):
+            question_rows.append({
+                "question_id": question_data["id"],
+                "section_title": section["title"],
+                "question_text": question_data["text"],
+                "question_type": question_data["type"],
+                "section_order": section_order,
+                "question_order": question_order
+            })
+    db.execute(insert(Question), question_rows)
+
+    # Uma única consulta para mapear os IDs gerados
+    ids_by_code = dict(db.query(Question.question_id, Question.id).all())
+
+    option_rows = []
+    for section in QUESTIONNAIRE_SECTIONS:
+        for question_data in section["questions"]:
+            for option_order, (option_text, option_value) in enumerate(question_data["options"], 1):
+                option_rows.append({
+                    "question_id": ids_by_code[question_data["id"]],
+                    "option_text": option_text,
+                    "option_value": option_value,
+                    "option_order": option_order
+                })
+    db.execute(insert(QuestionOption), option_rows)
+
+    db.commit()
+
+
+# ====== QUESTIONÁRIO EM CACHE ======
+
+# Intervalo (segundos) para reler o questionário do banco em cada worker
+QUESTIONNAIRE_CACHE_TTL = float(os.getenv("QUESTIONNAIRE_CACHE_TTL", "300"))
+
+# Formato de gravação das respostas: "rows" (uma linha por resposta em
+# survey_responses) ou "packed" (surveys.answers_packed, uma linha por pesquisa)
+ANSWER_STORAGE = os.getenv("ANSWER_STORAGE", "rows")
+
+# Respostas compactas: '0' = sem resposta, '*' = texto livre (gravado em
+# survey_responses), '1'..'9' = opção pela ordem
+PACKED_UNANSWERED = "0"
+PACKED_FREE_TEXT = "*"
+PACKED_OPTION_CODES = "123456789"
+PACKED_MAX_QUESTIONS = 64
+
+
+class Questionnaire:
+    """Instantâneo imutável do questionário (perguntas e opções) com versão por conteúdo"""
+
+    def __init__(self, rows):
+        self.sections = []          # Formato de /api/questions
+        self.questions = []         # Perguntas em ordem, com opções detalhadas
+        self.options = {}           # (código da pergunta, texto) -> opção
+        self.question_pks = {}      # código da pergunta -> id no banco
+        self.option_texts = {}      # id da opção -> texto
+        sections_by_title = {}
+        questions_by_id = {}
+
+        for question, option in rows:
+            if question.id not in questions_by_id:
+                item = {
+                    "id": question.question_id,
+                    "pk": question.id,
+                    "text": question.question_text,
+                    "type": question.question_type,
+                    "section": question.section_title,
+                    "options": [],
+                }
+                questions_by_id[question.id] = item
+                self.question_pks[question.question_id] = question.id
+                self.questions.append(item)
+                if question.section_title not in sections_by_title:
+                    section = {"title": question.section_title, "questions": []}
+                    sections_by_title[question.section_title] = section
+                    self.sections.append(section)
+                sections_by_title[question.section_title]["questions"].append(item)
+
+            if option is not None:
+                option_data = {
+                    "id": option.id,
+                    "text": option.option_text,
+                    "value": option.option_value,
+                    "input_id": f"{question.question_id}_{re.sub(r'[^a-zA-Z0-9]', '_', option.option_text)}",
+                }
+                questions_by_id[question.id]["options"].append(option_data)
+                self.options[(question.question_id, option.option_text)] = (question.id, option_data)
+                self.option_texts[option.id] = option.option_text
+
+        self.questions_by_pk = questions_by_id
+        self.total_questions = len(self.questions)
+        self.api_sections = [
+            {
+                "title": section["title"],
+                "questions": [
+                    {"id": q["id"], "text": q["text"], "type": q["type"], "options": [o["text"] for o in q["options"]]}
+                    for q in section["questions"]
+                ],
+            }
+            for section in self.sections
+        ]
+        self.version = hashlib.sha256(
+            json.dumps(self.api_sections, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        self.packable = 0 < self.total_questions <= PACKED_MAX_QUESTIONS and all(
+            len(q["options"]) <= len(PACKED_OPTION_CODES) for q in self.questions
         )
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
 
 
-@app.get("/api/export-json")
-async def export_json(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    """Exporta todas as pesquisas concluídas em JSON (estrutura aninhada por pesquisa)."""
+    def expand_answers(self, answers: List[Optional[int]]) -> dict:
+        """Converte respostas compactas (índices de opção) em código -> texto da opção"""
+        if len(answers) != self.total_questions:
+            raise ValueError(f"Esperadas {self.total_questions} respostas, recebidas {len(answers)}")
+        responses = {}
+        for question, option_index in zip(self.questions, answers):
+            if option_index is None:
+                continue
+            if not 0 <= option_index < len(question["options"]):
+                raise ValueError(f"Opção {option_index} inválida para {question['id']}")
+            responses[question["id"]] = question["options"][option_index]["text"]
+        return responses
+
+    def layout_rows(self) -> List[dict]:
+        """Linhas de questionnaire_layouts que decodificam as respostas compactas desta versão"""
+        return [
+            {
+                "version": self.version,
+                "position": position,
+                "answer_code": PACKED_OPTION_CODES[option_index],
+                "question_id": question["pk"],
+                "option_id": option["id"],
+                "option_value": option["value"],
+            }
+            for position, question in enumerate(self.questions, 1)
+            for option_index, option in enumerate(question["options"])
+        ]
+
+    def pack(self, responses: dict) -> tuple[str, list]:
+        """Codifica código -> texto em um caractere por pergunta.
+
+        Retorna (respostas compactas, [(id da pergunta, texto)] das respostas que
+        não correspondem a nenhuma opção).
+        """
+        codes = []
+        free_text = []
+        for question in self.questions:
+            response_text = responses.get(question["id"])
+            if response_text is None:
+                codes.append(PACKED_UNANSWERED)
+                continue
+            match = self.options.get((question["id"], response_text))
+            if match is None:
+                codes.append(PACKED_FREE_TEXT)
+                free_text.append((question["pk"], response_text))
+            else:
+                codes.append(PACKED_OPTION_CODES[question["options"].index(match[1])])
+        return "".join(codes), free_text
+
+    def answer_sections(self, responses) -> List[dict]:
+        """Monta as seções de SurveyDetails a partir de linhas
+        (question_id, option_id, response_value, response_score), na ordem do questionário.
+
+        O texto da resposta vem da opção em cache; ``response_value`` só é usado
+        para respostas que não correspondem a uma opção.
+        """
+        by_question = {row[0]: row for row in responses}
+        sections = []
+        for section in self.sections:
+            items = []
+            for question in section["questions"]:
+                row = by_question.get(question["pk"])
+                if row is None:
+                    continue
+                _question_pk, option_id, response_value, response_score = row
+                items.append({
+                    "questionId": question["id"],
+                    "question": question["text"],
+                    "answer": self.option_texts.get(option_id, response_value),
+                    "score": response_score,
+                })
+            if items:
+                sections.append({"title": section["title"], "items": items})
+        return sections
+
+    def resolve(self, data: SurveyCreate) -> SurveyCreate:
+        """Valida a pesquisa contra esta versão do questionário.
+
+        Respostas compactas são expandidas; chaves que não são perguntas conhecidas
+        são descartadas.
+        """
+        if data.answers is not None:
+            if data.questionnaire_version and data.questionnaire_version != self.version:
+                raise QuestionnaireVersionMismatch(self.version)
+            responses = self.expand_answers(data.answers)
+        else:
+            responses = {code: text for code, text in data.responses.items() if code in self.question_pks}
+        return data.model_copy(update={"responses": responses, "answers": None})
+
+
+class QuestionnaireVersionMismatch(ValueError):
+    """Respostas compactas de uma versão do questionário diferente da atual"""
+
+    def __init__(self, current_version: str):
+        super().__init__(f"Questionário desatualizado; versão atual: {current_version}")
+        self.current_version = current_version
+
+
+class QuestionnaireCache:
+    """Mantém o questionário carregado em memória e relê após o TTL"""
+
+    def __init__(self, ttl: float = QUESTIONNAIRE_CACHE_TTL):
+        self.ttl = ttl
+        self._current: Optional[Questionnaire] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> Questionnaire:
+        current = self._current
+        if current is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return current
+        # Releitura com lock: threads que chegam durante a carga aproveitam o resultado
+        with self._lock:
+            reload = self._current is None or time.monotonic() - self._loaded_at >= self.ttl
+            single_flight.record("questionnaire-reload", shared=not reload)
+            if reload:
+                rows = (
+                    db.query(Question, QuestionOption)
+                    .outerjoin(QuestionOption, QuestionOption.question_id == Question.id)
+                    .order_by(Question.section_order, Question.question_order, QuestionOption.option_order)
+                    .all()
+                )
+                self._current = Questionnaire(rows)
+                self._loaded_at = time.monotonic()
+            return self._current
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._current = None
+
+
+questionnaire_cache = PerDatabase(QuestionnaireCache)
+
+
+class AnswerLayouts:
+    """Layouts das respostas compactas por versão do questionário.
+
+    Um layout nunca muda depois de gravado, então fica em memória sem TTL.
+    """
+
+    def __init__(self):
+        self._layouts: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _decoder(rows) -> dict:
+        """(posição, código, question_id, option_id, valor) -> {(posição, código): (question_id, option_id, valor)}"""
+        return {(position, code): entry for position, code, *entry in rows}
+
+    def register(self, db: Session, questionnaire: Questionnaire) -> None:
+        """Garante que o layout da versão atual está gravado (idempotente)"""
+        if questionnaire.version in self._layouts:
+            return
+        rows = questionnaire.layout_rows()
+        exists = db.query(QuestionnaireLayout.version).filter(
+            QuestionnaireLayout.version == questionnaire.version
+        ).first()
+        if exists is None:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(QuestionnaireLayout), rows)
+            except IntegrityError:
+                pass  # Outro worker gravou o mesmo layout
+        with self._lock:
+            self._layouts[questionnaire.version] = self._decoder(
+                (row["position"], row["answer_code"], row["question_id"], row["option_id"], row["option_value"])
+                for row in rows
+            )
+
+    def get(self, db: Session, version: str) -> dict:
+        layout = self._layouts.get(version)
+        if layout is None:
+            layout = self._decoder(
+                db.query(
+                    QuestionnaireLayout.position, QuestionnaireLayout.answer_code,
+                    QuestionnaireLayout.question_id, QuestionnaireLayout.option_id,
+                    QuestionnaireLayout.option_value,
+                )
+                .filter(QuestionnaireLayout.version == version)
+                .all()
+            )
+            with self._lock:
+                self._layouts[version] = layout
+        return layout
+
+    def unpack(self, db: Session, version: str, packed: str) -> list:
+        """Respostas compactas -> [(question_id, option_id, None, score)]"""
+        layout = self.get(db, version)
+        rows = []
+        for position, code in enumerate(packed, 1):
+            entry = layout.get((position, code))
+            if entry is not None:
+                question_pk, option_id, value = entry
+                rows.append((question_pk, option_id, None, value))
+        return rows
+
+
+answer_layouts = PerDatabase(AnswerLayouts)
+
+
+# ====== DIMENSÕES (ALAS E CIDADES) ======
+
+DIMENSION_CACHE_TTL = float(os.getenv("DIMENSION_CACHE_TTL", "300"))
+
+
+def normalize_dimension_key(text_value: str) -> str:
+    """'U.T.I. ', 'uti', 'UTI' -> 'uti': sem acentos, minúsculas, apenas letras e dígitos"""
+    decomposed = unicodedata.normalize("NFKD", text_value)
+    return re.sub(r"[^a-z0-9]", "", "".join(c for c in decomposed if not unicodedata.combining(c)).lower())
+
+
+def clean_dimension_name(text_value: str) -> str:
+    """Nome de exibição: espaços nas pontas removidos e internos colapsados"""
+    return " ".join(text_value.split())
+
+
+class DimensionCache:
+    """Mapa em memória chave normalizada/alias -> id de uma dimensão (alas ou cidades).
+
+    A submissão resolve o texto digitado sem ir ao banco; chaves novas criam o
+    registro da dimensão. Relê tudo após o TTL para enxergar aliases e
+    registros criados por outros workers.
+    """
+
+    def __init__(self, model, alias_model, alias_target, survey_id_column, survey_name_column,
+                 ttl: float = DIMENSION_CACHE_TTL):
+        self.model = model
+        self.alias_model = alias_model
+        self.alias_target = alias_target  # coluna do alias que aponta para a dimensão
+        self.survey_id_column = survey_id_column
+        self.survey_name_column = survey_name_column
+        self.ttl = ttl
+        self._keys: dict[str, int] = {}
+        self._names: dict[int, str] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session) -> None:
+        keys, names = {}, {}
+        for dimension_id, name, name_key in db.query(self.model.id, self.model.name, self.model.name_key):
+            keys[name_key] = dimension_id
+            names[dimension_id] = name
+        # Aliases têm precedência sobre a chave do próprio registro (registros mesclados)
+        for alias_key, dimension_id in db.query(self.alias_model.alias_key, self.alias_target):
+            keys[alias_key] = dimension_id
+        with self._lock:
+            self._keys, self._names = keys, names
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self, db: Session) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self._load(db)
+
+    def resolve(self, db: Session, text_value: Optional[str]) -> tuple[Optional[int], Optional[str]]:
+        """Texto digitado -> (id, nome canônico); cria o registro se a chave for nova"""
+        if not text_value or not text_value.strip():
+            return None, None
+        key = normalize_dimension_key(text_value)
+        if not key:
+            return None, None
+        self._ensure_fresh(db)
+        dimension_id = self._keys.get(key)
+        if dimension_id is None:
+            self._load(db)
+            dimension_id = self._keys.get(key)
+        if dimension_id is None:
+            # O registro novo só entra no cache na próxima leitura do banco, depois
+            # do commit: se a transação da pesquisa for desfeita, o id não fica órfão
+            name = clean_dimension_name(text_value)
+            try:
+                with db.begin_nested():
+                    row = self.model(name=name, name_key=key)
+                    db.add(row)
+                    db.flush()
+                return row.id, name
+            except IntegrityError:
+                # Outro worker criou a mesma chave
+                self._load(db)
+                dimension_id = self._keys[key]
+        return dimension_id, self._names.get(dimension_id)
+
+    def items(self, db: Session) -> list[tuple[int, str]]:
+        """(id, nome) de todos os registros, ordenados pelo nome"""
+        self._ensure_fresh(db)
+        return sorted(self._names.items(), key=lambda item: item[1].lower())
+
+    def add_alias(self, db: Session, alias_text: str, canonical_text: str) -> int:
+        """Faz ``alias_text`` apontar para ``canonical_text`` e move as pesquisas do
+        registro antigo do alias, se existir. Faz commit; retorna as pesquisas movidas.
+        """
+        self._load(db)
+        canonical_id, canonical_name = self.resolve(db, canonical_text)
+        alias_key = normalize_dimension_key(alias_text)
+        if canonical_id is None or not alias_key:
+            raise ValueError("Alias e nome canônico não podem ser vazios")
+        previous_id = self._keys.get(alias_key)
+        db.merge(self.alias_model(alias_key=alias_key, **{self.alias_target.key: canonical_id}))
+        moved = 0
+        if previous_id is not None and previous_id != canonical_id:
+            moved = db.query(Survey).filter(self.survey_id_column == previous_id).update(
+                {self.survey_id_column: canonical_id, self.survey_name_column: canonical_name},
+                synchronize_session=False
+            )
+            if moved and self.survey_id_column is Survey.ward_id:
+                rebuild_daily_stats(db)  # estatísticas diárias são por ala
+            if moved:
+                rebuild_dimension_stats(db)
+                bump_generation(db, "data")
+        db.commit()
+        if moved and OPTION_CUBE:
+            option_cube.invalidate(db)  # o total de pesquisas não muda, só a ala/cidade
+        self._load(db)
+        return moved
+
+
+ward_dimension = PerDatabase(lambda: DimensionCache(Ward, WardAlias, WardAlias.ward_id, Survey.ward_id, Survey.ward))
+city_dimension = PerDatabase(lambda: DimensionCache(City, CityAlias, CityAlias.city_id, Survey.city_id, Survey.city))
+
+
+# ====== GRAVAÇÃO DE PESQUISAS ======
+
+def save_survey(db: Session, questionnaire: Questionnaire, data: SurveyCreate) -> Survey:
+    """Calcula o score pelo questionário em cache e grava a pesquisa com suas respostas.
+
+    Respostas para perguntas desconhecidas são ignoradas. Respostas que
+    correspondem a uma opção são gravadas apenas com o option_id; as demais
+    guardam o texto, sem score. Com ANSWER_STORAGE=packed, as opções vão para
+    surveys.answers_packed e só as respostas de texto livre geram linhas em
+    survey_responses. Não faz commit.
+    """
+    total_score = 0
+    total_questions = 0
+    rows = []
+
+    for question_code, response_text in data.responses.items():
+        question_pk = questionnaire.question_pks.get(question_code)
+        if question_pk is None:
+            continue
+        match = questionnaire.options.get((question_code, response_text))
+        option_id, score = (match[1]["id"], match[1]["value"]) if match else (None, None)
+        if score is not None:
+            total_score += score
+            total_questions += 1
+        rows.append((question_pk, option_id, None if option_id else response_text, score))
+
+    satisfaction_score = total_score / total_questions if total_questions > 0 else 0
+    scores = [(question_pk, score) for question_pk, _option_id, _text, score in rows if score is not None]
+    if scores:
+        scores.append((OVERALL_QUESTION_ID, satisfaction_score))
+    city_id, city_name = city_dimension.resolve(db, data.city)
+    ward_id, ward_name = ward_dimension.resolve(db, data.ward)
+
+    survey = Survey(
+        patient_name=data.patient_name if not data.is_anonymous else None,
+        is_anonymous=data.is_anonymous,
+        admission_date=data.admission_date,
+        discharge_date=data.discharge_date,
+        length_of_stay_days=data.length_of_stay_days,
+        observations=data.observations,
+        completed=True,
+        satisfaction_score=satisfaction_score,
+        city_id=city_id,
+        city=city_name,
+        ward_id=ward_id,
+        ward=ward_name,
+        client_key=str(data.client_key) if data.client_key else None
+    )
+    if ANSWER_STORAGE == "packed" and questionnaire.packable:
+        answer_layouts.register(db, questionnaire)
+        survey.answers_packed, _free_text = questionnaire.pack(data.responses)
+        survey.questionnaire_version = questionnaire.version
+        rows = [row for row in rows if row[1] is None]
+    db.add(survey)
+    db.flush()  # Para obter o ID
+    record_daily_stats(db, survey.created_at.date(), ward_id, scores)
+    if scores:
+        record_dimension_stats(db, survey.created_at, ward_id, city_id, satisfaction_score)
+
+    db.add_all([
+        SurveyResponse(
+            survey_id=survey.id,
+            question_id=question_pk,
+            option_id=option_id,
+            response_value=response_text,
+            response_score=score
+        )
+        for question_pk, option_id, response_text, score in rows
+    ])
+    return survey
+
+
+def load_answers(db: Session, surveys, *criteria, source: "Optional[ArchiveSource]" = None) -> dict:
+    """Respostas das pesquisas informadas: {survey_id: [(question_id, option_id, texto, score)]}.
+
+    Junta as respostas compactas (decodificadas pelo layout) com as linhas de
+    survey_responses selecionadas por ``criteria`` (filtros sobre a tabela de
+    pesquisas; sem filtros, todas as linhas). ``source`` lê de um mês arquivado.
+    """
+    answers: dict[int, list] = {}
+    for survey in surveys:
+        if survey.answers_packed and survey.questionnaire_version:
+            answers[survey.id] = answer_layouts.unpack(db, survey.questionnaire_version, survey.answers_packed)
+
+    surveys_table, responses_table = (
+        (source.surveys, source.responses) if source else (Survey.__table__, SurveyResponse.__table__)
+    )
+    query = select(
+        responses_table.c.survey_id, responses_table.c.question_id, responses_table.c.option_id,
+        responses_table.c.response_value, responses_table.c.response_score,
+    )
+    if criteria:
+        query = query.join(surveys_table, responses_table.c.survey_id == surveys_table.c.id).where(*criteria)
+    for survey_id, *row in db.execute(query):
+        answers.setdefault(survey_id, []).append(tuple(row))
+    return answers
+
+
+# Chaves de idempotência recentes por worker: reenvios respondem sem ir ao banco
+CLIENT_KEY_CACHE_SIZE = int(os.getenv("CLIENT_KEY_CACHE_SIZE", "10000"))
+recent_client_keys = PerDatabase(OrderedDict)
+
+
+def _remember_client_key(db: Session, client_key: str, survey_id: int) -> None:
+    recent = recent_client_keys.of(db)
+    recent[client_key] = survey_id
+    recent.move_to_end(client_key)
+    while len(recent) > CLIENT_KEY_CACHE_SIZE:
+        recent.popitem(last=False)
+
+
+def _find_by_client_key(db: Session, client_key: str) -> Optional[int]:
+    survey_id = recent_client_keys.of(db).get(client_key)
+    if survey_id is None:
+        survey_id = db.query(Survey.id).filter(Survey.client_key == client_key).scalar()
+        if survey_id is not None:
+            _remember_client_key(db, client_key, survey_id)
+    return survey_id
+
+
+def submit_idempotent(db: Session, questionnaire: Questionnaire, data: SurveyCreate) -> tuple[int, bool]:
+    """Grava a pesquisa e faz commit; retorna (survey_id, reenvio).
+
+    Com ``client_key``, um reenvio devolve o ID original sem recalcular score nem
+    inserir linhas. Dois envios simultâneos da mesma chave são resolvidos pelo
+    índice único: o perdedor desfaz a transação e devolve o ID do vencedor.
+    """
+    client_key = str(data.client_key) if data.client_key else None
+    if client_key:
+        existing = _find_by_client_key(db, client_key)
+        if existing is not None:
+            return existing, True
+
+    data = questionnaire.resolve(data)
     try:
-        surveys = db.query(Survey).filter(Survey.completed == True).order_by(Survey.created_at.desc()).all()
+        survey = save_survey(db, questionnaire, data)
+        saved = (survey.id, survey.created_at, survey.ward_id, survey.city_id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        existing = _find_by_client_key(db, client_key) if client_key else None
+        if existing is None:
+            raise
+        return existing, True
+
+    if client_key:
+        _remember_client_key(db, client_key, survey.id)
+    record_option_cube(db, questionnaire, *saved, data.responses)
+    record_alert_scores(db, questionnaire, saved[2], data.responses)
+    return survey.id, False
+
+
+def dedupe_legacy_surveys(db: Session, window_minutes: int = 30, batch_size: int = 1000) -> int:
+    """Remove pesquisas duplicadas antigas (sem client_key) em lote.
+
+    Duas pesquisas são duplicatas quando têm os mesmos dados do paciente e as
+    mesmas respostas e foram criadas dentro da janela; a mais antiga é mantida.
+    Retorna a quantidade de pesquisas removidas.
+    """
+    window = window_minutes * 60
+    last_seen: dict[str, tuple[int, datetime]] = {}
+    duplicates: list[int] = []
+    duplicate_days: set[date] = set()
+    last_id = 0
+
+    while True:
+        surveys = (
+            db.query(Survey)
+            .filter(Survey.client_key.is_(None), Survey.id > last_id)
+            .order_by(Survey.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not surveys:
+            break
+        last_id = surveys[-1].id
+
+        answers: dict[int, list] = {}
+        for survey_id, question_id, option_id, value in (
+            db.query(
+                SurveyResponse.survey_id, SurveyResponse.question_id,
+                SurveyResponse.option_id, SurveyResponse.response_value,
+            )
+            .filter(SurveyResponse.survey_id.in_([s.id for s in surveys]))
+            .order_by(SurveyResponse.survey_id, SurveyResponse.question_id)
+        ):
+            answers.setdefault(survey_id, []).append((question_id, option_id, value))
 
-        export_payload = []
         for survey in surveys:
-            # Obter respostas da pesquisa com perguntas ordenadas por seção e ordem
-            responses = (
-                db.query(SurveyResponse).join(Question, SurveyResponse.question_id == Question.id)
-                .filter(SurveyResponse.survey_id == survey.id)
-                .order_by(Question.section_order, Question.question_order)
+            fingerprint = hashlib.sha256(repr((
+                survey.patient_name, survey.is_anonymous, survey.admission_date,
+                survey.discharge_date, survey.observations or "", survey.city, survey.ward,
+                survey.answers_packed, answers.get(survey.id, []),
+            )).encode("utf-8")).hexdigest()
+            previous = last_seen.get(fingerprint)
+            if (
+                previous is not None and survey.created_at and previous[1]
+                and (survey.created_at - previous[1]).total_seconds() <= window
+            ):
+                duplicates.append(survey.id)
+                duplicate_days.add(survey.created_at.date())
+            else:
+                last_seen[fingerprint] = (survey.id, survey.created_at)
+        db.expunge_all()
+
+    for start in range(0, len(duplicates), batch_size):
+        chunk = duplicates[start:start + batch_size]
+        db.query(SurveyResponse).filter(SurveyResponse.survey_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(Survey).filter(Survey.id.in_(chunk)).delete(synchronize_session=False)
+        bump_generation(db, "data")
+        db.commit()
+    if duplicate_days:
+        rebuild_daily_stats(db, min(duplicate_days), max(duplicate_days))
+        rebuild_dimension_stats(db, min(duplicate_days))
+        db.commit()
+    return len(duplicates)
+
+
+# ====== RETENÇÃO E ARQUIVO MENSAL ======
+
+# Meses mantidos nas tabelas principais (0 desativa o arquivamento)
+RETENTION_MONTHS = int(os.getenv("RETENTION_MONTHS", "0"))
+# SQLite: um arquivo por mês, anexado (ATTACH) apenas quando a consulta precisa;
+# com vários hospitais, um subdiretório por hospital
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+
+class ArchiveSource:
+    """Tabelas de pesquisas e respostas de um mês arquivado"""
+
+    def __init__(self, month: str, surveys: Table, responses: Table):
+        self.month = month
+        self.surveys = surveys
+        self.responses = responses
+
+
+def month_bounds(month: str) -> tuple[datetime, datetime]:
+    """'2024-01' -> (2024-01-01 00:00, 2024-02-01 00:00)"""
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def _archive_tables(db: Session, month: str) -> ArchiveSource:
+    """Cópias de surveys/survey_responses sem FKs: no MySQL, tabelas por mês
+    (surveys_archive_AAAA_MM); no SQLite, as mesmas tabelas no arquivo anexado."""
+    suffix = month.replace("-", "_")
+    metadata = MetaData()
+    if _is_sqlite(db):
+        schema, names = f"archive_{suffix}", ("surveys", "survey_responses")
+    else:
+        schema, names = None, (f"surveys_archive_{suffix}", f"survey_responses_archive_{suffix}")
+    tables = []
+    for source, name in zip((Survey.__table__, SurveyResponse.__table__), names):
+        columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in source.columns]
+        tables.append(Table(name, metadata, *columns, schema=schema))
+    surveys_table, responses_table = tables
+    Index(None, surveys_table.c.created_at)
+    Index(None, responses_table.c.survey_id)
+    return ArchiveSource(month, surveys_table, responses_table)
+
+
+def _archive_dir(db_or_connection) -> str:
+    return os.path.join(ARCHIVE_DIR, tenants.key_of(db_or_connection)) if tenants.multi else ARCHIVE_DIR
+
+
+def _archive_path(db_or_connection, month: str) -> str:
+    return os.path.join(_archive_dir(db_or_connection), f"surveys_{month.replace('-', '_')}.db")
+
+
+def _attach_archives(connection, sources: List[ArchiveSource]) -> List[str]:
+    """SQLite: anexa os arquivos dos meses à conexão; retorna os nomes anexados"""
+    attached = []
+    if connection.dialect.name != "sqlite":
+        return attached
+    try:
+        for source in sources:
+            path = _archive_path(connection, source.month)
+            if not os.path.exists(path):
+                raise RuntimeError(f"Arquivo do mês {source.month} não encontrado: {path}")
+            connection.exec_driver_sql(f"ATTACH DATABASE ? AS {source.surveys.schema}", (path,))
+            attached.append(source.surveys.schema)
+    except Exception:
+        _detach_archives(connection, attached)
+        raise
+    return attached
+
+
+def _detach_archives(connection, attached: List[str]) -> None:
+    for schema in attached:
+        connection.exec_driver_sql(f"DETACH DATABASE {schema}")
+
+
+@contextmanager
+def open_archives(db: Session, months: List[str]):
+    """Fontes dos meses arquivados para leitura; no SQLite anexa os arquivos
+    durante o bloco (a sessão mantém a mesma conexão até ser fechada)."""
+    sources = [_archive_tables(db, month) for month in months]
+    if not sources:
+        yield sources
+        return
+    connection = db.connection()
+    attached = _attach_archives(connection, sources)
+    try:
+        yield sources
+    finally:
+        _detach_archives(connection, attached)
+
+
+def archived_months_between(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> List[str]:
+    """Meses arquivados que se sobrepõem a [start, end] (datas de created_at), do mais recente ao mais antigo"""
+    query = db.query(ArchivedMonth.month)
+    if start:
+        query = query.filter(ArchivedMonth.month >= start.strftime("%Y-%m"))
+    if end:
+        query = query.filter(ArchivedMonth.month <= end.strftime("%Y-%m"))
+    return [month for (month,) in query.order_by(ArchivedMonth.month.desc())]
+
+
+def archive_month(db: Session, month: str) -> int:
+    """Move as pesquisas criadas em ``month`` para o arquivo e grava os totais do mês.
+
+    Usa uma conexão própria: no SQLite o arquivo precisa ser anexado fora de
+    transação. Cópia, totais e remoção das tabelas principais acontecem em uma
+    transação (o arquivo anexado participa dela). Retorna as pesquisas movidas.
+    """
+    start, end = month_bounds(month)
+    in_month = (Survey.created_at >= start, Survey.created_at < end)
+    source = _archive_tables(db, month)
+
+    if _is_sqlite(db):
+        os.makedirs(_archive_dir(db), exist_ok=True)
+        open(_archive_path(db, month), "ab").close()  # ATTACH exige o arquivo
+
+    with db.get_bind().connect() as connection:
+        attached = _attach_archives(connection, [source])
+        session = Session(bind=connection)
+        try:
+            source.surveys.metadata.create_all(connection)
+            connection.commit()
+
+            count, first_id, last_id, completed, score_sum, score_count = session.query(
+                func.count(Survey.id), func.min(Survey.id), func.max(Survey.id),
+                func.sum(case((Survey.completed == True, 1), else_=0)),
+                func.sum(Survey.satisfaction_score), func.count(Survey.satisfaction_score),
+            ).filter(*in_month).one()
+            if not count:
+                session.rollback()
+                return 0
+
+            score = survey_answers_long.c.response_score
+            question_stats = (
+                session.query(survey_answers_long.c.question_id, func.sum(score), func.count(score))
+                .join(Survey, Survey.id == survey_answers_long.c.survey_id)
+                .filter(*in_month, score.isnot(None))
+                .group_by(survey_answers_long.c.question_id)
                 .all()
             )
 
-            sections: dict[str, dict] = {}
-            for resp in responses:
-                section_title = resp.question.section_title
-                if section_title not in sections:
-                    sections[section_title] = {"title": section_title, "items": []}
-                sections[section_title]["items"].append({
-                    "questionId": resp.question.question_id,
-                    "question": resp.question.question_text,
-                    "answer": resp.response_value,
-                    "score": resp.response_score,
-                })
+            survey_ids = select(Survey.id).where(*in_month)
+            survey_columns = [c.name for c in Survey.__table__.columns]
+            response_columns = [c.name for c in SurveyResponse.__table__.columns]
+            session.execute(source.surveys.insert().from_select(
+                survey_columns, select(*[Survey.__table__.c[name] for name in survey_columns]).where(*in_month)
+            ))
+            session.execute(source.responses.insert().from_select(
+                response_columns,
+                select(*[SurveyResponse.__table__.c[name] for name in response_columns])
+                .where(SurveyResponse.survey_id.in_(survey_ids))
+            ))
+
+            archived = session.get(ArchivedMonth, month)
+            if archived is None:
+                archived = ArchivedMonth(
+                    month=month, first_id=first_id, last_id=last_id, surveys=0, completed=0,
+                    score_sum=0, score_count=0
+                )
+                session.add(archived)
+            archived.first_id = min(archived.first_id, first_id)
+            archived.last_id = max(archived.last_id, last_id)
+            archived.surveys += count
+            archived.completed += completed or 0
+            archived.score_sum += score_sum or 0
+            archived.score_count += score_count
+            session.flush()
+            for question_pk, question_sum, question_count in question_stats:
+                stat = session.get(ArchivedQuestionStat, (month, question_pk))
+                if stat is None:
+                    session.add(ArchivedQuestionStat(
+                        month=month, question_id=question_pk, score_sum=question_sum, score_count=question_count
+                    ))
+                else:
+                    stat.score_sum += question_sum
+                    stat.score_count += question_count
+
+            session.execute(delete(SurveyResponse.__table__).where(SurveyResponse.survey_id.in_(survey_ids)))
+            session.execute(delete(Survey.__table__).where(*in_month))
+            bump_generation(session, "data")
+            session.commit()
+            return count
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            _detach_archives(connection, attached)
+
+
+def iter_surveys_with_answers(db: Session, start: Optional[date] = None, end: Optional[date] = None,
+                              completed_only: bool = False):
+    """(pesquisa, respostas) das tabelas principais e dos meses arquivados do período,
+    da mais recente para a mais antiga. ``start``/``end`` filtram created_at (inclusive).
+    Meses arquivados fora do período não são abertos.
+    """
+    def conditions(surveys_table):
+        where = []
+        if start:
+            where.append(surveys_table.c.created_at >= datetime(start.year, start.month, start.day))
+        if end:
+            where.append(surveys_table.c.created_at < datetime(end.year, end.month, end.day) + timedelta(days=1))
+        if completed_only:
+            where.append(surveys_table.c.completed == True)
+        return where
+
+    with open_archives(db, archived_months_between(db, start, end)) as archives:
+        for surveys_table, source in [(Survey.__table__, None)] + [(a.surveys, a) for a in archives]:
+            where = conditions(surveys_table)
+            surveys = db.execute(
+                select(surveys_table).where(*where)
+                .order_by(surveys_table.c.created_at.desc(), surveys_table.c.id)
+            ).all()
+            answers = load_answers(db, surveys, *where, source=source)
+            for survey in surveys:
+                yield survey, answers.get(survey.id, [])
+
+
+def find_survey(db: Session, survey_id: int):
+    """(pesquisa, respostas) das tabelas principais ou do arquivo, ou None"""
+    survey = db.query(Survey).filter(Survey.id == survey_id).first()
+    if survey is not None:
+        return survey, load_answers(db, [survey], Survey.id == survey_id).get(survey_id, [])
+    return find_archived_survey(db, survey_id)
+
+
+def find_archived_survey(db: Session, survey_id: int):
+    """(pesquisa, respostas) de uma pesquisa arquivada, ou None"""
+    months = [
+        month for (month,) in db.query(ArchivedMonth.month)
+        .filter(ArchivedMonth.first_id <= survey_id, ArchivedMonth.last_id >= survey_id)
+    ]
+    with open_archives(db, months) as archives:
+        for source in archives:
+            survey = db.execute(select(source.surveys).where(source.surveys.c.id == survey_id)).first()
+            if survey is not None:
+                where = source.surveys.c.id == survey_id
+                return survey, load_answers(db, [survey], where, source=source).get(survey_id, [])
+    return None
 
-            export_payload.append({
-                "id": survey.id,
-                "createdAt": survey.created_at.isoformat() if survey.created_at else "",
-                "patient": None if survey.is_anonymous else (survey.patient_name or ""),
-                "isAnonymous": survey.is_anonymous,
-                "admissionDate": survey.admission_date,
-                "dischargeDate": survey.discharge_date,
-                "city": survey.city or "",
-                "ward": survey.ward or "",
-                "observations": survey.observations or "",
-                "satisfactionScore": survey.satisfaction_score or 0,
-                "sections": list(sections.values()),
-            })
 
-        # Serializar para JSON e retornar como download
-        json_str = json.dumps(export_payload, ensure_ascii=False, indent=2)
-        buffer = io.BytesIO(json_str.encode("utf-8"))
+def survey_score_sums(db: Session) -> tuple[int, float, int]:
+    """(pesquisas concluídas, soma e contagem dos scores) das tabelas principais e dos meses arquivados"""
+    hot = db.query(
+        func.sum(case((Survey.completed == True, 1), else_=0)),
+        func.sum(Survey.satisfaction_score), func.count(Survey.satisfaction_score),
+    ).one()
+    archived = db.query(
+        func.sum(ArchivedMonth.completed), func.sum(ArchivedMonth.score_sum), func.sum(ArchivedMonth.score_count),
+    ).one()
+    completed = (hot[0] or 0) + (archived[0] or 0)
+    score_sum = (hot[1] or 0) + (archived[1] or 0)
+    score_count = (hot[2] or 0) + (archived[2] or 0)
+    return completed, score_sum, score_count
+
+
+def survey_totals(db: Session) -> tuple[int, float]:
+    """(pesquisas concluídas, satisfação média) somando as tabelas principais e os meses arquivados"""
+    completed, score_sum, score_count = survey_score_sums(db)
+    return completed, (score_sum / score_count if score_count else 0)
+
+
+def section_score_sums(db: Session, questionnaire: Questionnaire) -> dict[str, list]:
+    """{seção: [soma, contagem]} dos scores: uma agregação por pergunta sobre a visão
+    longa (linhas e respostas compactas) mais as estatísticas dos meses arquivados"""
+    totals = {section["title"]: [0, 0] for section in questionnaire.sections}
+    score = survey_answers_long.c.response_score
+    hot_stats = (
+        db.query(survey_answers_long.c.question_id, func.sum(score), func.count(score))
+        .filter(score.isnot(None))
+        .group_by(survey_answers_long.c.question_id)
+        .all()
+    )
+    archived_stats = (
+        db.query(
+            ArchivedQuestionStat.question_id,
+            func.sum(ArchivedQuestionStat.score_sum), func.sum(ArchivedQuestionStat.score_count),
+        )
+        .group_by(ArchivedQuestionStat.question_id)
+        .all()
+    )
+    for question_pk, score_sum, score_count in hot_stats + archived_stats:
+        question = questionnaire.questions_by_pk.get(question_pk)
+        if question is not None:
+            totals[question["section"]][0] += score_sum
+            totals[question["section"]][1] += score_count
+    return totals
+
+
+def average_scores(totals: dict[str, list]) -> dict[str, float]:
+    """{seção: [soma, contagem]} -> {seção: média arredondada}"""
+    return {
+        title: round(score_sum / score_count, 2) if score_count else 0
+        for title, (score_sum, score_count) in totals.items()
+    }
+
+
+def archive_expired(db: Session, retention_months: int = RETENTION_MONTHS) -> List[tuple[str, int]]:
+    """Arquiva, mês a mês, as pesquisas anteriores ao horizonte de retenção"""
+    if retention_months <= 0:
+        return []
+    today = date.today()
+    months_back = today.year * 12 + today.month - 1 - retention_months
+    cutoff = datetime(months_back // 12, months_back % 12 + 1, 1)
+
+    archived = []
+    while True:
+        oldest = db.query(func.min(Survey.created_at)).filter(Survey.created_at < cutoff).scalar()
+        db.commit()
+        if oldest is None:
+            break
+        month = oldest.strftime("%Y-%m")
+        archived.append((month, archive_month(db, month)))
+    return archived
+
+
+# ====== ESTATÍSTICAS DIÁRIAS E COMPARAÇÕES ======
+
+OVERALL_QUESTION_ID = 0  # linha de survey_daily_stats com a satisfação geral
+FAVORABLE_SCORE = 4      # score mínimo de uma resposta favorável (top-2-box)
+
+
+def _stats_upsert(db: Session, model, rows: List[dict]):
+    """INSERT que soma às linhas existentes (SQLite: ON CONFLICT; MySQL: ON DUPLICATE KEY);
+    as colunas fora da chave primária são somadas"""
+    table_ = model.__table__
+    keys = [c.name for c in table_.primary_key.columns]
+    summed = [c.name for c in table_.columns if not c.primary_key]
+    if _is_sqlite(db):
+        stmt = sqlite_insert(table_).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={name: table_.c[name] + stmt.excluded[name] for name in summed},
+        )
+    stmt = mysql_insert(table_).values(rows)
+    return stmt.on_duplicate_key_update({name: table_.c[name] + stmt.inserted[name] for name in summed})
+
+
+def _insert_ignore(db: Session, model, rows: List[dict]):
+    """INSERT que ignora as linhas cuja chave primária já existe
+    (SQLite: ON CONFLICT DO NOTHING; MySQL: INSERT IGNORE)"""
+    if _is_sqlite(db):
+        return sqlite_insert(model.__table__).values(rows).on_conflict_do_nothing()
+    return mysql_insert(model.__table__).values(rows).prefix_with("IGNORE")
+
+
+def record_daily_stats(db: Session, day: date, ward_id: Optional[int], scores: List[tuple]) -> None:
+    """Soma os scores de uma pesquisa às estatísticas do dia (uma instrução; sem commit)"""
+    if not scores:
+        return
+    rows = [
+        {
+            "day": day, "ward_id": ward_id or 0, "question_id": question_pk, "responses": 1,
+            "score_sum": score, "score_sq_sum": score * score, "favorable": int(score >= FAVORABLE_SCORE),
+        }
+        for question_pk, score in scores
+    ]
+    db.execute(_stats_upsert(db, SurveyDailyStat, rows))
+
+
+def rebuild_daily_stats(db: Session, start: Optional[date] = None, end: Optional[date] = None) -> None:
+    """Recalcula, a partir das tabelas principais, os dias [start, end] (padrão: todos os dias
+    ainda não arquivados). Usado após remoções e fusões de alas; sem commit."""
+    if start is None:
+        oldest = db.query(func.min(Survey.created_at)).scalar()
+        if oldest is None:
+            return
+        start = oldest.date()
+    end = end or date.max
+    low = datetime(start.year, start.month, start.day)
+    in_days = [Survey.created_at >= low]
+    if end < date.max:
+        in_days.append(Survey.created_at < datetime(end.year, end.month, end.day) + timedelta(days=1))
+
+    stats = SurveyDailyStat.__table__
+    db.execute(delete(stats).where(stats.c.day >= start, stats.c.day <= end))
+
+    day = func.date(Survey.created_at)
+    ward = func.coalesce(Survey.ward_id, 0)
+    columns = ["day", "ward_id", "question_id", "responses", "score_sum", "score_sq_sum", "favorable"]
+
+    def sums(score):
+        return (
+            func.count(), func.sum(score), func.sum(score * score),
+            func.sum(case((score >= FAVORABLE_SCORE, 1), else_=0)),
+        )
+
+    score = survey_answers_long.c.response_score
+    db.execute(stats.insert().from_select(columns, (
+        select(day, ward, survey_answers_long.c.question_id, *sums(score))
+        .select_from(survey_answers_long.join(Survey, Survey.id == survey_answers_long.c.survey_id))
+        .where(*in_days, score.isnot(None))
+        .group_by(day, ward, survey_answers_long.c.question_id)
+    )))
+    # Satisfação geral: pesquisas com ao menos uma resposta pontuada (score > 0)
+    overall = Survey.satisfaction_score
+    db.execute(stats.insert().from_select(columns, (
+        select(day, ward, literal(OVERALL_QUESTION_ID), *sums(overall))
+        .where(*in_days, overall > 0)
+        .group_by(day, ward)
+    )))
+
+
+def record_dimension_stats(db: Session, created_at: datetime, ward_id: Optional[int], city_id: Optional[int],
+                           satisfaction_score: float) -> None:
+    """Soma a satisfação de uma pesquisa aos totais do mês da ala e da cidade (sem commit)"""
+    month = created_at.strftime("%Y-%m")
+    db.execute(_stats_upsert(db, DimensionScoreStat, [
+        {
+            "month": month, "dimension": dimension, "dimension_id": dimension_id or 0, "surveys": 1,
+            "score_sum": satisfaction_score, "score_sq_sum": satisfaction_score * satisfaction_score,
+        }
+        for dimension, dimension_id in (("ward", ward_id), ("city", city_id))
+    ]))
+
+
+def rebuild_dimension_stats(db: Session, start: Optional[date] = None) -> None:
+    """Recalcula os meses a partir do de ``start`` (padrão: o mais antigo não arquivado)
+    com as tabelas principais; meses arquivados não são tocados. Sem commit."""
+    if start is None:
+        oldest = db.query(func.min(Survey.created_at)).scalar()
+        if oldest is None:
+            return
+        start = oldest.date()
+    first_month = start.strftime("%Y-%m")
+    db.query(DimensionScoreStat).filter(DimensionScoreStat.month >= first_month).delete(synchronize_session=False)
+
+    year, month = extract("year", Survey.created_at), extract("month", Survey.created_at)
+    score = Survey.satisfaction_score
+    totals: dict[tuple, list] = {}
+    for dimension, column in (("ward", Survey.ward_id), ("city", Survey.city_id)):
+        dimension_id = func.coalesce(column, 0)
+        rows = (
+            db.query(year, month, dimension_id, func.count(), func.sum(score), func.sum(score * score))
+            .filter(Survey.created_at >= datetime(start.year, start.month, 1), score > 0)
+            .group_by(year, month, dimension_id)
+        )
+        for row_year, row_month, row_id, surveys, score_sum, score_sq_sum in rows:
+            totals[(f"{int(row_year):04d}-{int(row_month):02d}", dimension, row_id)] = [surveys, score_sum, score_sq_sum]
+    if totals:
+        db.execute(insert(DimensionScoreStat.__table__), [
+            {"month": key[0], "dimension": key[1], "dimension_id": key[2],
+             "surveys": values[0], "score_sum": values[1], "score_sq_sum": values[2]}
+            for key, values in totals.items()
+        ])
+
+
+class SampleStats:
+    """n, soma, soma dos quadrados e favoráveis de uma amostra de scores"""
+
+    def __init__(self, n: int = 0, total: float = 0.0, squares: float = 0.0, favorable: int = 0):
+        self.n, self.total, self.squares, self.favorable = n, total, squares, favorable
+
+    def add(self, n, total, squares, favorable) -> None:
+        self.n += n or 0
+        self.total += total or 0
+        self.squares += squares or 0
+        self.favorable += favorable or 0
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.n if self.n else None
+
+    @property
+    def variance(self) -> Optional[float]:
+        if self.n < 2:
+            return None
+        return max(0.0, (self.squares - self.total * self.total / self.n) / (self.n - 1))
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Fração contínua da beta incompleta (Numerical Recipes)"""
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 200):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1.0) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Beta incompleta regularizada I_x(a, b)"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1 - x) / b
+
+
+def t_test_p_value(t: float, df: float) -> float:
+    """p bilateral da distribuição t de Student"""
+    return _betainc(df / 2, 0.5, df / (df + t * t))
+
+
+def t_critical(df: float, confidence: float = 0.95) -> float:
+    """Valor crítico bilateral da t de Student (bisseção sobre o p-valor)"""
+    alpha = 1 - confidence
+    low, high = 0.0, 1000.0
+    for _ in range(100):
+        middle = (low + high) / 2
+        if t_test_p_value(middle, df) > alpha:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def compare_samples(a: SampleStats, b: SampleStats, confidence: float = 0.95) -> dict:
+    """Diferença de médias B - A com IC e teste t de Welch; qui-quadrado (2x2) das
+    proporções de respostas favoráveis. Tudo a partir das estatísticas suficientes."""
+    result = {
+        "delta": None, "ciLow": None, "ciHigh": None, "t": None, "df": None, "pValue": None,
+        "chiSquare": None, "chiSquarePValue": None,
+    }
+    if a.n and b.n:
+        result["delta"] = round(b.mean - a.mean, 4)
+    if a.variance is not None and b.variance is not None:
+        va, vb = a.variance / a.n, b.variance / b.n
+        se = math.sqrt(va + vb)
+        if se > 0:
+            df = (va + vb) ** 2 / (va ** 2 / (a.n - 1) + vb ** 2 / (b.n - 1))
+            t = (b.mean - a.mean) / se
+            margin = t_critical(df, confidence) * se
+            result.update(
+                ciLow=round(b.mean - a.mean - margin, 4), ciHigh=round(b.mean - a.mean + margin, 4),
+                t=round(t, 4), df=round(df, 2), pValue=round(t_test_p_value(t, df), 6),
+            )
+    total = a.n + b.n
+    favorable = a.favorable + b.favorable
+    if a.n and b.n and 0 < favorable < total:
+        chi2 = 0.0
+        for sample in (a, b):
+            for observed, column in ((sample.favorable, favorable), (sample.n - sample.favorable, total - favorable)):
+                expected = sample.n * column / total
+                chi2 += (observed - expected) ** 2 / expected
+        result.update(chiSquare=round(chi2, 4), chiSquarePValue=round(math.erfc(math.sqrt(chi2 / 2)), 6))
+    return result
+
+
+def period_stats(db: Session, start: date, end: date, ward_id: Optional[int] = None) -> dict[int, SampleStats]:
+    """{question_id: SampleStats} de um período, somando as linhas diárias (O(dias), sem ler respostas)"""
+    stats = SurveyDailyStat
+    query = db.query(
+        stats.question_id, func.sum(stats.responses), func.sum(stats.score_sum),
+        func.sum(stats.score_sq_sum), func.sum(stats.favorable),
+    ).filter(stats.day >= start, stats.day <= end)
+    if ward_id is not None:
+        query = query.filter(stats.ward_id == ward_id)
+    result = {}
+    for question_pk, *sums in query.group_by(stats.question_id):
+        result.setdefault(question_pk, SampleStats()).add(*sums)
+    return result
+
+
+# ====== CUBO DE CONTAGENS DAS OPÇÕES ======
+
+# Contagem das opções escolhidas por (mês, ala, cidade, pergunta, opção) em um array
+# NumPy mapeado em arquivo: os workers compartilham as mesmas páginas e um reinício
+# apenas remapeia os arquivos. Sem NumPy (ou com OPTION_CUBE=0), as distribuições
+# saem de um GROUP BY no banco.
+OPTION_CUBE = os.getenv("OPTION_CUBE", "1") == "1" and np is not None
+# Diretório dos arquivos do cubo; com vários hospitais, um subdiretório por hospital
+CUBE_DIR = os.getenv("CUBE_DIR", "cube")
+# Intervalo (segundos) entre conferências do total do cubo com o banco
+OPTION_CUBE_CHECK_INTERVAL = float(os.getenv("OPTION_CUBE_CHECK_INTERVAL", "5"))
+# Cidades com eixo próprio no cubo (as de mais pesquisas); as demais, inclusive as
+# digitadas depois da montagem, somam em uma única posição "outras"
+OPTION_CUBE_CITIES = int(os.getenv("OPTION_CUBE_CITIES", "50"))
+
+
+@contextmanager
+def _file_lock(path: str, exclusive: bool):
+    """Trava entre processos (flock) sobre ``path``, liberada ao fechar o arquivo"""
+    with open(path, "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _month_key(created_at: datetime) -> str:
+    return created_at.strftime("%Y-%m")
+
+
+class OptionCube:
+    """Cubo de contagens de um banco, em três arquivos no diretório do hospital:
+
+    - ``counts.npy``: int32, mês x ala x cidade x pergunta x opção
+    - ``axes.json``: rótulos de cada eixo e versão do questionário
+    - ``state.npy``: (geração, pesquisas contadas ou -1 se defasado, maior id contado)
+
+    Cobre apenas as tabelas principais. O eixo de cidades guarda só as
+    OPTION_CUBE_CITIES cidades com mais pesquisas e uma última posição com a soma
+    das demais; o filtro por uma cidade fora do eixo cai no GROUP BY do banco.
+
+    Cada submissão soma 1 nas células das opções escolhidas. Se a pesquisa não
+    cabe nos eixos (mês ou ala nova), o cubo só é marcado como defasado; quem
+    refaz (um único GROUP BY) é a próxima leitura ou ``manage.py cube``, também
+    quando o total diverge do banco (remoções, arquivamento, gravações de outro
+    processo sem o cubo). A geração avisa os demais workers para remapear os arquivos.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._directory = None
+        self._state = None
+        self._counts = None
+        self._generation = 0
+        self._checked_at = None
+        self._version = None
+        self._months: list[str] = []
+        self._month_index: dict[str, int] = {}
+        self._wards: dict[int, int] = {}
+        self._cities: dict[int, int] = {}
+        self._other_city = 0
+        self._options: dict[int, tuple] = {}  # id da opção -> (índice da pergunta, índice da opção)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def _open(self, db: Session) -> None:
+        if self._state is not None:
+            return
+        self._directory = os.path.join(CUBE_DIR, tenants.key_of(db)) if tenants.multi else CUBE_DIR
+        os.makedirs(self._directory, exist_ok=True)
+        with _file_lock(self._path("lock"), exclusive=True):
+            if not os.path.exists(self._path("state.npy")):
+                np.lib.format.open_memmap(self._path("state.npy"), mode="w+", dtype=np.int64, shape=(3,)).flush()
+        self._state = np.load(self._path("state.npy"), mmap_mode="r+")
+
+    def _remap(self) -> None:
+        """Recarrega eixos e contagens se outro worker refez o cubo"""
+        generation = int(self._state[0])
+        if generation == self._generation:
+            return
+        with open(self._path("axes.json"), encoding="utf-8") as fh:
+            axes = json.load(fh)
+        self._counts = np.load(self._path("counts.npy"), mmap_mode="r+")
+        self._version = axes["version"]
+        self._months = axes["months"]
+        self._month_index = {month: index for index, month in enumerate(self._months)}
+        self._wards = {ward_id: index for index, ward_id in enumerate(axes["wards"])}
+        self._cities = {city_id: index for index, city_id in enumerate(axes["cities"])}
+        self._other_city = len(axes["cities"])
+        self._options = {int(option_id): tuple(cell) for option_id, cell in axes["options"].items()}
+        self._generation = generation
+
+    def _current(self, db: Session, questionnaire: Questionnaire) -> bool:
+        """Montado para o questionário atual e com o mesmo total de pesquisas do banco
+        (conferido no máximo a cada OPTION_CUBE_CHECK_INTERVAL segundos)"""
+        self._remap()
+        if not self._generation or self._version != questionnaire.version or self._state[1] < 0:
+            return False
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < OPTION_CUBE_CHECK_INTERVAL:
+            return True
+        surveys, last_id = db.query(func.count(Survey.id), func.max(Survey.id)).one()
+        current = (int(self._state[1]), int(self._state[2])) == (surveys, last_id or 0)
+        self._checked_at = now if current else None
+        return current
+
+    def _rebuild(self, db: Session, questionnaire: Questionnaire) -> None:
+        """Monta o cubo com um GROUP BY por (mês, ala, cidade, opção); requer a trava exclusiva"""
+        started = time.perf_counter()
+        surveys, last_id = db.query(func.count(Survey.id), func.max(Survey.id)).one()
+        last_id = last_id or 0
+        year, month = extract("year", Survey.created_at), extract("month", Survey.created_at)
+        ward, city = func.coalesce(Survey.ward_id, 0), func.coalesce(Survey.city_id, 0)
+        option = survey_answers_long.c.option_id
+        rows = db.execute(
+            select(year, month, ward, city, option, func.count())
+            .select_from(survey_answers_long.join(Survey, Survey.id == survey_answers_long.c.survey_id))
+            .where(Survey.id <= last_id, option.isnot(None))
+            .group_by(year, month, ward, city, option)
+        ).all()
+
+        options = {
+            option_data["id"]: (question_index, option_index)
+            for question_index, question in enumerate(questionnaire.questions)
+            for option_index, option_data in enumerate(question["options"])
+        }
+        # Eixos com todas as alas/cidades conhecidas e o mês corrente: novas
+        # submissões raramente exigem refazer o cubo
+        months = sorted({f"{int(y):04d}-{int(m):02d}" for y, m, *_ in rows} | {_month_key(datetime.utcnow())})
+        wards = [0] + sorted(({w for w, _ in ward_dimension.items(db)} | {row[2] for row in rows}) - {0})
+        # Cidades são digitadas livremente: só as mais frequentes ganham posição própria
+        city_answers = Counter()
+        for *_, c, _o, n in rows:
+            city_answers[c] += n
+        top = [c for c, _n in city_answers.most_common(OPTION_CUBE_CITIES + 1) if c][:OPTION_CUBE_CITIES]
+        cities = [0] + sorted(top)
+        width = max((len(question["options"]) for question in questionnaire.questions), default=0)
+        shape = (len(months), len(wards), len(cities) + 1, len(questionnaire.questions), max(width, 1))
+
+        month_index = {value: index for index, value in enumerate(months)}
+        ward_index = {value: index for index, value in enumerate(wards)}
+        city_index = {value: index for index, value in enumerate(cities)}
+        cells = [
+            (month_index[f"{int(y):04d}-{int(m):02d}"], ward_index[w], city_index.get(c, len(cities)), *options[o], n)
+            for y, m, w, c, o, n in rows if o in options
+        ]
+
+        temporary = self._path("counts.npy.tmp")
+        counts = np.lib.format.open_memmap(temporary, mode="w+", dtype=np.int32, shape=shape)
+        if cells:
+            index = np.array(cells, dtype=np.int64).T
+            np.add.at(counts, tuple(index[:5]), index[5])  # várias cidades caem em "outras"
+        counts.flush()
+        del counts
+        os.replace(temporary, self._path("counts.npy"))
+        with open(self._path("axes.json.tmp"), "w", encoding="utf-8") as fh:
+            json.dump({
+                "version": questionnaire.version, "months": months, "wards": wards, "cities": cities,
+                "options": {str(option_id): cell for option_id, cell in options.items()},
+            }, fh)
+        os.replace(self._path("axes.json.tmp"), self._path("axes.json"))
+
+        self._state[:] = (int(self._state[0]) + 1, surveys, last_id)
+        self._state.flush()
+        self._remap()
+        print(
+            f"Cubo de opções montado: {len(months)} meses x {len(wards)} alas x {len(cities)} cidades (+ outras) "
+            f"({surveys} pesquisas) em {time.perf_counter() - started:.2f}s"
+        )
+
+    def rebuild(self, db: Session, questionnaire: Questionnaire, force: bool = True) -> None:
+        """Refaz o cubo a partir das tabelas principais (com ``force=False``, só se estiver defasado)"""
+        with self._lock:
+            self._open(db)
+            with _file_lock(self._path("lock"), exclusive=True):
+                if force or not self._current(db, questionnaire):
+                    self._rebuild(db, questionnaire)
+
+    def invalidate(self, db: Session) -> None:
+        """Força a reconstrução na próxima leitura (ex.: pesquisas movidas entre alas)"""
+        with self._lock:
+            self._open(db)
+            with _file_lock(self._path("lock"), exclusive=True):
+                self._state[1] = -1
+
+    def add(self, db: Session, questionnaire: Questionnaire, survey_id: int, created_at: datetime,
+            ward_id: Optional[int], city_id: Optional[int], option_ids: List[int]) -> None:
+        """Soma uma pesquisa já gravada (após o commit) às células das opções escolhidas.
+
+        Nunca refaz o cubo (roda no caminho da submissão): mês ou ala fora dos
+        eixos apenas marca o cubo como defasado para a próxima leitura."""
+        with self._lock:
+            self._open(db)
+            with _file_lock(self._path("lock"), exclusive=True):
+                self._remap()
+                if not self._generation or self._version != questionnaire.version or self._state[1] < 0:
+                    return  # a próxima leitura monta o cubo
+                if survey_id <= self._state[2]:
+                    return  # já contada pela montagem que leu o banco depois do commit
+                month, ward = self._month_index.get(_month_key(created_at)), self._wards.get(ward_id or 0)
+                if month is None or ward is None:
+                    self._state[1] = -1
+                    return
+                cell = (month, ward, self._cities.get(city_id or 0, self._other_city))
+                for option_id in option_ids:
+                    found = self._options.get(option_id)
+                    if found is not None:
+                        self._counts[cell + found] += 1
+                self._state[1] += 1
+                self._state[2] = max(int(self._state[2]), survey_id)
+
+    def counts(self, db: Session, questionnaire: Questionnaire, start_month: Optional[str],
+               end_month: Optional[str], ward_id: Optional[int],
+               city_id: Optional[int]) -> Optional[dict[int, int]]:
+        """{id da opção: contagem} no recorte, somando uma fatia do cubo; None se a
+        cidade do filtro não tem posição própria no eixo"""
+        with self._lock:
+            self._open(db)
+            with _file_lock(self._path("lock"), exclusive=False):
+                current = self._current(db, questionnaire)
+            if not current:
+                self.rebuild(db, questionnaire, force=False)
+            with _file_lock(self._path("lock"), exclusive=False):
+                self._remap()
+                months = slice(
+                    bisect.bisect_left(self._months, start_month) if start_month else 0,
+                    bisect.bisect_right(self._months, end_month) if end_month else len(self._months),
+                )
+                if city_id is not None and city_id not in self._cities:
+                    return None
+                selected = []
+                for index, key in ((self._wards, ward_id), (self._cities, city_id)):
+                    if key is None:
+                        selected.append(slice(None))
+                    elif key in index:
+                        selected.append(slice(index[key], index[key] + 1))
+                    else:
+                        return {}
+                totals = self._counts[months, selected[0], selected[1]].sum(axis=(0, 1, 2))
+                return {option_id: int(totals[cell]) for option_id, cell in self._options.items()}
+
+
+option_cube = PerDatabase(OptionCube)
+
+
+def record_option_cube(db: Session, questionnaire: Questionnaire, survey_id: int, created_at: datetime,
+                       ward_id: Optional[int], city_id: Optional[int], responses: dict) -> None:
+    """Atualiza o cubo após gravar uma pesquisa; uma falha aqui não afeta a submissão"""
+    if not OPTION_CUBE:
+        return
+    option_ids = []
+    for question_code, response_text in responses.items():
+        match = questionnaire.options.get((question_code, response_text))
+        if match is not None:
+            option_ids.append(match[1]["id"])
+    try:
+        option_cube.add(db, questionnaire, survey_id, created_at, ward_id, city_id, option_ids)
+    except Exception as e:
+        print(f"Cubo de opções não atualizado (será refeito na próxima leitura): {e}")
+
+
+def option_counts(db: Session, start_month: Optional[str], end_month: Optional[str],
+                  ward_id: Optional[int], city_id: Optional[int]) -> dict[int, int]:
+    """{id da opção: contagem} das tabelas principais com GROUP BY (sem o cubo)"""
+    option = survey_answers_long.c.option_id
+    query = (
+        db.query(option, func.count())
+        .select_from(survey_answers_long)
+        .join(Survey, Survey.id == survey_answers_long.c.survey_id)
+        .filter(option.isnot(None))
+    )
+    if start_month:
+        query = query.filter(Survey.created_at >= month_bounds(start_month)[0])
+    if end_month:
+        query = query.filter(Survey.created_at < month_bounds(end_month)[1])
+    if ward_id is not None:
+        query = query.filter(func.coalesce(Survey.ward_id, 0) == ward_id)
+    if city_id is not None:
+        query = query.filter(func.coalesce(Survey.city_id, 0) == city_id)
+    return dict(query.group_by(option).all())
+
+
+# ====== ANÁLISE DE FATORES (KEY DRIVERS) ======
+
+# Acima deste número de pesquisas, o cálculo vai para um pool de processos e não
+# disputa o GIL com as requisições do worker
+DRIVERS_PROCESS_THRESHOLD = int(os.getenv("DRIVERS_PROCESS_THRESHOLD", "20000"))
+DRIVERS_PROCESSES = int(os.getenv("DRIVERS_PROCESSES", "2"))
+# Resultados guardados por (hospital, filtros, versão dos dados)
+DRIVERS_CACHE_SIZE = int(os.getenv("DRIVERS_CACHE_SIZE", "64"))
+
+driver_results = ResultCache("drivers", DRIVERS_CACHE_SIZE)
+driver_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def score_matrix(db: Session, questionnaire: Questionnaire, start: Optional[date], end: Optional[date],
+                 ward_id: Optional[int], city_id: Optional[int]) -> tuple[list, "np.ndarray"]:
+    """(perguntas pontuadas, matriz pesquisa x pergunta com os scores e NaN onde não
+    houve resposta) das tabelas principais, no recorte de datas de criação, ala e cidade"""
+    questions = [q for q in questionnaire.questions if any(o["value"] is not None for o in q["options"])]
+    score = survey_answers_long.c.response_score
+    query = (
+        select(survey_answers_long.c.survey_id, survey_answers_long.c.question_id, score)
+        .select_from(survey_answers_long.join(Survey, Survey.id == survey_answers_long.c.survey_id))
+        .where(score.isnot(None), survey_answers_long.c.question_id.in_([q["pk"] for q in questions]))
+    )
+    if start is not None:
+        query = query.where(Survey.created_at >= datetime(start.year, start.month, start.day))
+    if end is not None:
+        query = query.where(Survey.created_at < datetime(end.year, end.month, end.day) + timedelta(days=1))
+    if ward_id is not None:
+        query = query.where(func.coalesce(Survey.ward_id, 0) == ward_id)
+    if city_id is not None:
+        query = query.where(func.coalesce(Survey.city_id, 0) == city_id)
+
+    rows = np.array(db.execute(query).all(), dtype=float).reshape(-1, 3)
+    _surveys, row_index = np.unique(rows[:, 0], return_inverse=True)
+    column_of = {q["pk"]: index for index, q in enumerate(questions)}
+    columns = np.array([column_of[int(pk)] for pk in rows[:, 1]], dtype=np.int64)
+    matrix = np.full((len(_surveys), len(questions)), np.nan)
+    matrix[row_index, columns] = rows[:, 2]
+    return questions, matrix
+
+
+def key_driver_statistics(matrix: "np.ndarray", target: int) -> dict:
+    """Correlação, regressão linear (OLS) e pesos relativos de Johnson de cada coluna
+    de ``matrix`` contra a coluna ``target``; listas na ordem das colunas, sem o alvo.
+
+    Pesquisas sem o alvo são descartadas. A correlação usa apenas as pesquisas que
+    responderam a pergunta; regressão e pesos relativos preenchem as ausências com
+    a média da coluna. Função de módulo: roda em thread ou no pool de processos.
+    """
+    data = matrix[~np.isnan(matrix[:, target])]
+    y = data[:, target]
+    raw = np.delete(data, target, axis=1)
+    columns = raw.shape[1]
+    answered = (~np.isnan(raw)).sum(axis=0)
+    result = {
+        "surveys": len(y), "responses": answered.tolist(), "rSquared": None,
+        "correlation": [None] * columns, "coefficient": [None] * columns,
+        "standardized": [None] * columns, "weight": [None] * columns,
+    }
+    if len(y) < 3 or y.std() == 0:
+        return result
+
+    for column in range(columns):
+        mask = ~np.isnan(raw[:, column])
+        if mask.sum() >= 3 and raw[mask, column].std() > 0 and y[mask].std() > 0:
+            result["correlation"][column] = float(np.corrcoef(raw[mask, column], y[mask])[0, 1])
+
+    means = np.divide(np.nansum(raw, axis=0), answered, out=np.zeros(columns), where=answered > 0)
+    x = np.where(np.isnan(raw), means, raw)
+    deviations = x.std(axis=0)
+    usable = np.flatnonzero(deviations > 0)
+    if not usable.size:
+        return result
+    z = (x[:, usable] - x[:, usable].mean(axis=0)) / deviations[usable]
+    zy = (y - y.mean()) / y.std()
+    n = len(y)
+
+    # Pesos relativos (Johnson, 2000): regressão do alvo sobre a versão ortogonal
+    # mais próxima dos preditores; os pesos somam o R²
+    eigenvalues, vectors = np.linalg.eigh(z.T @ z / n)
+    lam = vectors @ np.diag(np.sqrt(np.clip(eigenvalues, 0, None))) @ vectors.T
+    beta = np.linalg.pinv(lam) @ (z.T @ zy / n)
+    weights = (lam ** 2) @ (beta ** 2)
+    r_squared = float(weights.sum())
+    result["rSquared"] = r_squared
+    for position, column in enumerate(usable):
+        result["weight"][column] = float(weights[position] / r_squared) if r_squared > 0 else 0.0
+
+    if n > usable.size + 1:
+        design = np.column_stack([np.ones(n), x[:, usable]])
+        coefficients = np.linalg.lstsq(design, y, rcond=None)[0][1:]
+        for position, column in enumerate(usable):
+            result["coefficient"][column] = float(coefficients[position])
+            result["standardized"][column] = float(coefficients[position] * deviations[column] / y.std())
+    return result
+
+
+def _driver_pool() -> ProcessPoolExecutor:
+    """Pool criado no primeiro cálculo grande; 'spawn' evita copiar threads e conexões do worker"""
+    global driver_process_pool
+    if driver_process_pool is None:
+        driver_process_pool = ProcessPoolExecutor(
+            max_workers=DRIVERS_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+        )
+    return driver_process_pool
+
+
+async def key_drivers(tenant: Tenant, target_code: str, start: Optional[date], end: Optional[date],
+                      ward_id: Optional[int], city_id: Optional[int]) -> KeyDrivers:
+    """Monta a matriz em uma thread (sessão de leitura) e calcula em thread ou processo, pelo tamanho"""
+    def load(db):
+        questionnaire = questionnaire_cache.get(db)
+        return score_matrix(db, questionnaire, start, end, ward_id, city_id)
+
+    questions, matrix = await in_read_session(tenant, load)
+    codes = [question["id"] for question in questions]
+    if target_code not in codes:
+        raise ValueError(f"Pergunta alvo desconhecida ou sem score: {target_code}")
+    target = codes.index(target_code)
+    if matrix.shape[0] >= DRIVERS_PROCESS_THRESHOLD:
+        loop = asyncio.get_running_loop()
+        stats = await loop.run_in_executor(_driver_pool(), key_driver_statistics, matrix, target)
+    else:
+        stats = await anyio.to_thread.run_sync(key_driver_statistics, matrix, target)
+
+    def rounded(value, digits=4):
+        return round(value, digits) if value is not None else None
+
+    predictors = [question for question in questions if question["id"] != target_code]
+    drivers = [
+        DriverItem(
+            questionId=question["id"],
+            question=question["text"],
+            section=question["section"],
+            responses=stats["responses"][index],
+            correlation=rounded(stats["correlation"][index]),
+            coefficient=rounded(stats["coefficient"][index]),
+            standardizedCoefficient=rounded(stats["standardized"][index]),
+            relativeWeight=rounded(stats["weight"][index]),
+        )
+        for index, question in enumerate(predictors)
+    ]
+    drivers.sort(key=lambda item: item.relativeWeight if item.relativeWeight is not None else -1, reverse=True)
+    return KeyDrivers(
+        target=target_code, surveys=stats["surveys"], rSquared=rounded(stats["rSquared"]), drivers=drivers
+    )
+
+
+# ====== ALERTAS DE QUEDA DE SATISFAÇÃO ======
+
+# Por ala e por seção, uma EWMA rápida (nível recente) é comparada a uma EWMA lenta
+# (linha de base, com variância): alerta quando a rápida fica ALERT_SIGMA desvios
+# da estatística abaixo da base. O estado fica no banco (alert_series), atualizado
+# com um UPDATE atômico por série a cada submissão, de qualquer worker.
+ALERT_FAST_ALPHA = float(os.getenv("ALERT_FAST_ALPHA", "0.2"))
+ALERT_BASELINE_ALPHA = float(os.getenv("ALERT_BASELINE_ALPHA", "0.02"))
+ALERT_SIGMA = float(os.getenv("ALERT_SIGMA", "3"))
+ALERT_MIN_SURVEYS = int(os.getenv("ALERT_MIN_SURVEYS", "20"))
+# Dias de survey_daily_stats usados como linha de base inicial de cada ala
+ALERT_BASELINE_DAYS = int(os.getenv("ALERT_BASELINE_DAYS", "90"))
+ALERT_HISTORY = int(os.getenv("ALERT_HISTORY", "200"))
+# Intervalo (segundos) entre leituras de alert_events por conexão do stream
+ALERT_STREAM_POLL = float(os.getenv("ALERT_STREAM_POLL", "2"))
+# Comentário enviado ao stream a cada N segundos sem eventos (mantém proxies abertos)
+ALERT_STREAM_PING = float(os.getenv("ALERT_STREAM_PING", "15"))
+
+OVERALL_METRIC = "Satisfação geral"
+
+
+def alert_threshold(baseline: float, variance: float) -> float:
+    """Limite inferior de controle da EWMA rápida: base - k·σ·√(λ / (2 - λ))"""
+    spread = math.sqrt(max(0.0, variance) * ALERT_FAST_ALPHA / (2 - ALERT_FAST_ALPHA))
+    return baseline - ALERT_SIGMA * spread
+
+
+def _update_alert_series(db: Session, ward_id: int, points: dict) -> set:
+    """Soma um ponto a cada série (ala, métrica) existente; retorna as métricas atualizadas.
+
+    Um UPDATE por série, calculado pelo banco sobre os valores atuais: workers
+    simultâneos não perdem atualizações. Até 1/alfa observações, os pesos são 1/n:
+    a base começa como média e variância acumuladas, sem o viés de partir do zero.
+    """
+    series = AlertSeries.__table__
+    n = series.c.surveys + 1
+    fast_alpha = case((1.0 / n > ALERT_FAST_ALPHA, 1.0 / n), else_=ALERT_FAST_ALPHA)
+    alpha = case((1.0 / n > ALERT_BASELINE_ALPHA, 1.0 / n), else_=ALERT_BASELINE_ALPHA)
+    updated = set()
+    for metric, value in points.items():
+        deviation = value - series.c.baseline
+        result = db.execute(
+            series.update()
+            .where(series.c.ward_id == ward_id, series.c.metric == metric)
+            .values(
+                surveys=n,
+                fast=series.c.fast + fast_alpha * (value - series.c.fast),
+                baseline=series.c.baseline + alpha * deviation,
+                variance=(1 - alpha) * (series.c.variance + alpha * deviation * deviation),
+            )
+        )
+        if result.rowcount:
+            updated.add(metric)
+    return updated
+
+
+def _warm_up_alert_series(db: Session, questionnaire: Questionnaire, ward_id: int, metrics: set) -> set:
+    """Cria as séries que faltam com a linha de base dos últimos ALERT_BASELINE_DAYS dias
+    de survey_daily_stats. Nas seções, a variância inicial é a das respostas
+    individuais (mais larga que a da média por pesquisa, portanto conservadora).
+
+    A pesquisa que está sendo observada já está nas estatísticas diárias: retorna as
+    métricas das séries criadas aqui, que não devem recebê-la de novo."""
+    today = datetime.utcnow().date()
+    stats = period_stats(db, today - timedelta(days=ALERT_BASELINE_DAYS), today, ward_id)
+    overall = stats.get(OVERALL_QUESTION_ID, SampleStats())
+    samples = {OVERALL_METRIC: (overall, overall.n)}
+    for question in questionnaire.questions:
+        found = stats.get(question["pk"])
+        if found is not None:
+            sample, surveys = samples.get(question["section"], (SampleStats(), 0))
+            sample.add(found.n, found.total, found.squares, found.favorable)
+            # pesquisas ~ a pergunta da seção mais respondida, não o total de respostas
+            samples[question["section"]] = (sample, max(surveys, found.n))
+    created = set()
+    for metric in metrics:
+        sample, surveys = samples.get(metric, (SampleStats(), 0))
+        mean, variance = (sample.mean, sample.variance or 0.0) if surveys else (0.0, 0.0)
+        row = {
+            "ward_id": ward_id, "metric": metric, "surveys": surveys, "fast": mean, "baseline": mean,
+            "variance": variance, "alert_id": None,
+        }
+        # Uma instrução por série: outro worker pode tê-la criado (nada inserido)
+        if db.execute(_insert_ignore(db, AlertSeries, [row])).rowcount and surveys:
+            created.add(metric)
+    return created
+
+
+def alert_payload(event: AlertEvent, ward_names: dict) -> dict:
+    """Evento no formato de SatisfactionAlert"""
+    return {
+        "id": event.id, "kind": event.kind, "createdAt": event.created_at.isoformat(timespec="seconds"),
+        "wardId": event.ward_id, "ward": ward_names.get(event.ward_id, "Sem ala"), "metric": event.metric,
+        "recentMean": round(event.recent_mean, 3), "baseline": round(event.baseline, 3),
+        "threshold": round(event.threshold, 3), "surveys": event.surveys,
+    }
+
+
+def observe_alerts(db: Session, questionnaire: Questionnaire, ward_id: Optional[int], responses: dict) -> List[dict]:
+    """Atualiza as séries da ala com uma pesquisa gravada e grava os eventos gerados
+    (em uma transação própria, com commit); retorna os eventos"""
+    by_section: dict[str, list] = {}
+    for question_code, response_text in responses.items():
+        match = questionnaire.options.get((question_code, response_text))
+        if match is not None and match[1]["value"] is not None:
+            by_section.setdefault(questionnaire.questions_by_pk[match[0]]["section"], []).append(match[1]["value"])
+    if not by_section:
+        return []
+    values = [value for section_values in by_section.values() for value in section_values]
+    points = {OVERALL_METRIC: sum(values) / len(values)}
+    points.update({section: sum(scores) / len(scores) for section, scores in by_section.items()})
+
+    ward_id = ward_id or 0
+    missing = set(points) - _update_alert_series(db, ward_id, points)
+    if missing:
+        missing -= _warm_up_alert_series(db, questionnaire, ward_id, missing)
+        _update_alert_series(db, ward_id, {metric: points[metric] for metric in missing})
+
+    # As linhas atualizadas seguem travadas por esta transação até o commit
+    events = []
+    series = db.query(AlertSeries).filter(AlertSeries.ward_id == ward_id, AlertSeries.metric.in_(list(points)))
+    for state in series:
+        if state.surveys < ALERT_MIN_SURVEYS:
+            continue
+        threshold = alert_threshold(state.baseline, state.variance)
+        if state.alert_id is None and state.fast < threshold:
+            kind = "drop"
+        elif state.alert_id is not None and state.fast >= (state.baseline + threshold) / 2:
+            kind = "recovered"  # histerese: volta à metade da distância até a base
+        else:
+            continue
+        event = AlertEvent(
+            kind=kind, ward_id=ward_id, metric=state.metric, recent_mean=state.fast, baseline=state.baseline,
+            threshold=threshold, surveys=state.surveys,
+        )
+        db.add(event)
+        db.flush()
+        state.alert_id = event.id if kind == "drop" else None
+        events.append(event)
+    db.commit()
+
+    if not events:
+        return []
+    payloads = [alert_payload(event, dict(ward_dimension.items(db))) for event in events]
+    for payload in payloads:
+        print(f"Alerta de satisfação ({payload['kind']}): {payload['ward']} / {payload['metric']} "
+              f"{payload['recentMean']} (base {payload['baseline']}, limite {payload['threshold']})")
+    return payloads
+
+
+def active_alerts(db: Session) -> List[dict]:
+    """Alertas ativos (séries ainda abaixo do limite), do mais antigo ao mais recente"""
+    names = dict(ward_dimension.items(db))
+    query = db.query(AlertEvent).join(AlertSeries, AlertSeries.alert_id == AlertEvent.id).order_by(AlertEvent.id)
+    return [alert_payload(event, names) for event in query]
+
+
+def alerts_after(db: Session, after_id: Optional[int], limit: int = ALERT_HISTORY) -> List[dict]:
+    """Eventos com id maior que ``after_id`` em ordem crescente; com ``after_id`` None,
+    os ``limit`` mais recentes primeiro"""
+    names = dict(ward_dimension.items(db))
+    query = db.query(AlertEvent)
+    if after_id is None:
+        query = query.order_by(AlertEvent.id.desc())
+    else:
+        query = query.filter(AlertEvent.id > after_id).order_by(AlertEvent.id)
+    return [alert_payload(event, names) for event in query.limit(limit)]
+
+
+def alert_overview(db: Session) -> dict:
+    """Alertas ativos e histórico recente (conteúdo de /api/alerts)"""
+    return {"active": active_alerts(db), "recent": alerts_after(db, None)}
+
+
+def last_alert_id(db: Session) -> int:
+    """Maior id de alert_events (0 se vazia): ponto de partida de uma conexão nova do stream"""
+    return db.query(func.max(AlertEvent.id)).scalar() or 0
+
+
+def record_alert_scores(db: Session, questionnaire: Questionnaire, ward_id: Optional[int], responses: dict) -> None:
+    """Alimenta o detector após gravar uma pesquisa; uma falha aqui não afeta a submissão"""
+    try:
+        observe_alerts(db, questionnaire, ward_id, responses)
+    except Exception as e:
+        db.rollback()
+        print(f"Detector de alertas não atualizado: {e}")
+
+
+# ====== RANKINGS DE ALAS E CIDADES ======
+
+# Quadros de ranking (dimensão e intervalo de meses) mantidos por worker
+RANKINGS_CACHE_SIZE = int(os.getenv("RANKINGS_CACHE_SIZE", "32"))
+
+
+class RankingBoard:
+    """Ranking de uma dimensão ("ward" ou "city") em um intervalo de meses, mantido
+    entre versões dos dados a partir de dimension_score_stats (inclui meses arquivados).
+
+    Modelo normal-normal de Bayes empírico: variância dentro das unidades (σ²)
+    combinada de todas; variância entre unidades (τ²) pelo método dos momentos. A
+    média de cada unidade é puxada para a média geral com peso B = (σ²/n) / (σ²/n + τ²):
+    quanto menor a amostra, maior B. O intervalo inclui a incerteza da própria média
+    geral (Morris, 1983).
+
+    Os totais dos meses fechados são lidos uma vez. A cada nova versão dos dados só
+    as linhas dos meses abertos (o atual e o anterior: created_at é a hora do
+    servidor) são relidas, e apenas as unidades que mudaram atualizam as somas do
+    modelo. A ordem anterior é reaproveitada: reordenar uma lista quase ordenada é
+    linear. Arquivamento, duplicatas e aliases mudam a geração "data" e recarregam tudo.
+    """
+
+    def __init__(self, dimension: str, start_month: Optional[str], end_month: Optional[str]):
+        self.dimension = dimension
+        self.start_month = start_month
+        self.end_month = end_month
+        self._lock = threading.Lock()
+        self._version = None
+        self._open_from = None
+        self._closed: dict[int, tuple] = {}  # id -> (pesquisas, soma, soma dos quadrados)
+        self._open: dict[int, tuple] = {}
+        self._units: dict[int, tuple] = {}
+        self._sums = [0.0] * 5  # Σ (n - 1), Σ SQ dentro, Σ médias, Σ médias², Σ 1/n
+        self._order: list[int] = []  # da maior para a menor média encolhida
+        self._fit: dict[int, tuple] = {}  # id -> (média encolhida, peso B, σ²/n)
+        self._grand_variance = 0.0
+        self.model = {"grandMean": None, "withinVariance": None, "betweenVariance": None}
+
+    def _totals(self, db: Session, *conditions) -> dict[int, tuple]:
+        stats = DimensionScoreStat
+        query = db.query(
+            stats.dimension_id, func.sum(stats.surveys), func.sum(stats.score_sum), func.sum(stats.score_sq_sum),
+        ).filter(stats.dimension == self.dimension, stats.dimension_id != 0, *conditions)
+        if self.start_month:
+            query = query.filter(stats.month >= self.start_month)
+        if self.end_month:
+            query = query.filter(stats.month <= self.end_month)
+        return {
+            unit: (int(n), float(total or 0), float(squares or 0))
+            for unit, n, total, squares in query.group_by(stats.dimension_id) if n
+        }
+
+    def _account(self, totals: tuple, sign: int) -> None:
+        n, total, squares = totals
+        mean = total / n
+        for index, value in enumerate((n - 1, max(0.0, squares - total * total / n), mean, mean * mean, 1 / n)):
+            self._sums[index] += sign * value
+
+    def _set(self, unit: int, totals: Optional[tuple]) -> None:
+        """Troca os totais de uma unidade, ajustando as somas do modelo e a lista de ordem"""
+        previous = self._units.pop(unit, None)
+        if previous is not None:
+            self._account(previous, -1)
+        if totals is not None:
+            self._units[unit] = totals
+            self._account(totals, 1)
+            if previous is None:
+                self._order.append(unit)
+        elif previous is not None:
+            self._order.remove(unit)
+
+    def _load(self, db: Session, open_from: str) -> None:
+        self._closed = self._totals(db, DimensionScoreStat.month < open_from)
+        self._open = {}
+        self._units, self._order, self._sums = {}, [], [0.0] * 5
+        for unit, totals in self._closed.items():
+            self._set(unit, totals)
+        self._open_from = open_from
+
+    def _score(self) -> None:
+        """Parâmetros do modelo pelas somas mantidas; médias encolhidas e ordem em O(unidades)"""
+        k = len(self._units)
+        if not k:
+            self._fit, self._grand_variance = {}, 0.0
+            self.model = {"grandMean": None, "withinVariance": None, "betweenVariance": None}
+            return
+        within_df, within_ss, mean_sum, mean_sq_sum, inverse_n_sum = self._sums
+        sigma2 = max(0.0, within_ss) / within_df if within_df > 0.5 else 0.0
+        between = 0.0
+        if k > 1:
+            observed = max(0.0, mean_sq_sum - mean_sum * mean_sum / k) / (k - 1)
+            between = max(0.0, observed - sigma2 * inverse_n_sum / k)
+
+        sampling = {unit: sigma2 / n for unit, (n, _total, _squares) in self._units.items()}
+        precisions = {unit: 1 / (v + between) if v + between > 0 else 0.0 for unit, v in sampling.items()}
+        precision_sum = sum(precisions.values())
+        if precision_sum > 0:
+            grand_mean = sum(p * self._units[unit][1] / self._units[unit][0] for unit, p in precisions.items())
+            grand_mean /= precision_sum
+            self._grand_variance = 1 / precision_sum
+        else:  # todas as unidades sem variação: média ponderada pelas pesquisas
+            grand_mean = sum(t for _n, t, _s in self._units.values()) / sum(n for n, _t, _s in self._units.values())
+            self._grand_variance = 0.0
+
+        self._fit = {}
+        for unit, (n, total, _squares) in self._units.items():
+            v = sampling[unit]
+            weight = v / (v + between) if v + between > 0 else 1.0
+            self._fit[unit] = (grand_mean + (1 - weight) * (total / n - grand_mean), weight, v)
+        self._order.sort(key=lambda unit: (-round(self._fit[unit][0], 3), -self._units[unit][0], unit))
+        self.model = {
+            "grandMean": round(grand_mean, 3), "withinVariance": round(sigma2, 4), "betweenVariance": round(between, 4),
+        }
+
+    def refresh(self, db: Session, version: tuple) -> None:
+        """Atualiza para ``version`` (de data_version) relendo só os meses abertos; requer a trava"""
+        if version == self._version:
+            return
+        first_of_month = datetime.utcnow().date().replace(day=1)
+        open_from = _month_key(first_of_month - timedelta(days=1))
+        if self._version is None or version[1] != self._version[1] or open_from != self._open_from:
+            self._load(db, open_from)
+        current = {}
+        if self.end_month is None or self.end_month >= open_from:
+            current = self._totals(db, DimensionScoreStat.month >= open_from)
+        for unit in set(current) | set(self._open):
+            if current.get(unit) != self._open.get(unit):
+                closed, recent = self._closed.get(unit), current.get(unit)
+                if closed and recent:
+                    self._set(unit, tuple(a + b for a, b in zip(closed, recent)))
+                else:
+                    self._set(unit, closed or recent)
+        self._open = current
+        self._score()
+        self._version = version
+
+    def ranked(self, db: Session, version: tuple, k: int, confidence: float) -> tuple[dict, int, list, list]:
+        """(modelo, unidades, ``k`` melhores, ``k`` piores) na versão ``version`` dos dados"""
+        names = dict((ward_dimension if self.dimension == "ward" else city_dimension).items(db))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        with self._lock:
+            self.refresh(db, version)
+
+            def entry(position: int) -> dict:
+                unit = self._order[position]
+                n, total, _squares = self._units[unit]
+                shrunk, weight, v = self._fit[unit]
+                margin = z * math.sqrt((1 - weight) * v + weight * weight * self._grand_variance)
+                return {
+                    "rank": position + 1, "id": unit, "name": names.get(unit, str(unit)), "surveys": n,
+                    "rawMean": round(total / n, 3), "shrunkMean": round(shrunk, 3),
+                    "ciLow": round(shrunk - margin, 3), "ciHigh": round(shrunk + margin, 3),
+                    "shrinkage": round(weight, 3),
+                }
+
+            count = len(self._order)
+            top = [entry(position) for position in range(min(k, count))]
+            bottom = [entry(position) for position in range(count - 1, max(count - k, 0) - 1, -1)]
+            return dict(self.model), count, top, bottom
+
+
+class RankingBoards:
+    """Quadros de ranking de um banco por (dimensão, meses), com limite de entradas"""
+
+    def __init__(self, size: int = RANKINGS_CACHE_SIZE):
+        self.size = size
+        self._boards: "OrderedDict[tuple, RankingBoard]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def board(self, dimension: str, start_month: Optional[str], end_month: Optional[str]) -> RankingBoard:
+        key = (dimension, start_month, end_month)
+        with self._lock:
+            board = self._boards.get(key)
+            if board is None:
+                board = self._boards[key] = RankingBoard(dimension, start_month, end_month)
+                while len(self._boards) > self.size:
+                    self._boards.popitem(last=False)
+            self._boards.move_to_end(key)
+            return board
+
+
+ranking_boards = PerDatabase(RankingBoards)
+
+
+# ====== VERSÃO DO ESQUEMA ======
+
+# Revisão Alembic esperada por este código (atualizar a cada nova migração)
+SCHEMA_REVISION = "0013_alert_state"
+
+
+def get_schema_revision(bind=None) -> Optional[str]:
+    """Lê a revisão aplicada no banco (tabela ``alembic_version``); padrão: DATABASE_URL"""
+    try:
+        with (bind if bind is not None else engine).connect() as conn:
+            return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except Exception:
+        return None
+
+
+def check_schema_revision():
+    """Falha rapidamente se o banco de algum hospital não estiver na revisão esperada"""
+    for tenant in tenants.all():
+        current = get_schema_revision(tenant.engine)
+        if current != SCHEMA_REVISION:
+            label = f" do hospital {tenant.key!r}" if tenants.multi else ""
+            raise RuntimeError(
+                f"Esquema do banco{label} na revisão {current!r}, esperado {SCHEMA_REVISION!r}. "
+                "Execute 'python manage.py migrate' antes de iniciar os workers."
+            )
+
+
+# ====== COMPRESSÃO DE RESPOSTAS ======
+
+# Respostas menores que o limite seguem sem compressão (não compensa a CPU)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Escolhe 'br' ou 'gzip' conforme o Accept-Encoding (respeitando q=0)"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Interface comum para compressão incremental gzip/brotli"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Middleware ASGI de compressão gzip/brotli com limite mínimo de tamanho.
+
+    Funciona também com respostas em streaming (exportações): cada bloco é
+    comprimido de forma incremental, sem acumular o corpo inteiro em memória.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None and not passthrough:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                if content_type.startswith(COMPRESSIBLE_TYPES):
+                    headers.add_vary_header("Accept-Encoding")
+                if (
+                    "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith("text/event-stream")  # eventos precisam sair na hora
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    payload = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(payload))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": payload})
+                    return
+                await send(start_message)
+
+            if passthrough:
+                await send(message)
+                return
+
+            payload = compressor.compress(body)
+            if not more_body:
+                payload += compressor.finish()
+            if payload or not more_body:
+                await send({"type": "http.response.body", "body": payload, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# ====== ARQUIVOS ESTÁTICOS ======
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+STATIC_MANIFEST = os.path.join(STATIC_DIR, "dist", "manifest.json")
+
+# Bibliotecas de terceiros copiadas para static/vendor por 'python build_assets.py'.
+# Enquanto o build não for executado, os templates usam a URL original do CDN.
+VENDOR_ASSETS = {
+    "vendor/bootstrap/bootstrap.min.css":
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+    "vendor/bootstrap/bootstrap.bundle.min.js":
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+    "vendor/fontawesome/css/all.min.css":
+        "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css",
+    "vendor/chartjs/chart.umd.min.js":
+        "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js",
+}
+for _font in ("fa-brands-400", "fa-regular-400", "fa-solid-900", "fa-v4compatibility"):
+    for _ext in ("woff2", "ttf"):
+        VENDOR_ASSETS[f"vendor/fontawesome/webfonts/{_font}.{_ext}"] = (
+            f"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/webfonts/{_font}.{_ext}"
+        )
+
+# Arquivos em dist/ levam o hash do conteúdo no nome: nome.<12 hex>.ext
+FINGERPRINT_PATTERN = re.compile(r"^dist/.+\.[0-9a-f]{12}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def load_static_manifest() -> dict:
+    """Lê o manifesto gerado pelo build (caminho original -> caminho com hash)"""
+    try:
+        with open(STATIC_MANIFEST, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+static_manifest = load_static_manifest()
+
+
+def static_url(path: str) -> str:
+    """URL de um arquivo estático, preferindo a versão com hash (cache imutável)"""
+    path = path.lstrip("/")
+    if path in static_manifest:
+        return f"/static/{static_manifest[path]}"
+    if path in VENDOR_ASSETS:
+        return VENDOR_ASSETS[path]
+    return f"/static/{path}"
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """StaticFiles com cache imutável e variantes pré-comprimidas (.br/.gz) para dist/"""
+
+    async def get_response(self, path: str, scope) -> Response:
+        if not FINGERPRINT_PATTERN.match(path) or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        suffix = {"br": ".br", "gzip": ".gz"}.get(encoding)
+        if suffix:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result and stat_module.S_ISREG(stat_result.st_mode):
+                return FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    method=scope["method"],
+                    media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    headers={
+                        "Content-Encoding": encoding,
+                        "Vary": "Accept-Encoding",
+                        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                    },
+                )
+
+        response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+# ====== ROTEAMENTO POR HOSPITAL ======
+
+class TenantMiddleware:
+    """Middleware ASGI que escolhe o banco do hospital pelo Host ou pelo prefixo ``/t/<chave>``.
+
+    O prefixo é removido do path (vai para ``root_path``) antes do roteamento, e o
+    hospital fica em ``request.state.tenant``. Com vários hospitais configurados,
+    requisições sem hospital reconhecido recebem 404 (exceto arquivos estáticos).
+    """
+
+    def __init__(self, app, registry: TenantRegistry = tenants):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        tenant, path, root_path = self.registry.resolve(scope)
+        if tenant is None and not scope["path"].startswith("/static/"):
+            response = JSONResponse({"detail": "Hospital não identificado"}, status_code=404)
+            await response(scope, receive, send)
+            return
+
+        state = dict(scope.get("state") or {}, tenant=tenant)
+        scope = dict(scope, path=path, root_path=root_path, state=state)
+        await self.app(scope, receive, send)
+
+
+# ====== APLICAÇÃO FASTAPI ======
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Configuração de inicialização e finalização da aplicação"""
+    # Startup: esquema e dados iniciais são responsabilidade de 'python manage.py migrate'
+    started = time.perf_counter()
+    check_schema_revision()
+    app.state.startup_seconds = time.perf_counter() - started
+    print(f"Worker iniciado em {app.state.startup_seconds * 1000:.1f} ms (esquema {SCHEMA_REVISION})")
+
+    yield
+
+    # Shutdown
+    password_executor.shutdown(wait=False)
+    if driver_process_pool is not None:
+        driver_process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(
+    title="Sistema de Pesquisa de Satisfação - Hospital Santa Clara",
+    description="Sistema completo para coleta e análise de pesquisas de satisfação de pacientes",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+
+app.add_middleware(CompressionMiddleware)
+
+# Adicionar middleware de sessão
+from starlette.middleware.sessions import SessionMiddleware
+app.add_middleware(
+    SessionMiddleware,
+    secret_key=os.getenv("SECRET_KEY", "hospital-santa-clara-secret-key-2024")
+)
+
+# Mais externo: o hospital é resolvido antes de sessão, compressão e rotas
+app.add_middleware(TenantMiddleware)
+
+# Configurar arquivos estáticos e templates
+app.mount("/static", FingerprintedStaticFiles(directory=STATIC_DIR), name="static")
+def root_url(request: Request, path: str = "/") -> str:
+    """Caminho de uma rota da aplicação com o prefixo da requisição (``/t/<chave>`` do
+    hospital, ou o root_path do proxy): links e fetch de uma página seguem no mesmo hospital"""
+    return request.scope.get("root_path", "") + path
+
+
+@pass_context
+def app_url(context, path: str = "/") -> str:
+    """``root_url`` nos templates (usa o ``request`` do contexto)"""
+    return root_url(context["request"], path)
+
+
+templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_url
+templates.env.globals["app_url"] = app_url
+
+# Cache de bytecode do Jinja: evita recompilar os templates a cada worker iniciado
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hospital-survey-jinja"))
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+# HTML da pesquisa já renderizado, por (hospital, prefixo, versão do questionário, usuário logado)
+SURVEY_PAGE_CACHE_SIZE = 32
+survey_page_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+# ====== ROTAS PRINCIPAIS ======
+
+@app.get("/", response_class=HTMLResponse)
+def index(request: Request, db: Session = Depends(get_db)):
+    """Página inicial com a pesquisa, já renderizada com o questionário"""
+    questionnaire = questionnaire_cache.get(db)
+    cache_key = (
+        get_tenant(request).key, root_url(request, ""), questionnaire.version, request.session.get("username")
+    )
+    html = survey_page_cache.get(cache_key)
+    if html is None:
+        html = templates.get_template("survey.html").render({
+            "request": request,
+            "questionnaire": questionnaire
+        })
+        survey_page_cache[cache_key] = html
+        while len(survey_page_cache) > SURVEY_PAGE_CACHE_SIZE:
+            survey_page_cache.popitem(last=False)
+    return HTMLResponse(html)
+
+
+@app.get("/login", response_class=HTMLResponse)
+async def login_page(request: Request):
+    """Página de login"""
+    return templates.TemplateResponse("login.html", {"request": request})
+
+
+@app.post("/login")
+async def login(
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Processar login do usuário"""
+    client_ip = request.client.host if request.client else "unknown"
+    username_key = username.strip().lower()
+    if not login_ip_limiter.consume(client_ip) or not login_user_limiter.consume(username_key):
+        retry_after = max(login_ip_limiter.retry_after(client_ip), login_user_limiter.retry_after(username_key))
+        return templates.TemplateResponse("login.html", {
+            "request": request,
+            "error": f"Muitas tentativas de login. Tente novamente em {retry_after} segundos."
+        }, status_code=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(retry_after)})
+
+    # Consultas ao banco em thread: o event loop segue atendendo as demais classes
+    user = await anyio.to_thread.run_sync(
+        lambda: db.query(User).filter(User.username == username, User.is_active == True).first()
+    )
+    password_ok = await verify_password_async(password, user.password_hash if user else DUMMY_PASSWORD_HASH)
+
+    if user and password_ok:
+        # Rehash transparente de hashes legados (salt:hash) ou com parâmetros antigos
+        if password_needs_rehash(user.password_hash):
+            user.password_hash = await hash_password_async(password)
+            await anyio.to_thread.run_sync(db.commit)
+        snapshot = await anyio.to_thread.run_sync(UserResponse.model_validate, user)
+        set_session_user(request, user)
+        cache = user_cache.of(db)
+        # antes de guardar: não descarta a entrada nova
+        await anyio.to_thread.run_sync(cache.sync, get_tenant(request).SessionLocal)
+        cache.set(snapshot)
+        return RedirectResponse(url=root_url(request, "/dashboard"), status_code=status.HTTP_302_FOUND)
+    else:
+        return templates.TemplateResponse("login.html", {
+            "request": request,
+            "error": "Usuário ou senha incorretos"
+        })
+
+
+@app.get("/logout")
+async def logout(request: Request):
+    """Fazer logout do usuário"""
+    request.session.clear()
+    return RedirectResponse(url=root_url(request), status_code=status.HTTP_302_FOUND)
+
+
+@app.post("/api/users/{user_id}/deactivate")
+def deactivate_user_route(user_id: int, db: Session = Depends(get_db), current_user: UserResponse = Depends(require_auth)):
+    """Desativa um usuário (somente administradores); sessões existentes dele deixam
+    de ser aceitas em todos os workers em até USER_CACHE_CHECK_INTERVAL segundos"""
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem desativar usuários")
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Não é possível desativar o próprio usuário")
+    if not deactivate_user(db, user_id):
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    return FastJSONResponse({"status": "success", "user_id": user_id})
+
+
+# Pool limitado para as consultas independentes do dashboard (uma conexão cada)
+dashboard_executor = ThreadPoolExecutor(
+    max_workers=DASHBOARD_QUERY_WORKERS,
+    thread_name_prefix="dashboard-query"
+)
+
+
+async def gather_queries(tenant: Tenant, *queries) -> list:
+    """Executa cada ``query(db)`` em sessão própria (réplica, se em uso), em paralelo;
+    a latência total passa a ser a da consulta mais lenta, não a soma"""
+    loop = asyncio.get_running_loop()
+
+    def run(query):
+        db = tenant.read_session()
+        try:
+            return query(db)
+        finally:
+            db.close()
+
+    return await asyncio.gather(*(loop.run_in_executor(dashboard_executor, run, query) for query in queries))
+
+
+def recent_completed_surveys(db: Session, limit: int = 10) -> list:
+    """Pesquisas concluídas mais recentes das tabelas principais"""
+    surveys = Survey.__table__
+    return db.execute(
+        select(surveys).where(surveys.c.completed == True).order_by(surveys.c.created_at.desc()).limit(limit)
+    ).all()
+
+
+async def build_dashboard_data(tenant: Tenant) -> tuple[DashboardData, list]:
+    """(dados do dashboard, 10 pesquisas recentes): totais, seções e recentes consultados em paralelo"""
+    (completed, score_sum, score_count), sections, recent = await gather_queries(
+        tenant,
+        survey_score_sums,
+        lambda db: section_score_sums(db, questionnaire_cache.get(db)),
+        recent_completed_surveys,
+    )
+    avg_satisfaction = score_sum / score_count if score_count else 0
+
+    # Tendência mensal (simulada para demonstração)
+    monthly_trend = [3.8, 4.0, 4.1, 4.0, 4.2, 4.3, 4.2, 4.1, 4.0, 4.1, 4.2, round(avg_satisfaction, 1)]
+
+    recent_surveys = []
+    for survey in recent[:5]:
+        recent_surveys.append({
+            "id": survey.id,
+            "patient": survey.patient_name if not survey.is_anonymous else "Anônimo",
+            "date": survey.created_at.strftime("%Y-%m-%d"),
+            "score": round(survey.satisfaction_score, 1) if survey.satisfaction_score else 0,
+            "observations": survey.observations or "",
+            "city": survey.city or "",
+            "ward": survey.ward or ""
+        })
+
+    data = DashboardData(
+        totalSurveys=completed,
+        avgSatisfaction=round(avg_satisfaction, 2),
+        sectionScores=average_scores(sections),
+        monthlyTrend=monthly_trend,
+        recentSurveys=recent_surveys
+    )
+    return data, recent
+
+
+@app.get("/dashboard", response_class=HTMLResponse, dependencies=[Depends(admit("interactive"))])
+async def dashboard(request: Request, current_user: UserResponse = Depends(require_auth)):
+    """Dashboard de insights para diretoria.
+
+    Os dados de /api/dashboard-data vão embutidos na página: o navegador não
+    precisa buscá-los de novo ao carregar (apenas ao clicar em atualizar).
+    """
+    tenant = get_tenant(request)
+    data, recent_surveys = await coalesced_read("dashboard", tenant, (), lambda: build_dashboard_data(tenant))
+
+    return templates.TemplateResponse("dashboard.html", {
+        "request": request,
+        "total_surveys": data.totalSurveys,
+        "avg_satisfaction": data.avgSatisfaction,
+        "recent_surveys": recent_surveys,
+        "dashboard_data": data.model_dump(mode="json"),
+        "active_alerts": await in_read_session(tenant, active_alerts),
+        "current_user": current_user
+    })
+
+
+@app.post("/api/submit-survey", response_model=SubmitSurveyResult, dependencies=[Depends(admit("ingest"))])
+async def submit_survey(request: Request, db: Session = Depends(get_db)):
+    """API para submeter uma nova pesquisa (formulário).
+
+    O formulário é lido uma única vez; apenas perguntas do questionário são aceitas.
+    Aceita uma chave de idempotência (campo ``client_key`` ou cabeçalho
+    ``Idempotency-Key``): reenvios da mesma chave devolvem o ``survey_id`` original.
+    """
+    form_data = await request.form()
+    return await anyio.to_thread.run_sync(save_form_survey, db, form_data, request.headers.get("Idempotency-Key"))
+
+
+def save_form_survey(db: Session, form_data, idempotency_key: Optional[str]):
+    """Valida e grava o formulário de /api/submit-survey (em thread: acessa o banco)"""
+    try:
+        questionnaire = questionnaire_cache.get(db)
+
+        data = SurveyCreate(
+            patient_name=form_data.get("patient_name"),
+            is_anonymous=form_data.get("is_anonymous") or False,
+            admission_date=form_data.get("admission_date"),
+            discharge_date=form_data.get("discharge_date"),
+            observations=form_data.get("observations", ""),
+            city=form_data.get("city", ""),
+            ward=form_data.get("ward", ""),
+            responses={
+                code: form_data[code] for code in questionnaire.question_pks if code in form_data
+            },
+            client_key=form_data.get("client_key") or idempotency_key or None
+        )
+        return submit_survey_result(*submit_idempotent(db, questionnaire, data))
+
+    except ValidationError as e:
+        return invalid_survey_response(e.errors()[0]["msg"])
+    except QuestionnaireVersionMismatch as e:
+        return invalid_survey_response(str(e), status_code=409)
+    except ValueError as e:
+        return invalid_survey_response(str(e))
+    except Exception as e:
+        db.rollback()
+        return FastJSONResponse({
+            "status": "error",
+            "message": f"Erro ao salvar pesquisa: {str(e)}"
+        }, status_code=500)
+
+
+def submit_survey_result(survey_id: int, replayed: bool) -> SubmitSurveyResult:
+    return SubmitSurveyResult(
+        status="success",
+        message="Pesquisa enviada com sucesso!",
+        survey_id=survey_id,
+        replayed=replayed
+    )
+
+
+def invalid_survey_response(message: str, status_code: int = 422) -> JSONResponse:
+    return FastJSONResponse({
+        "status": "error",
+        "message": f"Dados inválidos: {message}"
+    }, status_code=status_code)
+
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+@app.post("/api/surveys", response_model=SubmitSurveyResult, dependencies=[Depends(admit("ingest"))])
+async def submit_survey_json(request: Request, db: Session = Depends(get_db)):
+    """Envio direto em JSON (ou MessagePack) validado por ``SurveyCreate``.
+
+    Formato compacto recomendado: ``answers`` com o índice da opção de cada
+    pergunta na ordem de ``/api/questions`` e ``questionnaire_version`` igual ao
+    cabeçalho ``X-Questionnaire-Version`` dessa rota (409 se estiver desatualizado).
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    return await anyio.to_thread.run_sync(
+        save_body_survey, db, body, content_type, request.headers.get("Idempotency-Key")
+    )
+
+
+def save_body_survey(db: Session, body: bytes, content_type: str, idempotency_key: Optional[str]):
+    """Valida e grava o corpo de /api/surveys (em thread: acessa o banco)"""
+    try:
+        if content_type in MSGPACK_CONTENT_TYPES:
+            if msgpack is None:
+                raise HTTPException(status_code=415, detail="MessagePack não disponível neste servidor")
+            data = SurveyCreate.model_validate(msgpack.unpackb(body, raw=False))
+        else:
+            data = SurveyCreate.model_validate_json(body)
+        if data.client_key is None and idempotency_key:
+            data.client_key = uuid.UUID(idempotency_key)
+
+        return submit_survey_result(*submit_idempotent(db, questionnaire_cache.get(db), data))
+
+    except ValidationError as e:
+        return invalid_survey_response(e.errors()[0]["msg"])
+    except QuestionnaireVersionMismatch as e:
+        return invalid_survey_response(str(e), status_code=409)
+    except ValueError as e:
+        return invalid_survey_response(str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        return FastJSONResponse({
+            "status": "error",
+            "message": f"Erro ao salvar pesquisa: {str(e)}"
+        }, status_code=500)
+
+
+# Limite de pesquisas por lote da fila offline
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+
+
+@app.post("/api/submit-surveys/batch", response_model=SurveyBatchResult, dependencies=[Depends(admit("ingest"))])
+def submit_survey_batch(batch: SurveyBatch, db: Session = Depends(get_db)):
+    """Recebe um lote da fila offline dos tablets; cada pesquisa é gravada isoladamente"""
+    if len(batch.surveys) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Lote maior que {MAX_BATCH_SIZE} pesquisas")
+
+    questionnaire = questionnaire_cache.get(db)
+    results = []
+    for index, item in enumerate(batch.surveys):
+        # Item inválido nunca vai passar: 'invalid' avisa o tablet para não reenviá-lo
+        try:
+            data = SurveyCreate.model_validate(item)
+        except ValidationError as e:
+            results.append(BatchItemResult(index=index, status="invalid", message=str(e)))
+            continue
+        try:
+            survey_id, replayed = submit_idempotent(db, questionnaire, data)
+            results.append(BatchItemResult(index=index, status="success", survey_id=survey_id, replayed=replayed))
+        except ValueError as e:
+            results.append(BatchItemResult(index=index, status="invalid", message=str(e)))
+        except Exception as e:
+            db.rollback()
+            results.append(BatchItemResult(index=index, status="error", message=str(e)))
+
+    return SurveyBatchResult(results=results)
+
+
+@app.get("/service-worker.js")
+def service_worker(request: Request, db: Session = Depends(get_db)):
+    """Service worker do modo offline, com a lista de pré-cache da versão atual.
+
+    Cada prefixo (``/t/<chave>``) tem o seu worker, com escopo e cache próprios: a fila
+    offline de um hospital nunca sincroniza com outro.
+    """
+    questionnaire = questionnaire_cache.get(db)
+    root = root_url(request, "")
+    precache = [
+        root + "/",
+        static_url("vendor/bootstrap/bootstrap.min.css"),
+        static_url("vendor/bootstrap/bootstrap.bundle.min.js"),
+        static_url("vendor/fontawesome/css/all.min.css"),
+        static_url("vendor/chartjs/chart.umd.min.js"),
+        static_url("images/logo.png"),
+        root + "/api/questions",
+    ]
+    return templates.TemplateResponse(
+        "service-worker.js",
+        {"request": request, "root": root, "cache_version": questionnaire.version, "precache": precache},
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache", "Service-Worker-Allowed": root + "/"}
+    )
+
+
+@app.get("/api/dashboard-data", response_model=DashboardData, dependencies=[Depends(admit("interactive"))])
+async def get_dashboard_data(request: Request, current_user: UserResponse = Depends(require_auth)):
+    """API para dados do dashboard"""
+
+    try:
+        # Totais (inclui os meses arquivados), seções e recentes em paralelo; telas
+        # abertas ao mesmo tempo compartilham o mesmo cálculo
+        tenant = get_tenant(request)
+        data, _recent = await coalesced_read("dashboard", tenant, (), lambda: build_dashboard_data(tenant))
+        return data
+
+    except Exception as e:
+        return FastJSONResponse({
+            "error": str(e)
+        }, status_code=500)
+
+
+@app.get("/api/dimensions", response_model=Dimensions, dependencies=[Depends(admit("interactive"))])
+def get_dimensions(db: Session = Depends(get_read_db), current_user: UserResponse = Depends(require_auth)):
+    """Alas e cidades normalizadas, para filtros por id nas análises"""
+    return Dimensions(
+        wards=[DimensionItem(id=i, name=n) for i, n in ward_dimension.items(db)],
+        cities=[DimensionItem(id=i, name=n) for i, n in city_dimension.items(db)],
+    )
+
+
+# Faixas de dias de internação: (rótulo, mínimo, máximo ou None)
+LENGTH_OF_STAY_BUCKETS = [
+    ("Mesmo dia", 0, 0),
+    ("1 dia", 1, 1),
+    ("2-3 dias", 2, 3),
+    ("4-7 dias", 4, 7),
+    ("8-14 dias", 8, 14),
+    ("15+ dias", 15, None),
+]
+
+
+def length_of_stay_report(db: Session, start: Optional[date], end: Optional[date],
+                          ward_id: Optional[int], city_id: Optional[int]) -> LengthOfStayAnalytics:
+    """Satisfação por faixa de dias de internação, com a correlação de Pearson.
+
+    ``start``/``end`` filtram pela data de alta; ``ward_id``/``city_id`` pelas
+    dimensões de /api/dimensions. Uma consulta agrupada por fonte (coberta por
+    ix_surveys_discharge_los_score) calcula as faixas; meses arquivados entram
+    apenas se o período pedido os alcança. A correlação sai das somas por faixa.
+    """
+    def bucket_sums(surveys_table):
+        los = surveys_table.c.length_of_stay_days
+        score = surveys_table.c.satisfaction_score
+        bucket = case(
+            *[
+                ((los <= high) if high is not None else (los >= low), index)
+                for index, (_label, low, high) in enumerate(LENGTH_OF_STAY_BUCKETS)
+            ]
+        )
+        query = (
+            select(
+                bucket.label("bucket"),
+                func.count(),
+                func.sum(los),
+                func.sum(score),
+                func.sum(los * los),
+                func.sum(score * score),
+                func.sum(los * score),
+            )
+            .where(los.isnot(None), los >= 0, score.isnot(None))
+            .group_by(bucket)
+        )
+        if start:
+            query = query.where(surveys_table.c.discharge_date >= start)
+        if end:
+            query = query.where(surveys_table.c.discharge_date <= end)
+        if ward_id is not None:
+            query = query.where(surveys_table.c.ward_id == ward_id)
+        if city_id is not None:
+            query = query.where(surveys_table.c.city_id == city_id)
+        return db.execute(query).all()
+
+    rows = bucket_sums(Survey.__table__)
+    # A pesquisa é criada na alta ou depois: meses anteriores a ``start`` não contêm o período
+    with open_archives(db, archived_months_between(db, start)) as sources:
+        for source in sources:
+            rows += bucket_sums(source.surveys)
+
+    n = sum_x = sum_y = sum_xx = sum_yy = sum_xy = 0
+    buckets = {}
+    for index, count, bx, by, bxx, byy, bxy in rows:
+        bucket_count, bucket_sum = buckets.get(index, (0, 0))
+        buckets[index] = (bucket_count + count, bucket_sum + (by or 0))
+        n += count
+        sum_x += bx or 0
+        sum_y += by or 0
+        sum_xx += bxx or 0
+        sum_yy += byy or 0
+        sum_xy += bxy or 0
+
+    correlation = None
+    if n > 1:
+        cov = n * sum_xy - sum_x * sum_y
+        var_x = n * sum_xx - sum_x ** 2
+        var_y = n * sum_yy - sum_y ** 2
+        if var_x > 0 and var_y > 0:
+            correlation = round(cov / (var_x * var_y) ** 0.5, 3)
+
+    return LengthOfStayAnalytics(
+        surveys=n,
+        avgLengthOfStay=round(sum_x / n, 2) if n else None,
+        correlation=correlation,
+        buckets=[
+            LengthOfStayBucket(
+                label=label, minDays=low, maxDays=high,
+                surveys=buckets.get(index, (0, None))[0],
+                avgSatisfaction=round(buckets[index][1] / buckets[index][0], 2) if index in buckets else None,
+            )
+            for index, (label, low, high) in enumerate(LENGTH_OF_STAY_BUCKETS)
+        ],
+    )
+
+
+
+
+@app.get("/api/analytics/length-of-stay", response_model=LengthOfStayAnalytics,
+         dependencies=[Depends(admit("interactive"))])
+async def length_of_stay_analytics(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    ward_id: Optional[int] = None,
+    city_id: Optional[int] = None,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Satisfação por faixa de dias de internação (ver length_of_stay_report)"""
+    tenant = get_tenant(request)
+    params = (start, end, ward_id, city_id)
+    return await coalesced_read(
+        "length-of-stay", tenant, params, lambda: in_read_session(tenant, length_of_stay_report, *params)
+    )
+
+
+def compare_periods(db: Session, a_start: date, a_end: date, b_start: date, b_end: date,
+                    a_ward_id: Optional[int], b_ward_id: Optional[int], level: str,
+                    confidence: float) -> PeriodComparison:
+    """Satisfação geral e por seção (ou pergunta) de A contra B, pelas estatísticas diárias"""
+    questionnaire = questionnaire_cache.get(db)
+    sides = [period_stats(db, a_start, a_end, a_ward_id), period_stats(db, b_start, b_end, b_ward_id)]
+
+    groups = {"Satisfação geral": [OVERALL_QUESTION_ID]}
+    for question in questionnaire.questions:
+        label = question["section"] if level == "section" else question["id"]
+        groups.setdefault(label, []).append(question["pk"])
+
+    metrics = []
+    for label, question_pks in groups.items():
+        a, b = SampleStats(), SampleStats()
+        for sample, side in ((a, sides[0]), (b, sides[1])):
+            for question_pk in question_pks:
+                found = side.get(question_pk)
+                if found is not None:
+                    sample.add(found.n, found.total, found.squares, found.favorable)
+        test = compare_samples(a, b, confidence)
+        summaries = [
+            SampleSummary(
+                n=sample.n,
+                mean=round(sample.mean, 4) if sample.n else None,
+                sd=round(math.sqrt(sample.variance), 4) if sample.variance is not None else None,
+                favorableRate=round(sample.favorable / sample.n, 4) if sample.n else None,
+            )
+            for sample in (a, b)
+        ]
+        p_values = [value for value in (test["pValue"], test["chiSquarePValue"]) if value is not None]
+        metrics.append(MetricComparison(
+            metric=label, a=summaries[0], b=summaries[1], **test,
+            significant=bool(p_values) and min(p_values) < 1 - confidence,
+        ))
+    return PeriodComparison(confidence=confidence, metrics=metrics)
+
+
+@app.get("/api/analytics/compare", response_model=PeriodComparison,
+         dependencies=[Depends(admit("interactive"))])
+async def compare_analytics(
+    request: Request,
+    a_start: date,
+    a_end: date,
+    b_start: date,
+    b_end: date,
+    a_ward_id: Optional[int] = None,
+    b_ward_id: Optional[int] = None,
+    level: str = "section",
+    confidence: float = 0.95,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Compara dois períodos (datas de criação) e/ou duas alas: diferença de médias
+    com intervalo de confiança e teste t de Welch, e qui-quadrado das proporções de
+    respostas favoráveis. Lê apenas survey_daily_stats (inclui meses arquivados).
+
+    ``level``: ``section`` (padrão) ou ``question``. Cada resposta conta como uma
+    observação nas seções.
+    """
+    if a_start > a_end or b_start > b_end:
+        raise HTTPException(status_code=422, detail="Início do período depois do fim")
+    if level not in ("section", "question"):
+        raise HTTPException(status_code=422, detail="level deve ser 'section' ou 'question'")
+    if not 0.5 <= confidence < 1:
+        raise HTTPException(status_code=422, detail="confidence deve estar entre 0.5 e 1")
+    return await in_read_session(
+        get_tenant(request), compare_periods,
+        a_start, a_end, b_start, b_end, a_ward_id, b_ward_id, level, confidence,
+    )
+
+
+def option_distribution(db: Session, start_month: Optional[str], end_month: Optional[str],
+                        ward_id: Optional[int], city_id: Optional[int]) -> OptionDistribution:
+    """Distribuição, média e top-box por pergunta e médias por seção a partir das contagens de opções"""
+    questionnaire = questionnaire_cache.get(db)
+    source = "sql"
+    if OPTION_CUBE:
+        try:
+            counts = option_cube.counts(db, questionnaire, start_month, end_month, ward_id, city_id)
+            if counts is not None:
+                source = "cube"
+        except OSError as e:
+            print(f"Cubo de opções indisponível, usando o banco: {e}")
+    if source == "sql":
+        counts = option_counts(db, start_month, end_month, ward_id, city_id)
+
+    sections = {section["title"]: [0, 0] for section in questionnaire.sections}
+    questions = []
+    for question in questionnaire.questions:
+        tallies = [(option, counts.get(option["id"], 0)) for option in question["options"]]
+        responses = sum(count for _option, count in tallies)
+        scored = [(option["value"], count) for option, count in tallies if option["value"] is not None]
+        score_sum = sum(value * count for value, count in scored)
+        score_count = sum(count for _value, count in scored)
+        top_value = max((value for value, _count in scored), default=None)
+        top_box = sum(count for value, count in scored if value == top_value)
+        sections[question["section"]][0] += score_sum
+        sections[question["section"]][1] += score_count
+        questions.append(QuestionDistribution(
+            questionId=question["id"],
+            section=question["section"],
+            responses=responses,
+            options=[
+                OptionCount(option=option["text"], count=count, share=round(count / responses, 4) if responses else 0)
+                for option, count in tallies
+            ],
+            avgScore=round(score_sum / score_count, 2) if score_count else None,
+            topBox=round(top_box / score_count, 4) if score_count else None,
+        ))
+    return OptionDistribution(source=source, sectionScores=average_scores(sections), questions=questions)
+
+
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+@app.get("/api/analytics/distribution", response_model=OptionDistribution,
+         dependencies=[Depends(admit("interactive"))])
+async def distribution_analytics(
+    request: Request,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    ward_id: Optional[int] = None,
+    city_id: Optional[int] = None,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Distribuição das respostas por pergunta (contagem e proporção de cada opção,
+    média e top-box) e médias por seção, filtradas por meses (AAAA-MM, inclusivos),
+    ala e/ou cidade (0 = sem ala/cidade). Apenas as tabelas principais.
+
+    Com NumPy, cada filtro é uma fatia do cubo de contagens; sem ele, um GROUP BY.
+    """
+    for month in (start_month, end_month):
+        if month is not None and not MONTH_PATTERN.match(month):
+            raise HTTPException(status_code=422, detail="Mês deve estar no formato AAAA-MM")
+    tenant = get_tenant(request)
+    # O cubo confere seu total com o primário; na réplica atrasada seria refeito a cada leitura
+    session_factory = tenant.SessionLocal if OPTION_CUBE else tenant.read_session
+    params = (start_month, end_month, ward_id, city_id)
+    return await coalesced_read(
+        "distribution", tenant, params, lambda: in_session(session_factory, option_distribution, *params),
+        primary=OPTION_CUBE,
+    )
+
+
+@app.get("/api/analytics/drivers", response_model=KeyDrivers, dependencies=[Depends(admit("interactive"))])
+async def drivers_analytics(
+    request: Request,
+    target: str = "q5_1",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    ward_id: Optional[int] = None,
+    city_id: Optional[int] = None,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Fatores que explicam a pergunta ``target`` (padrão q5_1, "recomendaria este
+    hospital"): correlação, coeficiente de regressão e peso relativo de cada
+    pergunta, no recorte de datas de criação, ala e cidade. Tabelas principais.
+
+    O resultado fica guardado até a próxima pesquisa gravada (versão dos dados).
+    """
+    if np is None:
+        raise HTTPException(status_code=503, detail="Análise de fatores requer NumPy neste servidor")
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=422, detail="Início do período depois do fim")
+    tenant = get_tenant(request)
+    params = (target, start, end, ward_id, city_id)
+    try:
+        return await driver_results.get(tenant, params, lambda: key_drivers(tenant, *params))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/api/alerts", response_model=AlertsOverview)
+async def alerts(request: Request, current_user: UserResponse = Depends(require_auth)):
+    """Alertas de queda de satisfação por ala e seção, de todos os workers: os ativos
+    e o histórico recente (inclui os de recuperação)"""
+    return await in_read_session(get_tenant(request), alert_overview)
+
+
+@app.get("/api/alerts/stream")
+async def alerts_stream(request: Request, current_user: UserResponse = Depends(require_auth)):
+    """Server-Sent Events com cada alerta (``event: alert``) gravado por qualquer worker,
+    lidos de alert_events a cada ALERT_STREAM_POLL segundos. O ``id`` de cada evento
+    permite ao navegador retomar do último recebido (Last-Event-ID) ao reconectar."""
+    tenant = get_tenant(request)
+    last_event_id = request.headers.get("last-event-id", "")
+
+    async def events():
+        last_id = int(last_event_id) if last_event_id.isdigit() else await in_read_session(tenant, last_alert_id)
+        idle = 0.0
+        while True:
+            new_events = await in_read_session(tenant, alerts_after, last_id)
+            for event in new_events:
+                last_id = event["id"]
+                yield f"id: {last_id}\nevent: alert\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if new_events:
+                idle = 0.0
+            elif idle >= ALERT_STREAM_PING:
+                yield ": ping\n\n"
+                idle = 0.0
+            await asyncio.sleep(ALERT_STREAM_POLL)
+            idle += ALERT_STREAM_POLL
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/analytics/rankings", response_model=Rankings, dependencies=[Depends(admit("interactive"))])
+async def rankings_analytics(
+    request: Request,
+    dimension: str = "ward",
+    k: int = 5,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    confidence: float = 0.95,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Melhores e piores ``k`` alas (``dimension=ward``) ou cidades (``city``) pela
+    satisfação geral com encolhimento bayesiano empírico: unidades com poucas
+    pesquisas ficam perto da média geral em vez de liderar ou fechar o ranking.
+
+    O ranking fica em memória (RankingBoard): uma nova pesquisa só relê os totais
+    do mês aberto e reposiciona as unidades; cada requisição recorta o início e o
+    fim da lista.
+    """
+    if dimension not in ("ward", "city"):
+        raise HTTPException(status_code=422, detail="dimension deve ser 'ward' ou 'city'")
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=422, detail="k deve estar entre 1 e 100")
+    if not 0.5 <= confidence < 1:
+        raise HTTPException(status_code=422, detail="confidence deve estar entre 0.5 e 1")
+    for month in (start_month, end_month):
+        if month is not None and not MONTH_PATTERN.match(month):
+            raise HTTPException(status_code=422, detail="Mês deve estar no formato AAAA-MM")
+    tenant = get_tenant(request)
+    version = await current_data_version(tenant)
+    board = ranking_boards.of(tenant.engine).board(dimension, start_month, end_month)
+    model, units, top, bottom = await in_read_session(tenant, board.ranked, version, k, confidence)
+    return Rankings(dimension=dimension, confidence=confidence, units=units, **model, top=top, bottom=bottom)
+
+
+# Token (Authorization: Bearer) da visão consolidada do grupo; sem ele a rota fica desativada
+GROUP_ANALYTICS_TOKEN = os.getenv("GROUP_ANALYTICS_TOKEN", "")
+group_bearer = HTTPBearer(auto_error=False)
+
+
+def require_group_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(group_bearer)):
+    """Dependência que exige o token da visão consolidada do grupo"""
+    if not GROUP_ANALYTICS_TOKEN or credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), GROUP_ANALYTICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Não autorizado")
+
+
+def tenant_rollup(tenant: Tenant) -> tuple[TenantRollup, int, float, int, dict]:
+    """Totais de um hospital, em sessão própria: (resumo, concluídas, soma, contagem, seções)"""
+    db = tenant.read_session()
+    try:
+        completed, score_sum, score_count = survey_score_sums(db)
+        sections = section_score_sums(db, questionnaire_cache.get(db))
+    finally:
+        db.close()
+    rollup = TenantRollup(
+        tenant=tenant.key,
+        totalSurveys=completed,
+        avgSatisfaction=round(score_sum / score_count, 2) if score_count else 0,
+        sectionScores=average_scores(sections),
+    )
+    return rollup, completed, score_sum, score_count, sections
+
+
+@app.get("/api/group/analytics", response_model=GroupAnalytics,
+         dependencies=[Depends(require_group_token), Depends(admit("bulk"))])
+async def group_analytics():
+    """Visão consolidada de todos os hospitais.
+
+    Consulta os bancos em paralelo (uma thread por hospital) e soma os totais;
+    um hospital indisponível aparece com ``error`` sem derrubar os demais.
+    """
+    results = await asyncio.gather(
+        *(anyio.to_thread.run_sync(tenant_rollup, tenant) for tenant in tenants.all()),
+        return_exceptions=True,
+    )
+
+    rollups = []
+    completed = score_sum = score_count = 0
+    sections: dict[str, list] = {}
+    for tenant, result in zip(tenants.all(), results):
+        if isinstance(result, Exception):
+            print(f"Falha ao consolidar o hospital {tenant.key}: {result}")
+            rollups.append(TenantRollup(
+                tenant=tenant.key, totalSurveys=0, avgSatisfaction=0, sectionScores={}, error=str(result)
+            ))
+            continue
+        rollup, tenant_completed, tenant_sum, tenant_count, tenant_sections = result
+        rollups.append(rollup)
+        completed += tenant_completed
+        score_sum += tenant_sum
+        score_count += tenant_count
+        for title, (section_sum, section_count) in tenant_sections.items():
+            totals = sections.setdefault(title, [0, 0])
+            totals[0] += section_sum
+            totals[1] += section_count
+
+    return GroupAnalytics(
+        totalSurveys=completed,
+        avgSatisfaction=round(score_sum / score_count, 2) if score_count else 0,
+        sectionScores=average_scores(sections),
+        tenants=rollups,
+    )
+
+
+@app.get("/api/metrics/coalescing", response_model=dict[str, CoalescingMetric])
+async def coalescing_metrics(current_user: UserResponse = Depends(require_auth)):
+    """Taxa de compartilhamento das leituras caras neste worker, por rota"""
+    return single_flight.metrics()
+
+
+@app.get("/api/questions", response_model=List[QuestionSection])
+def get_questions(response: Response, db: Session = Depends(get_db)):
+    """API para obter todas as perguntas e opções.
+
+    A versão do questionário vai no cabeçalho ``X-Questionnaire-Version``; é a
+    referência para o envio compacto em ``/api/surveys``.
+    """
+
+    try:
+        questionnaire = questionnaire_cache.get(db)
+        response.headers["X-Questionnaire-Version"] = questionnaire.version
+        return questionnaire.api_sections
+
+    except Exception as e:
+        return FastJSONResponse({
+            "error": str(e)
+        }, status_code=500)
+
+
+@app.get("/api/surveys/{survey_id}", response_model=SurveyDetails, dependencies=[Depends(admit("interactive"))])
+def get_survey_details(request: Request, survey_id: int, db: Session = Depends(get_read_db)):
+    """Retorna detalhes completos de uma pesquisa: dados do paciente e todas as respostas.
+
+    Lê da réplica; uma pesquisa que ainda não chegou nela (recém-gravada) é
+    procurada no primário antes do 404.
+    """
+    try:
+        # Respostas resolvidas pelo questionário em cache (sem join com perguntas/opções)
+        questionnaire = questionnaire_cache.get(db)
+        found = find_survey(db, survey_id)
+        tenant = get_tenant(request)
+        if found is None and tenant.read_url and db.get_bind().engine is not tenant.engine:
+            with tenant.SessionLocal() as primary:
+                found = find_survey(primary, survey_id)
+        if found is None:
+            raise HTTPException(status_code=404, detail="Pesquisa não encontrada")
+        survey, responses = found
+
+        payload = {
+            "id": survey.id,
+            "createdAt": survey.created_at.isoformat(),
+            "patient": None if survey.is_anonymous else (survey.patient_name or ""),
+            "isAnonymous": survey.is_anonymous,
+            "admissionDate": survey.admission_date,
+            "dischargeDate": survey.discharge_date,
+            "lengthOfStayDays": survey.length_of_stay_days,
+            "city": survey.city or "",
+            "ward": survey.ward or "",
+            "observations": survey.observations or "",
+            "satisfactionScore": survey.satisfaction_score or 0,
+            "sections": questionnaire.answer_sections(responses)
+        }
+
+        return SurveyDetails(**payload)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        return FastJSONResponse({"error": str(e)}, status_code=500)
+
+
+def export_csv_text(db: Session, start: Optional[date], end: Optional[date]) -> str:
+    """CSV (long format) de todas as respostas do período; ver /api/export-csv"""
+    # Textos de perguntas e opções vêm do questionário em cache; respostas
+    # compactas e em linhas são lidas por load_answers
+    questionnaire = questionnaire_cache.get(db)
+
+    # Construir CSV em memória
+    output = io.StringIO()
+    writer = csv.writer(output)
+    header = [
+        "survey_id",
+        "created_at",
+        "patient",
+        "is_anonymous",
+        "city",
+        "ward",
+        "satisfaction_score",
+        "question_id",
+        "section_title",
+        "question_text",
+        "response_value",
+        "response_score",
+    ]
+    writer.writerow(header)
+
+    for survey, answers in iter_surveys_with_answers(db, start, end):
+        for section in questionnaire.answer_sections(answers):
+            for item in section["items"]:
+                writer.writerow([
+                    survey.id,
+                    survey.created_at.strftime("%Y-%m-%d %H:%M:%S") if survey.created_at else "",
+                    "" if survey.is_anonymous else (survey.patient_name or ""),
+                    1 if survey.is_anonymous else 0,
+                    survey.city or "",
+                    survey.ward or "",
+                    f"{survey.satisfaction_score:.2f}" if survey.satisfaction_score is not None else "",
+                    item["questionId"],
+                    section["title"],
+                    item["question"],
+                    item["answer"],
+                    item["score"] if item["score"] is not None else "",
+                ])
+    return output.getvalue()
+
+
+def export_json_bytes(db: Session, start: Optional[date], end: Optional[date]) -> bytes:
+    """JSON das pesquisas concluídas do período; ver /api/export-json"""
+    questionnaire = questionnaire_cache.get(db)
+
+    # Uma consulta de respostas por fonte; textos resolvidos pelo cache
+    export_payload = []
+    for survey, answers in iter_surveys_with_answers(db, start, end, completed_only=True):
+        sections = questionnaire.answer_sections(answers)
+        export_payload.append({
+            "id": survey.id,
+            "createdAt": survey.created_at.isoformat() if survey.created_at else "",
+            "patient": None if survey.is_anonymous else (survey.patient_name or ""),
+            "isAnonymous": survey.is_anonymous,
+            "admissionDate": survey.admission_date,
+            "dischargeDate": survey.discharge_date,
+            "lengthOfStayDays": survey.length_of_stay_days,
+            "city": survey.city or "",
+            "ward": survey.ward or "",
+            "observations": survey.observations or "",
+            "satisfactionScore": survey.satisfaction_score or 0,
+            "sections": sections,
+        })
+
+    # Validar e serializar para JSON (pydantic-core)
+    return survey_details_list.dump_json(survey_details_list.validate_python(export_payload), indent=2)
+
+
+@app.get("/api/export-csv", dependencies=[Depends(admit("bulk"))])
+async def export_csv(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Exporta todas as respostas das pesquisas em formato CSV (long format).
+
+    ``start``/``end`` limitam o período (data de criação); meses arquivados só
+    são lidos quando o período os inclui. Exportações idênticas simultâneas
+    compartilham a mesma geração.
+
+    Colunas: survey_id, created_at, patient, is_anonymous, city, ward,
+    satisfaction_score, question_id, section_title, question_text,
+    response_value, response_score
+    """
+    try:
+        tenant = get_tenant(request)
+        content = await coalesced_read(
+            "export-csv", tenant, (start, end), lambda: in_read_session(tenant, export_csv_text, start, end)
+        )
+
+        # Preparar resposta de streaming
+        filename = f"survey_responses_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+        return StreamingResponse(
+            io.StringIO(content),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}"
+            },
+        )
+    except Exception as e:
+        return FastJSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/api/export-json", dependencies=[Depends(admit("bulk"))])
+async def export_json(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: UserResponse = Depends(require_auth)
+):
+    """Exporta as pesquisas concluídas em JSON (estrutura aninhada por pesquisa).
+
+    ``start``/``end`` limitam o período (data de criação), como em /api/export-csv.
+    """
+    try:
+        tenant = get_tenant(request)
+        json_bytes = await coalesced_read(
+            "export-json", tenant, (start, end), lambda: in_read_session(tenant, export_json_bytes, start, end)
+        )
+        buffer = io.BytesIO(json_bytes)
         filename = f"surveys_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
         return StreamingResponse(
             buffer,
@@ -852,7 +4898,7 @@ async def export_json(db: Session = Depends(get_db), current_user: User = Depend
             },
         )
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return FastJSONResponse({"error": str(e)}, status_code=500)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
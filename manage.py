@@ -0,0 +1,146 @@
+"""
+Comandos de manutenção - Sistema de Pesquisa de Satisfação
+
+Uso:
+    python manage.py migrate   # aplica as migrações Alembic e os dados iniciais
+    python manage.py upgrade   # apenas as migrações Alembic
+    python manage.py seed      # apenas perguntas e usuário padrão
+    python manage.py current   # mostra a revisão aplicada no banco
+    python manage.py dedupe    # remove pesquisas duplicadas antigas (sem client_key)
+    python manage.py alias ward "Terapia Intensiva" UTI   # grafia alternativa de ala/cidade
+    python manage.py archive   # move meses além de RETENTION_MONTHS para o arquivo
+    python manage.py cube      # monta o cubo de contagens das opções (requer NumPy)
+
+Com TENANTS configurado, cada comando roda no banco de todos os hospitais
+(ou apenas no de ``--tenant <chave>``).
+
+Deve ser executado uma única vez por deploy, antes de iniciar os workers.
+"""
+
+import argparse
+import os
+import time
+
+from alembic import command
+from alembic.config import Config
+
+from main import (
+    SCHEMA_REVISION, get_schema_revision, init_questions, create_default_user, tenants,
+    dedupe_legacy_surveys, ward_dimension, city_dimension, archive_expired, RETENTION_MONTHS,
+    OPTION_CUBE, option_cube, questionnaire_cache
+)
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def alembic_config(tenant=None) -> Config:
+    """Configuração do Alembic apontando para este diretório (e para o banco do hospital)"""
+    config = Config(os.path.join(BASE_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BASE_DIR, "alembic"))
+    if tenant is not None:
+        config.attributes["tenant"] = tenant
+    return config
+
+
+def upgrade(tenant=None):
+    """Aplica todas as revisões pendentes"""
+    command.upgrade(alembic_config(tenant), "head")
+
+
+def seed(tenant=None):
+    """Insere perguntas e usuário padrão, se ainda não existirem"""
+    db = (tenant or tenants.default()).SessionLocal()
+    try:
+        init_questions(db)
+        create_default_user(db)
+    finally:
+        db.close()
+
+
+def dedupe(tenant):
+    """Varredura periódica de duplicatas (agendar via cron)"""
+    db = tenant.SessionLocal()
+    try:
+        removed = dedupe_legacy_surveys(db)
+    finally:
+        db.close()
+    print(f"{removed} pesquisas duplicadas removidas")
+
+
+def alias(tenant, dimension: str, alias_text: str, canonical_text: str):
+    """Registra um alias e move as pesquisas gravadas com a grafia antiga"""
+    cache = ward_dimension if dimension == "ward" else city_dimension
+    db = tenant.SessionLocal()
+    try:
+        moved = cache.add_alias(db, alias_text, canonical_text)
+    finally:
+        db.close()
+    print(f"'{alias_text}' -> '{canonical_text}': {moved} pesquisas atualizadas")
+
+
+def archive(tenant, retention_months: int):
+    """Arquivamento mensal (agendar via cron, ex.: no dia 1 de cada mês)"""
+    db = tenant.SessionLocal()
+    try:
+        archived = archive_expired(db, retention_months)
+    finally:
+        db.close()
+    for month, count in archived:
+        print(f"{month}: {count} pesquisas arquivadas")
+    if not archived:
+        print("Nenhum mês a arquivar")
+
+
+def cube(tenant):
+    """Monta o cubo antes de iniciar os workers (ex.: após o archive)"""
+    if not OPTION_CUBE:
+        print("Cubo de opções desativado (NumPy ausente ou OPTION_CUBE=0)")
+        return
+    db = tenant.SessionLocal()
+    try:
+        option_cube.rebuild(db, questionnaire_cache.get(db))
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos de manutenção do banco de dados")
+    parser.add_argument("command", choices=["migrate", "upgrade", "seed", "current", "dedupe", "alias", "archive", "cube"])
+    parser.add_argument("args", nargs="*", help="alias: ward|city <alias> <nome canônico>")
+    parser.add_argument("--months", type=int, default=RETENTION_MONTHS,
+                        help="archive: meses mantidos nas tabelas principais (padrão: RETENTION_MONTHS)")
+    parser.add_argument("--tenant", default=None, help="apenas o hospital com esta chave (padrão: todos)")
+    args = parser.parse_args()
+    if args.command == "alias" and (len(args.args) != 3 or args.args[0] not in ("ward", "city")):
+        parser.error("uso: alias ward|city <alias> <nome canônico>")
+    selected = tenants.all()
+    if args.tenant is not None:
+        if tenants.get(args.tenant) is None:
+            parser.error(f"hospital desconhecido: {args.tenant}")
+        selected = [tenants.get(args.tenant)]
+
+    started = time.perf_counter()
+    for tenant in selected:
+        if tenants.multi:
+            print(f"== Hospital {tenant.key} ==")
+        if args.command in ("migrate", "upgrade"):
+            upgrade(tenant)
+        if args.command in ("migrate", "seed"):
+            seed(tenant)
+        if args.command == "dedupe":
+            dedupe(tenant)
+        if args.command == "alias":
+            alias(tenant, *args.args)
+        if args.command == "archive":
+            archive(tenant, args.months)
+        if args.command == "cube":
+            cube(tenant)
+        if args.command == "current":
+            print(f"Revisão no banco: {get_schema_revision(tenant.engine)} (esperada: {SCHEMA_REVISION})")
+    if args.command != "current":
+        print(f"'{args.command}' concluído em {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,10 @@ if [ ! -f ".env" ]; then
     echo "⚠️  IMPORTANTE: Configure o arquivo .env com suas credenciais!"
 fi
 
+# Aplicar migrações e dados iniciais (uma vez, antes dos workers)
+echo "🗄️ Aplicando migrações do banco de dados..."
+python manage.py migrate || exit 1
+
 # Executar aplicação
 echo "🚀 Iniciando aplicação..."
 echo ""
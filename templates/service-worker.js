@@ -0,0 +1,84 @@
+// Service worker do modo offline - Hospital Santa Clara
+// Gerado por /service-worker.js; a versão acompanha o questionário em uso.
+
+// Prefixo do hospital ('/t/<chave>', ou vazio no endereço principal): cada prefixo tem o
+// seu worker, com escopo e caches próprios ('/' e ':' não aparecem nas chaves)
+const APP_ROOT = {{ root|tojson }};
+const CACHE_PREFIX = APP_ROOT ? 'pesquisa:' + APP_ROOT + ':' : 'pesquisa-';
+const CACHE_NAME = CACHE_PREFIX + {{ cache_version|tojson }};
+const PRECACHE_URLS = {{ precache|tojson }};
+// Endereços absolutos, comparáveis a request.url (a lista mistura caminhos locais e CDN)
+const PRECACHE_HREFS = new Set(PRECACHE_URLS.map(url => new URL(url, self.location).href));
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(CACHE_NAME);
+        // Falha em um arquivo (ex.: CDN inacessível) não impede a instalação
+        await Promise.all(PRECACHE_URLS.map(url =>
+            cache.add(new Request(url, {cache: 'reload'})).catch(() => null)
+        ));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith(CACHE_PREFIX) && name !== CACHE_NAME)
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+// Rede com tempo limite; se falhar ou demorar, usa o cache
+async function networkFirst(request, timeoutMs) {
+    const cache = await caches.open(CACHE_NAME);
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), timeoutMs);
+    try {
+        const response = await fetch(request, {signal: controller.signal});
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    } finally {
+        clearTimeout(timer);
+    }
+}
+
+// Arquivos com hash no nome nunca mudam: cache primeiro
+async function cacheFirst(request) {
+    const cache = await caches.open(CACHE_NAME);
+    const cached = await cache.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') {
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    if (request.mode === 'navigate' && url.pathname === APP_ROOT + '/') {
+        event.respondWith(networkFirst(request, 4000));
+    } else if (url.pathname === APP_ROOT + '/api/questions') {
+        event.respondWith(networkFirst(request, 4000));
+    } else if (url.pathname.startsWith('/static/') || PRECACHE_HREFS.has(url.href)) {
+        event.respondWith(cacheFirst(request));
+    }
+});
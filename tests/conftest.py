@@ -0,0 +1,97 @@
+"""Configuração dos testes: banco SQLite, cubo e arquivo mensal em um diretório
+temporário. As variáveis de ambiente precisam existir antes de importar ``main``.
+
+Cada teste começa com as tabelas vazias, perguntas e usuário padrão recriados e
+os caches por banco descartados.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="pesquisa-testes-")
+
+for name in ("TENANTS", "TENANTS_READ", "DATABASE_READ_URL", "RETENTION_MONTHS"):
+    os.environ.pop(name, None)
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORK_DIR, 'pesquisa.db')}",
+    "CUBE_DIR": os.path.join(WORK_DIR, "cube"),
+    "ARCHIVE_DIR": os.path.join(WORK_DIR, "archive"),
+    "SCRYPT_N": "1024",  # hashes rápidos; os parâmetros não mudam o fluxo testado
+    "OPTION_CUBE_CHECK_INTERVAL": "0",
+    "ANSWER_STORAGE": "rows",
+})
+sys.path.insert(0, ROOT)
+
+import main  # noqa: E402
+import manage  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    manage.upgrade()
+    yield
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_state(schema):
+    with main.engine.begin() as conn:
+        for table in reversed(main.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    for value in list(vars(main).values()):
+        if isinstance(value, main.PerDatabase):
+            value._instances.clear()
+        elif isinstance(value, main.ResultCache):
+            value._results.clear()
+    main.single_flight._stats.clear()
+    main.login_ip_limiter._buckets.clear()
+    main.login_user_limiter._buckets.clear()
+    shutil.rmtree(main.CUBE_DIR, ignore_errors=True)
+    shutil.rmtree(main.ARCHIVE_DIR, ignore_errors=True)
+    manage.seed()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = main.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def admin(client):
+    response = client.post("/login", data={"username": "admin", "password": "admin123"}, follow_redirects=False)
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def submit(client):
+    """submit(answers=None, ward=None, city=None, **campos) -> resposta de POST /api/surveys;
+    ``answers`` são índices de opção na ordem de /api/questions (padrão: a primeira de cada)"""
+    questions = client.get("/api/questions")
+    version = questions.headers["X-Questionnaire-Version"]
+    count = sum(len(section["questions"]) for section in questions.json())
+
+    def send(answers=None, ward=None, city=None, headers=None, **fields):
+        body = {
+            "admission_date": "2025-01-01", "discharge_date": "2025-01-03", "ward": ward, "city": city,
+            "answers": answers if answers is not None else [0] * count, "questionnaire_version": version,
+            **fields,
+        }
+        return client.post("/api/surveys", json=body, headers=headers or {})
+
+    send.questions = [question for section in questions.json() for question in section["questions"]]
+    return send
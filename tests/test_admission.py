@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+def test_saturated_lane_answers_503_with_retry_after(admin, monkeypatch):
+    lane = main.admission_lanes["bulk"]
+    monkeypatch.setattr(lane, "limit", 0)
+    monkeypatch.setattr(lane, "timeout", 0)
+
+    response = admin.get("/api/export-csv")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert admin.get("/api/dimensions").status_code == 200  # outras classes seguem atendendo
+
+
+def test_lane_queues_up_to_its_limit_and_hands_over_the_slot():
+    async def scenario():
+        lane = main.AdmissionLane("teste", limit=1, queue_size=1, timeout=1)
+        await lane.acquire()
+        waiting = asyncio.ensure_future(lane.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(main.AdmissionRejected):
+            await lane.acquire()  # fila cheia
+        lane.release()
+        await waiting
+        assert lane.active == 1 and lane.rejected == 1
+        lane.release()
+        assert lane.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_database_work_runs_off_the_event_loop(admin, submit, monkeypatch):
+    in_loop = []
+    original = main.QuestionnaireCache.get
+
+    def spy(self, db):
+        try:
+            asyncio.get_running_loop()
+            in_loop.append(True)
+        except RuntimeError:
+            in_loop.append(False)
+        return original(self, db)
+
+    monkeypatch.setattr(main.QuestionnaireCache, "get", spy)
+    survey_id = submit().json()["survey_id"]
+    admin.post("/api/submit-survey", data={"admission_date": "2025-01-01", "discharge_date": "2025-01-02"})
+    admin.post("/api/submit-surveys/batch", json={"surveys": []})
+    admin.get(f"/api/surveys/{survey_id}")
+    assert in_loop and not any(in_loop)
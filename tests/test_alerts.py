@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from starlette.requests import Request
+
+import main
+
+
+def submit_many(submit, times, option):
+    """``option``: 0 = melhor opção de cada pergunta, -1 = a pior"""
+    answers = [option % len(question["options"]) for question in submit.questions]
+    for _ in range(times):
+        assert submit(answers=answers, ward="UTI").status_code == 200
+
+
+def overall(alerts):
+    return [alert for alert in alerts if alert["metric"] == main.OVERALL_METRIC]
+
+
+def test_drop_and_recovery_are_recorded_once(admin, submit, db):
+    submit_many(submit, main.ALERT_MIN_SURVEYS, 0)
+    assert admin.get("/api/alerts").json() == {"active": [], "recent": []}
+
+    submit_many(submit, 3, -1)
+    active = overall(admin.get("/api/alerts").json()["active"])
+    assert [(alert["kind"], alert["ward"]) for alert in active] == [("drop", "UTI")]
+    assert active[0]["recentMean"] < active[0]["threshold"] < active[0]["baseline"]
+
+    submit_many(submit, 3, -1)  # ainda abaixo: sem novo evento
+    assert len(overall(admin.get("/api/alerts").json()["recent"])) == 1
+
+    submit_many(submit, 15, 0)
+    overview = admin.get("/api/alerts").json()
+    assert overall(overview["active"]) == []
+    assert [alert["kind"] for alert in overall(overview["recent"])] == ["recovered", "drop"]
+
+
+def test_one_series_per_ward_and_metric(submit, db):
+    submit_many(submit, 5, 0)
+    sections = {question["section"] for question in main.questionnaire_cache.get(db).questions}
+    rows = db.query(main.AlertSeries.metric, main.AlertSeries.surveys).filter(
+        main.AlertSeries.ward_id == db.query(main.Ward.id).filter(main.Ward.name == "UTI").scalar()
+    ).all()
+    assert sorted(metric for metric, _ in rows) == sorted(sections | {main.OVERALL_METRIC})
+    assert {surveys for _, surveys in rows} == {5}
+
+
+def stream_events(last_event_id, count, monkeypatch):
+    monkeypatch.setattr(main, "ALERT_STREAM_POLL", 0.01)
+    headers = [(b"last-event-id", last_event_id.encode())] if last_event_id is not None else []
+    request = Request({
+        "type": "http", "method": "GET", "path": "/api/alerts/stream", "headers": headers,
+        "state": {"tenant": main.tenants.default()},
+    })
+
+    async def read():
+        response = await main.alerts_stream(request, current_user=None)
+        chunks = []
+        async for chunk in response.body_iterator:
+            chunks.append(chunk)
+            if len(chunks) == count:
+                break
+        await response.body_iterator.aclose()
+        return chunks
+
+    return asyncio.run(asyncio.wait_for(read(), 5))
+
+
+def test_stream_resumes_from_last_event_id(submit, db, monkeypatch):
+    submit_many(submit, main.ALERT_MIN_SURVEYS, 0)
+    submit_many(submit, 3, -1)
+    events = main.alerts_after(db, 0)
+    assert events
+
+    chunks = stream_events("0", len(events), monkeypatch)
+    assert [chunk.split("\n")[0] for chunk in chunks] == [f"id: {event['id']}" for event in events]
+    assert json.loads(chunks[0].split("data: ", 1)[1]) == events[0]
+
+    chunks = stream_events(str(events[-1]["id"] - 1), 1, monkeypatch)
+    assert chunks[0].startswith(f"id: {events[-1]['id']}\nevent: alert\n")
@@ -0,0 +1,49 @@
+import os
+from datetime import datetime
+
+import main
+
+
+def backdate(db, survey_ids, when):
+    db.query(main.Survey).filter(main.Survey.id.in_(survey_ids)).update(
+        {"created_at": when}, synchronize_session=False
+    )
+    db.commit()
+
+
+def test_archived_month_is_still_read(admin, submit, db):
+    ids = [submit(answers=[index % 2] * len(submit.questions)).json()["survey_id"] for index in range(3)]
+    backdate(db, ids[:2], datetime(2024, 3, 10, 12, 0))
+    dashboard = admin.get("/api/dashboard-data").json()
+    exported = admin.get("/api/export-json").json()
+    details = admin.get(f"/api/surveys/{ids[0]}").json()
+    version = main.data_version(db)
+
+    assert main.archive_month(db, "2024-03") == 2
+    assert os.path.exists(main._archive_path(db, "2024-03"))
+    assert [survey_id for (survey_id,) in db.query(main.Survey.id)] == [ids[2]]
+    assert db.query(main.SurveyResponse).filter(main.SurveyResponse.survey_id.in_(ids[:2])).count() == 0
+    assert main.data_version(db) != version
+
+    after = admin.get("/api/dashboard-data").json()
+    assert {**after, "recentSurveys": None} == {**dashboard, "recentSurveys": None}  # recentes: só o mês atual
+    assert admin.get("/api/export-json").json() == exported
+    assert admin.get(f"/api/surveys/{ids[0]}").json() == details
+
+    hot_only = admin.get("/api/export-json", params={"start": "2025-01-01"}).json()
+    assert [survey["id"] for survey in hot_only] == [ids[2]]
+    csv_ids = {line.split(",")[0] for line in admin.get("/api/export-csv").text.splitlines()[1:]}
+    assert csv_ids == {str(survey_id) for survey_id in ids}
+
+
+def test_archive_expired_moves_only_months_past_retention(submit, db):
+    ids = [submit().json()["survey_id"] for _ in range(3)]
+    backdate(db, [ids[0]], datetime(2020, 1, 5))
+    backdate(db, [ids[1]], datetime(2020, 2, 5))
+
+    assert main.archive_expired(db, retention_months=0) == []
+    assert main.archive_expired(db, retention_months=12) == [("2020-01", 1), ("2020-02", 1)]
+    assert [survey_id for (survey_id,) in db.query(main.Survey.id)] == [ids[2]]
+    assert main.survey_totals(db)[0] == 3
+    assert main.find_archived_survey(db, ids[1])[0].id == ids[1]
+    assert main.find_archived_survey(db, ids[2]) is None
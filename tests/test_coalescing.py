@@ -0,0 +1,78 @@
+import asyncio
+
+import main
+
+
+def test_concurrent_identical_reads_share_one_execution():
+    flight = main.SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return object()
+
+    async def scenario():
+        first = await asyncio.gather(*(flight.run("teste", ("k", 1), compute) for _ in range(5)))
+        second = await flight.run("teste", ("k", 1), compute)  # terminou: nada fica guardado
+        other = await flight.run("teste", ("k", 2), compute)
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+    assert len({id(result) for result in first}) == 1
+    assert second is not first[0] and other is not second
+    assert len(calls) == 3
+    assert flight.metrics()["teste"] == {"requests": 7, "executions": 3, "coalesced": 4, "hitRate": 0.571}
+
+
+def test_abandoned_caller_does_not_cancel_the_shared_execution():
+    flight = main.SingleFlight()
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def compute():
+            await gate.wait()
+            return "pronto"
+
+        starter = asyncio.ensure_future(flight.run("teste", "k", compute))
+        follower = asyncio.ensure_future(flight.run("teste", "k", compute))
+        await asyncio.sleep(0)
+        starter.cancel()
+        gate.set()
+        return await follower
+
+    assert asyncio.run(scenario()) == "pronto"
+
+
+def test_data_version_changes_on_submit_and_generation_bumps(submit, db):
+    versions = [main.data_version(db)]
+    submit()
+    versions.append(main.data_version(db))
+    main.bump_generation(db, "data")
+    db.commit()
+    versions.append(main.data_version(db))
+    main.ward_dimension.resolve(db, "UTI")
+    db.commit()
+    versions.append(main.data_version(db))  # ala nova sem pesquisas movidas: mesma versão
+    assert versions[0] != versions[1] != versions[2] == versions[3]
+
+
+def test_result_cache_recomputes_only_for_new_data(submit, db):
+    tenant = main.tenants.default()
+    cache = main.ResultCache("teste", size=4)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    def read():
+        return asyncio.run(cache.get(tenant, ("p",), compute))
+
+    assert read() == 1
+    assert read() == 1
+    submit()
+    assert read() == 2
+    main.bump_generation(db, "data")
+    db.commit()
+    assert read() == 3
@@ -0,0 +1,88 @@
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(not main.OPTION_CUBE, reason="cubo requer NumPy")
+
+
+def submit_varied(submit, wards=("UTI", "Pediatria"), cities=("Recife", "Olinda")):
+    sizes = [len(question["options"]) for question in submit.questions]
+    for index in range(6):
+        answers = [(index * 2 + offset) % size for offset, size in enumerate(sizes)]
+        response = submit(answers=answers, ward=wards[index % len(wards)], city=cities[index % len(cities)])
+        assert response.status_code == 200
+
+
+def cube_and_sql(db, **filters):
+    questionnaire = main.questionnaire_cache.get(db)
+    params = [filters.get(name) for name in ("start_month", "end_month", "ward_id", "city_id")]
+    cube = main.option_cube.counts(db, questionnaire, *params)
+    return cube, main.option_counts(db, *params)
+
+
+def nonzero(counts):
+    return {option_id: count for option_id, count in counts.items() if count}
+
+
+def test_cube_matches_sql_for_every_slice(submit, db):
+    submit_varied(submit)
+    cube, sql = cube_and_sql(db)  # montado na primeira leitura
+    assert nonzero(cube) == sql
+    generation = int(main.option_cube.of(db)._state[0])
+    submit_varied(submit)  # somadas incrementalmente
+
+    ward_ids = dict(db.query(main.Ward.name, main.Ward.id))
+    city_ids = dict(db.query(main.City.name, main.City.id))
+    for filters in ({}, {"ward_id": ward_ids["UTI"]}, {"city_id": city_ids["Olinda"]}, {"start_month": "2000-01"}):
+        cube, sql = cube_and_sql(db, **filters)
+        assert nonzero(cube) == sql, filters
+    assert nonzero(cube_and_sql(db, end_month="2000-01")[0]) == {}
+    assert int(main.option_cube.of(db)._state[0]) == generation
+
+
+def test_add_never_counts_a_survey_twice(submit, db):
+    submit_varied(submit)
+    questionnaire = main.questionnaire_cache.get(db)
+    before = cube_and_sql(db)[0]
+    survey = db.query(main.Survey).order_by(main.Survey.id.desc()).first()
+    option_ids = list(before)[:3]
+
+    main.option_cube.add(db, questionnaire, survey.id, survey.created_at, survey.ward_id, survey.city_id, option_ids)
+    assert cube_and_sql(db)[0] == before
+
+
+def test_new_ward_marks_the_cube_stale_without_rebuilding(submit, db, monkeypatch):
+    submit_varied(submit)
+    cube_and_sql(db)
+    cube = main.option_cube.of(db)
+
+    def fail(*args):
+        raise AssertionError("o cubo não pode ser refeito no caminho da submissão")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(main.OptionCube, "_rebuild", fail)
+        assert submit(ward="Ala nova").status_code == 200
+    assert cube._state[1] == -1
+
+    cube_counts, sql = cube_and_sql(db)  # a leitura refaz
+    assert nonzero(cube_counts) == sql
+    assert cube._state[1] == db.query(main.Survey).count()
+
+
+def test_cities_beyond_the_cap_fall_back_to_sql(admin, submit, db, monkeypatch):
+    monkeypatch.setattr(main, "OPTION_CUBE_CITIES", 1)
+    submit_varied(submit, cities=("Recife", "Recife", "Olinda"))
+    city_ids = dict(db.query(main.City.name, main.City.id))
+
+    cube, sql = cube_and_sql(db)
+    assert nonzero(cube) == sql
+    assert cube_and_sql(db, city_id=city_ids["Recife"])[0] is not None
+    assert cube_and_sql(db, city_id=city_ids["Olinda"])[0] is None
+
+    assert submit(city="Paulista").status_code == 200  # cidade nova soma em "outras"
+    assert nonzero(cube_and_sql(db)[0]) == main.option_counts(db, None, None, None, None)
+
+    response = admin.get("/api/analytics/distribution", params={"city_id": city_ids["Olinda"]})
+    assert response.json()["source"] == "sql"
+    response = admin.get("/api/analytics/distribution", params={"city_id": city_ids["Recife"]})
+    assert response.json()["source"] == "cube"
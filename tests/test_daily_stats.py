@@ -0,0 +1,75 @@
+import math
+import statistics
+from datetime import date
+
+import main
+
+
+def stat_rows(db):
+    return [
+        tuple(row) for row in db.query(
+            main.SurveyDailyStat.day, main.SurveyDailyStat.ward_id, main.SurveyDailyStat.question_id,
+            main.SurveyDailyStat.responses, main.SurveyDailyStat.score_sum,
+            main.SurveyDailyStat.score_sq_sum, main.SurveyDailyStat.favorable,
+        ).order_by(main.SurveyDailyStat.ward_id, main.SurveyDailyStat.question_id)
+    ]
+
+
+def submit_mixed(submit):
+    sizes = [len(question["options"]) for question in submit.questions]
+    for index in range(6):
+        ward = "UTI" if index % 2 else "Pediatria"
+        answers = [(index + offset) % size for offset, size in enumerate(sizes)]
+        assert submit(answers=answers, ward=ward).status_code == 200
+
+
+def test_incremental_stats_match_a_rebuild(submit, db):
+    submit_mixed(submit)
+    incremental = stat_rows(db)
+    assert incremental
+
+    main.rebuild_daily_stats(db)
+    db.commit()
+    assert stat_rows(db) == incremental
+
+
+def test_compare_wards_matches_the_raw_scores(admin, submit, db):
+    submit_mixed(submit)
+    ward_ids = dict(db.query(main.Ward.name, main.Ward.id))
+    today = date.today().isoformat()
+    response = admin.get("/api/analytics/compare", params={
+        "a_start": today, "a_end": today, "b_start": today, "b_end": today,
+        "a_ward_id": ward_ids["Pediatria"], "b_ward_id": ward_ids["UTI"],
+    })
+    assert response.status_code == 200
+    overall = response.json()["metrics"][0]
+    assert overall["metric"] == "Satisfação geral"
+
+    for side, ward in (("a", "Pediatria"), ("b", "UTI")):
+        scores = [score for (score,) in db.query(main.Survey.satisfaction_score).filter(main.Survey.ward == ward)]
+        assert overall[side]["n"] == len(scores)
+        assert overall[side]["mean"] == round(statistics.mean(scores), 4)
+        assert overall[side]["sd"] == round(statistics.stdev(scores), 4)
+
+
+def test_welch_t_and_interval():
+    a_scores, b_scores = [2, 3, 3, 2, 4, 3, 2], [5, 4, 5, 5, 4, 5, 3, 5]
+
+    def sample(scores):
+        return main.SampleStats(len(scores), sum(scores), sum(s * s for s in scores), sum(s >= 4 for s in scores))
+
+    result = main.compare_samples(sample(a_scores), sample(b_scores))
+    va, vb = statistics.variance(a_scores) / 7, statistics.variance(b_scores) / 8
+    t = (statistics.mean(b_scores) - statistics.mean(a_scores)) / math.sqrt(va + vb)
+    assert result["t"] == round(t, 4)
+    assert result["ciLow"] < result["delta"] < result["ciHigh"]
+    assert 0 < result["pValue"] < 0.05
+    assert main.t_test_p_value(0, 12) == 1.0
+    assert abs(main.t_critical(10_000) - 1.96) < 0.01
+
+
+def test_compare_rejects_inverted_periods(admin):
+    response = admin.get("/api/analytics/compare", params={
+        "a_start": "2025-02-01", "a_end": "2025-01-01", "b_start": "2025-01-01", "b_end": "2025-02-01",
+    })
+    assert response.status_code == 422
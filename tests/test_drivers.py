@@ -0,0 +1,48 @@
+import pytest
+
+import main
+
+np = pytest.importorskip("numpy")
+
+
+def test_statistics_recover_a_known_linear_model():
+    rng = np.random.default_rng(7)
+    x = rng.normal(size=(2000, 3))
+    y = 2.0 * x[:, 0] + 0.5 * x[:, 1] + rng.normal(scale=0.1, size=2000)
+    matrix = np.column_stack([x[:, 0], y, x[:, 1], x[:, 2]])
+    matrix[:10, 1] = np.nan  # sem alvo: fora do cálculo
+    matrix[10:20, 3] = np.nan  # preditor sem resposta: média da coluna
+
+    stats = main.key_driver_statistics(matrix, target=1)
+    assert stats["surveys"] == 1990
+    assert stats["responses"] == [1990, 1990, 1980]
+    assert stats["coefficient"][0] == pytest.approx(2.0, abs=0.02)
+    assert stats["coefficient"][1] == pytest.approx(0.5, abs=0.02)
+    assert stats["coefficient"][2] == pytest.approx(0.0, abs=0.02)
+    assert sum(stats["weight"]) == pytest.approx(1.0)
+    assert stats["weight"][0] > stats["weight"][1] > stats["weight"][2]
+    assert stats["rSquared"] == pytest.approx(1 - 0.01 / (4.25 + 0.01), abs=0.01)
+    assert stats["correlation"][0] == pytest.approx(2 / np.sqrt(4.26), abs=0.02)
+
+
+def test_constant_target_has_no_drivers():
+    matrix = np.column_stack([np.arange(10.0), np.full(10, 4.0)])
+    stats = main.key_driver_statistics(matrix, target=1)
+    assert stats["rSquared"] is None and stats["weight"] == [None]
+
+
+def test_drivers_route(admin, submit):
+    sizes = [len(question["options"]) for question in submit.questions]
+    for index in range(8):
+        submit(answers=[(index + offset * (index % 3)) % size for offset, size in enumerate(sizes)])
+
+    response = admin.get("/api/analytics/drivers")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["target"] == "q5_1" and body["surveys"] == 8
+    assert "q5_1" not in [driver["questionId"] for driver in body["drivers"]]
+    weights = [driver["relativeWeight"] for driver in body["drivers"] if driver["relativeWeight"] is not None]
+    assert weights == sorted(weights, reverse=True)
+
+    assert admin.get("/api/analytics/drivers", params={"target": "nao_existe"}).status_code == 422
+    assert admin.get("/api/analytics/drivers", params={"start": "2025-02-01", "end": "2025-01-01"}).status_code == 422
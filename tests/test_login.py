@@ -0,0 +1,43 @@
+import hashlib
+
+import main
+from tests.test_user_cache import create_user
+
+
+def test_legacy_hash_is_upgraded_on_login(client, db):
+    legacy = "abc123:" + hashlib.sha256(("senha123" + "abc123").encode()).hexdigest()
+    db.add(main.User(username="legado", password_hash=legacy, is_active=True))
+    db.commit()
+
+    response = client.post("/login", data={"username": "legado", "password": "senha123"}, follow_redirects=False)
+    assert response.status_code == 302
+    db.expire_all()
+    upgraded = db.query(main.User).filter(main.User.username == "legado").one().password_hash
+    assert upgraded.startswith(f"scrypt${main.SCRYPT_N}$")
+    assert main.verify_password("senha123", upgraded)
+    assert not main.password_needs_rehash(upgraded)
+
+
+def test_unknown_and_inactive_users_still_verify_a_hash(client, db, monkeypatch):
+    nurse_id = create_user(db, "enfermeira")
+    main.deactivate_user(db, nurse_id)
+    verified = []
+    original = main.verify_password
+    monkeypatch.setattr(main, "verify_password", lambda password, hashed: verified.append(hashed) or original(password, hashed))
+
+    for username in ("ninguem", "enfermeira"):
+        response = client.post("/login", data={"username": username, "password": "senha123"}, follow_redirects=False)
+        assert response.status_code == 200
+        assert "Usuário ou senha incorretos" in response.text
+    assert verified == [main.DUMMY_PASSWORD_HASH, main.DUMMY_PASSWORD_HASH]
+    assert not main.verify_password("senha123", main.DUMMY_PASSWORD_HASH)
+
+
+def test_repeated_failures_are_throttled_per_user(client):
+    for _ in range(int(main.login_user_limiter.capacity)):
+        response = client.post("/login", data={"username": "admin", "password": "errada"}, follow_redirects=False)
+        assert response.status_code == 200
+
+    response = client.post("/login", data={"username": "admin", "password": "admin123"}, follow_redirects=False)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
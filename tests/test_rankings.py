@@ -0,0 +1,106 @@
+import statistics
+
+import pytest
+
+import main
+
+
+def reference(scores_by_unit):
+    """Bayes empírico normal-normal calculado direto das notas: {id: (média encolhida, B)}"""
+    means = {unit: statistics.mean(scores) for unit, scores in scores_by_unit.items()}
+    within_ss = sum(sum((x - means[unit]) ** 2 for x in scores) for unit, scores in scores_by_unit.items())
+    sigma2 = within_ss / sum(len(scores) - 1 for scores in scores_by_unit.values())
+    sampling = {unit: sigma2 / len(scores) for unit, scores in scores_by_unit.items()}
+    between = max(0.0, statistics.variance(means.values()) - statistics.mean(sampling.values()))
+    precision = {unit: 1 / (v + between) for unit, v in sampling.items()}
+    grand = sum(precision[unit] * means[unit] for unit in means) / sum(precision.values())
+    result = {}
+    for unit, v in sampling.items():
+        weight = v / (v + between)
+        result[unit] = (grand + (1 - weight) * (means[unit] - grand), weight)
+    return result
+
+
+def submit_wards(submit, plan):
+    """plan: [(ala, opção, vezes)]; opção 0 = melhor resposta de cada pergunta, -1 = a pior"""
+    for ward, option, times in plan:
+        answers = [option % len(question["options"]) for question in submit.questions]
+        for _ in range(times):
+            assert submit(answers=answers, ward=ward).status_code == 200
+
+
+def hot_scores(db):
+    scores = {}
+    for ward_id, score in db.query(main.Survey.ward_id, main.Survey.satisfaction_score):
+        scores.setdefault(ward_id, []).append(score)
+    return scores
+
+
+def rankings(client, **params):
+    response = client.get("/api/analytics/rankings", params={"k": 100, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def load_calls(monkeypatch):
+    calls = []
+    original = main.RankingBoard._load
+    monkeypatch.setattr(main.RankingBoard, "_load", lambda board, *args: calls.append(1) or original(board, *args))
+    return calls
+
+
+def test_board_matches_the_reference_with_closed_months(admin, submit, db):
+    submit_wards(submit, [("UTI", 0, 8), ("UTI", -1, 1), ("Pediatria", -1, 8), ("Pediatria", 0, 1),
+                          ("Maternidade", 0, 1), ("Oncologia", 0, 3), ("Oncologia", -1, 4)])
+    scores = hot_scores(db)
+    ward_ids = dict(db.query(main.Ward.name, main.Ward.id))
+    old = {ward_ids["UTI"]: [4.5, 5.0, 4.0], ward_ids["Pediatria"]: [2.0, 3.0], ward_ids["Oncologia"]: [3.5, 4.0]}
+    for unit, values in old.items():
+        db.add(main.DimensionScoreStat(
+            month="2020-01", dimension="ward", dimension_id=unit, surveys=len(values),
+            score_sum=sum(values), score_sq_sum=sum(x * x for x in values),
+        ))
+        scores[unit] = scores[unit] + values
+    main.bump_generation(db, "data")  # como um backfill: recarga completa
+    db.commit()
+
+    body = rankings(admin)
+    expected = reference(scores)
+    weights = {unit: weight for unit, (_shrunk, weight) in expected.items()}
+    assert 0 < weights[ward_ids["UTI"]] < weights[ward_ids["Maternidade"]] < 1  # amostra pequena encolhe mais
+    assert body["units"] == len(scores)
+    assert [unit["id"] for unit in body["top"]] == sorted(expected, key=lambda unit: -expected[unit][0])
+    for unit in body["top"]:
+        assert unit["shrunkMean"] == pytest.approx(expected[unit["id"]][0], abs=1e-3)
+        assert unit["shrinkage"] == pytest.approx(expected[unit["id"]][1], abs=1e-3)
+        assert unit["ciLow"] < unit["shrunkMean"] < unit["ciHigh"]
+    assert body["bottom"] == body["top"][::-1]
+
+    only_closed = rankings(admin, end_month="2020-12")
+    assert {unit["id"]: unit["surveys"] for unit in only_closed["top"]} == {u: len(v) for u, v in old.items()}
+
+
+def test_new_surveys_update_the_board_without_reloading(admin, submit, db, load_calls):
+    submit_wards(submit, [("UTI", 0, 3), ("Pediatria", -1, 3), ("Maternidade", 1, 2)])
+    before = rankings(admin)
+    assert len(load_calls) == 1
+
+    submit_wards(submit, [("Pediatria", 0, 6), ("Oncologia", 1, 2)])
+    after = rankings(admin)
+    assert len(load_calls) == 1
+    assert after["units"] == before["units"] + 1
+    expected = reference(hot_scores(db))
+    assert [unit["id"] for unit in after["top"]] == sorted(expected, key=lambda unit: -expected[unit][0])
+
+
+def test_alias_moving_surveys_reloads_the_board(admin, submit, db, load_calls):
+    submit_wards(submit, [("UTI", 0, 3), ("Terapia Intensiva", -1, 2), ("Pediatria", 1, 3)])
+    assert rankings(admin)["units"] == 3
+
+    assert main.ward_dimension.add_alias(db, "Terapia Intensiva", "UTI") == 2
+    body = rankings(admin)
+    assert len(load_calls) == 2
+    assert body["units"] == 2
+    uti = next(unit for unit in body["top"] if unit["name"] == "UTI")
+    assert uti["surveys"] == 5
@@ -0,0 +1,94 @@
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import main
+
+
+class Replica:
+    """Cópia do arquivo SQLite do primário no papel de réplica de leitura"""
+
+    def __init__(self, tenant, path):
+        self.tenant = tenant
+        self.path = path
+        self.url = f"sqlite:///{path}"
+
+    def use(self, url):
+        self.tenant.read_url = url
+
+    def copy(self):
+        shutil.copy(main.engine.url.database, self.path)
+
+    def execute(self, sql, **params):
+        engine = create_engine(self.url)
+        with engine.begin() as conn:
+            conn.execute(text(sql), params)
+        engine.dispose()
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    tenant = main.tenants.default()
+    monkeypatch.setattr(tenant, "read_url", None)
+    monkeypatch.setattr(main, "READ_REPLICA_CHECK_INTERVAL", 0)
+    yield Replica(tenant, tmp_path / "replica.db")
+    if tenant._read_engine is not None:
+        main.replica_primaries.pop(tenant._read_engine, None)
+        tenant._read_engine.dispose()
+    tenant._read_engine = tenant._read_session_factory = None
+    tenant._replica_checked_at, tenant._replica_ok = None, False
+
+
+def reads(client, survey_id):
+    return {
+        "dashboard": client.get("/api/dashboard-data").json()["totalSurveys"],
+        "analytics": client.get("/api/analytics/length-of-stay").json()["surveys"],
+        "export": len(client.get("/api/export-json").json()),
+        "details": client.get(f"/api/surveys/{survey_id}").json()["patient"],
+    }
+
+
+def test_reads_go_to_the_replica(admin, submit, replica):
+    survey_id = submit(patient_name="Ana").json()["survey_id"]
+    submit()
+    replica.copy()
+    replica.execute("UPDATE surveys SET patient_name = 'Ana (réplica)' WHERE id = :id", id=survey_id)
+    submit()  # só no primário; atraso de segundos, dentro do limite
+    replica.use(replica.url)
+
+    assert reads(admin, survey_id) == {"dashboard": 2, "analytics": 2, "export": 2, "details": "Ana (réplica)"}
+    assert main.tenants.default().replica_usable()
+
+
+def test_lagging_replica_falls_back_to_the_primary(admin, submit, replica, monkeypatch):
+    survey_id = submit(patient_name="Ana").json()["survey_id"]
+    replica.copy()
+    submit()
+    old = datetime.utcnow() - timedelta(hours=2)
+    replica.execute("UPDATE surveys SET created_at = :old, patient_name = 'Ana (réplica)'", old=old)
+    monkeypatch.setattr(main, "READ_REPLICA_MAX_LAG", 60)
+    replica.use(replica.url)
+
+    assert reads(admin, survey_id) == {"dashboard": 2, "analytics": 2, "export": 2, "details": "Ana"}
+    assert not main.tenants.default().replica_usable()
+
+
+def test_unreachable_replica_falls_back_to_the_primary(admin, submit, replica, tmp_path):
+    survey_id = submit(patient_name="Ana").json()["survey_id"]
+    replica.use(f"sqlite:///{tmp_path / 'nao-existe' / 'replica.db'}")
+
+    assert reads(admin, survey_id) == {"dashboard": 1, "analytics": 1, "export": 1, "details": "Ana"}
+    assert not main.tenants.default().replica_usable()
+
+
+def test_details_of_a_survey_not_yet_replicated_come_from_the_primary(admin, submit, replica):
+    submit()
+    replica.copy()
+    survey_id = submit(patient_name="Nova").json()["survey_id"]
+    replica.use(replica.url)
+
+    assert main.tenants.default().replica_usable()
+    assert admin.get(f"/api/surveys/{survey_id}").json()["patient"] == "Nova"
+    assert admin.get("/api/surveys/9999").status_code == 404
@@ -0,0 +1,68 @@
+import pytest
+
+import main
+import manage
+
+
+@pytest.fixture
+def two_hospitals(tmp_path, monkeypatch):
+    """Hospitais 'a' (banco padrão dos testes) e 'b' (banco novo) no registro global"""
+    registry = main.TenantRegistry(f"a={main.DATABASE_URL},b=sqlite:///{tmp_path / 'b.db'}", "")
+    monkeypatch.setattr(main.tenants, "_tenants", registry._tenants)
+    monkeypatch.setattr(main.tenants, "multi", True)
+    hospital_b = registry.get("b")
+    manage.upgrade(hospital_b)
+    manage.seed(hospital_b)
+    yield registry
+    hospital_b.engine.dispose()
+
+
+def scope(path, host="pesquisa.local"):
+    return {"type": "http", "path": path, "root_path": "", "headers": [(b"host", host.encode())]}
+
+
+def test_registry_resolves_prefix_before_host(two_hospitals):
+    a, b = two_hospitals.get("a"), two_hospitals.get("b")
+    assert two_hospitals.resolve(scope("/t/b/api/questions", host="a.pesquisa.local")) == (b, "/api/questions", "/t/b")
+    assert two_hospitals.resolve(scope("/api/questions", host="a.pesquisa.local:8000")) == (a, "/api/questions", "")
+    assert two_hospitals.resolve(scope("/t/x/api/questions"))[0] is None
+    assert two_hospitals.resolve(scope("/api/questions"))[0] is None
+
+
+def test_requests_reach_only_their_hospital(client, two_hospitals):
+    version = client.get("/t/b/api/questions").headers["X-Questionnaire-Version"]
+    body = {"admission_date": "2025-01-01", "discharge_date": "2025-01-02", "questionnaire_version": version}
+    response = client.post("/t/b/api/surveys", json=body)
+    assert response.status_code == 200
+
+    counts = {}
+    for key in ("a", "b"):
+        with two_hospitals.get(key).SessionLocal() as db:
+            counts[key] = db.query(main.Survey).count()
+    assert counts == {"a": 0, "b": 1}
+    assert client.get("/api/questions").status_code == 404
+
+
+def test_session_is_valid_only_in_its_hospital(client, two_hospitals):
+    response = client.post("/t/a/login", data={"username": "admin", "password": "admin123"}, follow_redirects=False)
+    assert response.status_code == 302
+    assert client.get("/t/a/api/dimensions").status_code == 200
+    assert client.get("/t/b/api/dimensions").status_code == 401
+
+
+def test_pages_under_a_prefix_stay_in_their_hospital(client, two_hospitals):
+    survey = client.get("/t/b/").text
+    assert 'const APP_ROOT = "/t/b";' in survey
+    assert 'href="/t/b/login"' in survey and 'href="/"' not in survey
+    assert "register(APP_ROOT + '/service-worker.js', {scope: APP_ROOT + '/'})" in survey
+
+    worker = client.get("/t/b/service-worker.js")
+    assert worker.headers["Service-Worker-Allowed"] == "/t/b/"
+    assert 'const APP_ROOT = "/t/b";' in worker.text
+    assert '"/t/b/api/questions"' in worker.text
+
+    assert 'action="/t/b/login"' in client.get("/t/b/login").text
+    response = client.post("/t/b/login", data={"username": "admin", "password": "admin123"}, follow_redirects=False)
+    assert response.headers["location"] == "/t/b/dashboard"
+    assert "fetch(APP_ROOT + '/api/dashboard-data')" in client.get("/t/b/dashboard").text
+    assert client.get("/t/b/logout", follow_redirects=False).headers["location"] == "/t/b/"
@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import main
+
+
+def test_same_idempotency_key_returns_the_original_survey(submit, db):
+    key = str(uuid.uuid4())
+    first = submit(headers={"Idempotency-Key": key})
+    assert first.status_code == 200
+    assert first.json()["replayed"] is False
+
+    score = db.query(main.Survey.satisfaction_score).scalar()
+    main.recent_client_keys._instances.clear()  # outro worker: só o índice único sabe da chave
+    again = submit(answers=[1] * len(submit.questions), headers={"Idempotency-Key": key})
+    assert again.json() == {**first.json(), "replayed": True}
+    assert db.query(main.Survey.satisfaction_score).all() == [(score,)]
+
+
+def test_batch_replays_keys_and_isolates_invalid_items(client, submit, db):
+    key = str(uuid.uuid4())
+    valid = {"admission_date": "2025-01-01", "discharge_date": "2025-01-02", "client_key": key}
+    invalid = {"admission_date": "2025-01-05", "discharge_date": "2025-01-02"}
+    response = client.post("/api/submit-surveys/batch", json={"surveys": [valid, invalid, valid]})
+
+    results = response.json()["results"]
+    assert [item["status"] for item in results] == ["success", "invalid", "success"]
+    assert results[0]["survey_id"] == results[2]["survey_id"]
+    assert [results[0]["replayed"], results[2]["replayed"]] == [False, True]
+    assert db.query(main.Survey).count() == 1
+
+
+def test_rejected_queue_panel_is_shown_only_to_staff(client, admin):
+    page = admin.get("/").text
+    assert 'id="rejected-panel"' in page
+    assert "validateRecord" in page and "REJECTED_STORE" in page
+    admin.get("/logout")
+    assert 'id="rejected-panel"' not in client.get("/").text
+
+
+def test_stale_questionnaire_version_is_rejected(submit, db):
+    response = submit(questionnaire_version="0" * 12)
+    assert response.status_code == 409
+    assert db.query(main.Survey).count() == 0
+
+
+def test_msgpack_body_is_accepted(client, submit):
+    msgpack = main.msgpack
+    body = {
+        "admission_date": "2025-01-01", "discharge_date": "2025-01-02",
+        "answers": [0] * len(submit.questions),
+        "questionnaire_version": client.get("/api/questions").headers["X-Questionnaire-Version"],
+    }
+    response = client.post("/api/surveys", content=msgpack.packb(body), headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
+
+
+def test_dedupe_removes_legacy_duplicates_inside_the_window(submit, db):
+    for _ in range(3):
+        assert submit(patient_name="Maria").status_code == 200
+    assert submit(patient_name="João").status_code == 200
+    ids = [survey_id for (survey_id,) in db.query(main.Survey.id).order_by(main.Survey.id)]
+    db.query(main.Survey).filter(main.Survey.id == ids[2]).update(
+        {"created_at": datetime.utcnow() + timedelta(hours=2)}
+    )
+    db.commit()
+
+    assert main.dedupe_legacy_surveys(db) == 1
+    remaining = [survey_id for (survey_id,) in db.query(main.Survey.id).order_by(main.Survey.id)]
+    assert remaining == [ids[0], ids[2], ids[3]]
+    assert db.query(main.SurveyResponse).filter(main.SurveyResponse.survey_id == ids[1]).count() == 0
+
+
+def long_answers(db):
+    return db.execute(text(
+        "SELECT survey_id, question_id, response_score FROM survey_answers_long ORDER BY survey_id, question_id"
+    )).all()
+
+
+def test_packed_answers_read_like_rows(client, submit, db, monkeypatch):
+    answers = [index % 3 for index in range(len(submit.questions))]
+    row_id = submit(answers=answers, observations="ótimo").json()["survey_id"]
+    monkeypatch.setattr(main, "ANSWER_STORAGE", "packed")
+    packed_id = submit(answers=answers, observations="ótimo").json()["survey_id"]
+
+    packed = db.get(main.Survey, packed_id)
+    assert packed.answers_packed and packed.questionnaire_version
+    assert db.query(main.SurveyResponse).filter(
+        main.SurveyResponse.survey_id == packed_id, main.SurveyResponse.option_id.isnot(None)
+    ).count() == 0
+    assert db.get(main.Survey, row_id).satisfaction_score == packed.satisfaction_score
+
+    by_survey = {}
+    for survey_id, question_id, score in long_answers(db):
+        by_survey.setdefault(survey_id, []).append((question_id, score))
+    assert by_survey[packed_id] == by_survey[row_id]
+
+    row_details = client.get(f"/api/surveys/{row_id}").json()
+    packed_details = client.get(f"/api/surveys/{packed_id}").json()
+    assert packed_details["sections"] == row_details["sections"]
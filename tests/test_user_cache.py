@@ -0,0 +1,65 @@
+from sqlalchemy import event
+
+import main
+
+
+def create_user(db, username, password="senha123", is_admin=False):
+    user = main.User(username=username, password_hash=main.hash_password(password), is_active=True, is_admin=is_admin)
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+def login(client, username, password="senha123"):
+    response = client.post("/login", data={"username": username, "password": password}, follow_redirects=False)
+    assert response.status_code == 302
+
+
+def test_authenticated_requests_use_the_cache(admin):
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(main.engine, "before_cursor_execute", listener)
+    try:
+        assert admin.get("/api/dimensions").status_code == 200
+        assert admin.get("/api/dimensions").status_code == 200
+    finally:
+        event.remove(main.engine, "before_cursor_execute", listener)
+    assert not [sql for sql in statements if "FROM users" in sql]
+
+
+def test_only_admins_deactivate_and_never_themselves(client, db):
+    nurse_id = create_user(db, "enfermeira")
+    admin_id = db.query(main.User.id).filter(main.User.username == "admin").scalar()
+    login(client, "enfermeira")
+    assert client.post(f"/api/users/{admin_id}/deactivate").status_code == 403
+
+    login(client, "admin", "admin123")
+    assert client.post(f"/api/users/{admin_id}/deactivate").status_code == 400
+    assert client.post("/api/users/9999/deactivate").status_code == 404
+    assert client.post(f"/api/users/{nurse_id}/deactivate").status_code == 200
+    db.expire_all()
+    assert db.get(main.User, nurse_id).is_active is False
+
+
+def test_deactivated_session_is_rejected(client, db):
+    nurse_id = create_user(db, "enfermeira")
+    login(client, "enfermeira")
+    assert client.get("/api/dimensions").status_code == 200
+    assert main.deactivate_user(db, nurse_id)
+    assert client.get("/api/dimensions").status_code == 401
+
+
+def test_deactivation_by_another_worker_reaches_this_cache(client, db):
+    nurse_id = create_user(db, "enfermeira")
+    login(client, "enfermeira")
+    assert client.get("/api/dimensions").status_code == 200
+
+    # Outro worker: altera o banco e a geração, sem tocar no cache deste processo
+    db.query(main.User).filter(main.User.id == nurse_id).update({"is_active": False})
+    main.bump_generation(db, "users")
+    db.commit()
+    cache = main.user_cache.of(main.engine)
+    assert cache.get(nurse_id) is not None
+
+    cache.check_interval = 0
+    assert client.get("/api/dimensions").status_code == 401